@@ -1,10 +1,170 @@
-from flask import Flask, request, jsonify
+import atexit
+import json
+import os
+import re
+import time
+from itertools import chain, islice
 
-from backend.models.SensorEvent import SensorEvent
-from backend.service.SensorEventService import SensorEventService
+from flask import Flask, request, jsonify, g, Response, stream_with_context
+
+from backend.models.SensorEvent import SensorEvent, DataType
+from backend.models.SensorEventProjection import SensorEventProjection
+from backend.service.BulkIngestPipeline import BulkIngestPipeline
+from backend.service.RecentKeyCache import EventInFlightError
+from backend.service.ServiceContainer import get_container
+from utils import json_codec, polygon_def, tracking
+from utils.continuation import encode_token, decode_token, is_start_key
+from utils.metrics import registry, http_request_duration
+from utils.pagination import key_attributes
+from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch
 
 app = Flask(__name__)
 
+REQUIRED_EVENT_KEYS = ['sensorId', 'metadata', 'data']
+MAX_BATCH_EVENTS = 1000
+# Opt-in write-behind mode: /data answers 202 and events are persisted asynchronously in batches
+WRITE_BEHIND = os.environ.get('SENSOR_EVENTS_WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('SENSOR_EVENTS_WRITE_BEHIND_QUEUE_SIZE', 10000))
+# Events that fail every write retry are appended here, an empty value keeps them in memory only
+WRITE_BEHIND_DEAD_LETTERS = os.environ.get('SENSOR_EVENTS_WRITE_BEHIND_DEAD_LETTERS',
+                                           'dead_letters/write_behind.ndjson') or None
+# Streaming upload: events per write batch, batches waiting for a writer and writer threads per request
+STREAM_BATCH_EVENTS = int(os.environ.get('SENSOR_EVENTS_STREAM_BATCH', 500))
+STREAM_PENDING_BATCHES = int(os.environ.get('SENSOR_EVENTS_STREAM_PENDING_BATCHES', 4))
+STREAM_WRITERS = int(os.environ.get('SENSOR_EVENTS_STREAM_WRITERS', 4))
+MAX_STREAM_LINE_BYTES = 64 * 1024
+# Read API: events per page (the `limit` argument) and events per streamed chunk of the field-wide reads
+DEFAULT_PAGE_EVENTS = int(os.environ.get('READ_API_DEFAULT_PAGE_EVENTS', 100))
+MAX_PAGE_EVENTS = int(os.environ.get('READ_API_MAX_PAGE_EVENTS', 10000))
+STREAM_CHUNK_EVENTS = 500
+# Opt-in: the DynamoDB usage of a request (calls, pages, items, RCU/WCU, latency per operation and index) is
+# returned in the X-DynamoDB-Usage header, streamed reads append it to the body as "usage"
+USAGE_IN_RESPONSES = os.environ.get('DYNAMODB_USAGE_IN_RESPONSES', '0') == '1'
+
+if WRITE_BEHIND:
+    get_container().sensor_event_service.enable_write_behind(max_queue_size=WRITE_BEHIND_QUEUE_SIZE,
+                                                             dead_letter_file=WRITE_BEHIND_DEAD_LETTERS)
+    # Drain on interpreter shutdown so accepted events are not lost
+    atexit.register(get_container().sensor_event_service.shutdown_write_behind)
+
+if polygon_def.incremental_aggregates:
+    # Registered after the write-behind drain, atexit runs it first so the drained events are flushed too
+    atexit.register(get_container().sensor_event_service.shutdown_incremental_aggregates)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Every DynamoDB call made while handling the request is accounted to it, see utils/tracking.py
+    g.dynamodb_usage, g.dynamodb_usage_token = tracking.start(f"{request.method} {request.path}")
+
+
+@app.after_request
+def record_request_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_request_duration.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method,
+                                      status=response.status_code)
+    usage = g.get('dynamodb_usage')
+    if USAGE_IN_RESPONSES and usage is not None and not response.is_streamed:
+        response.headers['X-DynamoDB-Usage'] = json_codec.dumps(usage.summary()).decode()
+    return response
+
+
+@app.teardown_request
+def finish_request_usage(error=None):
+    # Streamed responses are torn down once the body is written, so their usage covers the whole stream
+    usage = g.pop('dynamodb_usage', None)
+    if usage is not None:
+        tracking.finish(usage, g.pop('dynamodb_usage_token'))
+        if polygon_def.operation_summary_log and usage.summary()['calls']:
+            print(usage.log_line())
+
+
+def collect_ingest_metrics():
+    # Gauges and counters owned by the sensor event service, read on every scrape
+    service = get_container().sensor_event_service
+    families = []
+    if service.write_behind is not None:
+        stats = service.write_behind.stats()
+        families.append(('write_behind_queue_depth', 'gauge', 'Events waiting in the write-behind queue',
+                         [({}, stats['queue_depth'])]))
+        families.append(('write_behind_events_total', 'counter', 'Write-behind events per outcome',
+                         [({'outcome': outcome}, stats[outcome])
+                          for outcome in ('accepted', 'rejected', 'written', 'failed')]))
+        families.append(('write_behind_dead_letters', 'gauge', 'Events kept after failing all write retries',
+                         [({}, stats['dead_letters'])]))
+        families.append(('write_behind_dead_letters_evicted_total', 'counter',
+                         'Dead letters evicted from memory, they stay in the dead letter file when it is configured',
+                         [({}, stats['dead_letters_evicted'])]))
+    idempotency = service.idempotency_stats()
+    duplicates = [({'source': 'conditional_write'}, idempotency['conditional_duplicates'])]
+    if 'suppressed' in idempotency:
+        duplicates.append(({'source': 'cache'}, idempotency['suppressed']))
+        families.append(('ingest_dedup_cache_size', 'gauge', 'Event keys held by the duplicate suppression cache',
+                         [({}, idempotency['size'])]))
+        families.append(('ingest_in_flight_conflicts_total', 'counter',
+                         'Retried sensor events answered retryably because the first delivery was still being written',
+                         [({}, idempotency['in_flight_conflicts'])]))
+    families.append(('ingest_duplicates_suppressed_total', 'counter', 'Retried sensor events that were not rewritten',
+                     duplicates))
+    latest = service.latest_events_stats()
+    if 'hits' in latest:
+        families.append(('latest_events_cache_requests_total', 'counter', 'Latest-N event reads per cache outcome',
+                         [({'outcome': outcome}, latest[key])
+                          for outcome, key in (('hit', 'hits'), ('miss', 'misses'), ('bypass', 'bypassed'))]))
+        families.append(('latest_events_cache_sensors', 'gauge', 'Sensors held by the latest events cache',
+                         [({}, latest['sensors'])]))
+        families.append(('latest_events_cache_evictions_total', 'counter', 'Sensors evicted from the latest events cache',
+                         [({}, latest['evicted'])]))
+    planner = service.query_planner_stats()
+    if 'plans' in planner:
+        families.append(('event_query_plans_total', 'counter', 'Parcel event queries per chosen access path',
+                         [({'path': path}, count) for path, count in planner['chosen'].items()]))
+        families.append(('event_planner_stats_read_units_total', 'counter',
+                         'Read capacity spent on query planner statistics', [({}, planner['stats_rcu'])]))
+        families.append(('event_planner_skipped_candidates_total', 'counter',
+                         'Access paths not sampled because they were dominated or over the sampling budget',
+                         [({}, planner['skipped_candidates'])]))
+    aggregates = service.aggregate_cache_stats()
+    if 'hits' in aggregates:
+        families.append(('aggregate_cache_requests_total', 'counter', 'Aggregate lookups per cache outcome',
+                         [({'outcome': outcome}, aggregates[key])
+                          for outcome, key in (('hit', 'hits'), ('miss', 'misses'))]))
+        families.append(('aggregate_cache_entries', 'gauge', 'Aggregate results held by the cache',
+                         [({}, aggregates['size'])]))
+    incremental = service.incremental_aggregates_stats()
+    if 'recorded' in incremental:
+        families.append(('incremental_aggregate_events_total', 'counter',
+                         'Events folded into the incremental aggregate accumulators', [({}, incremental['recorded'])]))
+        families.append(('incremental_aggregate_pending', 'gauge', 'Accumulators waiting for the next flush',
+                         [({}, incremental['pending'])]))
+        families.append(('incremental_aggregate_failed_updates_total', 'counter',
+                         'Accumulator updates that failed and were retried with the next flush',
+                         [({}, incremental['failed_updates'])]))
+    return families
+
+
+registry.register_collector(collect_ingest_metrics)
+
+
+def parse_sensor_event(data):
+    if not isinstance(data, dict):
+        raise ValueError("Sensor event must be a JSON object")
+    missing_keys = [key for key in REQUIRED_EVENT_KEYS if key not in data]
+    if missing_keys:
+        raise ValueError(f"Missing keys in request data: {', '.join(missing_keys)}")
+    try:
+        return SensorEvent(
+            sensorId=data['sensorId'],
+            metadata=data['metadata'],
+            data=data['data']
+        )
+    except (TypeError, AttributeError, KeyError) as e:
+        raise ValueError(f"Malformed sensor event: {e}")
+
+
 # Sample endpoint for persisting sensor events
 # Please use the json format provided in maps/data/sample-sensor-event.json for testing
 @app.route('/data', methods=['POST'])
@@ -12,25 +172,316 @@ def receive_sensor_event():
     data = request.json
     if not data:
         return jsonify({"error": "Request must be JSON"}), 400
-    required_keys = ['sensorId', 'metadata', 'data']
-    missing_keys = [key for key in required_keys if key not in data]
-    if missing_keys:
-        return jsonify({"error": f"Missing keys in request data: {', '.join(missing_keys)}"}), 400
 
     try:
-        sensor_event = SensorEvent(
-            sensorId=data['sensorId'],
-            metadata=data['metadata'],
-            data=data['data']
-        )
+        sensor_event = parse_sensor_event(data)
 
-        service = SensorEventService()
-        service.add_sensor_event(sensor_event)
+        service = get_container().sensor_event_service
+        if service.write_behind is not None:
+            if not service.enqueue_sensor_event(sensor_event):
+                return jsonify({"error": "Ingest queue is full, retry later"}), 429, {"Retry-After": "1"}
+            return jsonify({"message": "Sensor event accepted", "sensor_event": sensor_event.to_json()}), 202
+        if service.add_sensor_event(sensor_event) is None:
+            return jsonify({"error": "Sensor event could not be written, retry later"}), 503, {"Retry-After": "1"}
         return jsonify({"message": "Sensor event received successfully", "sensor_event": sensor_event.to_json()}), 200
+    except EventInFlightError as e:
+        # A retry of a delivery that is still being written: acknowledging it would hide a failure of the first
+        return jsonify({"error": f"{e}, retry later"}), 409, {"Retry-After": "1"}
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": "Internal server error", "message": f"{str(e)}"}), 500
 
+
+# Batch endpoint, expects a JSON array of events in the maps/data/sample-sensor-event.json format
+# Every event is validated and reported on separately, invalid events do not reject the batch
+@app.route('/data/batch', methods=['POST'])
+def receive_sensor_events_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Request must be a non-empty JSON array of sensor events"}), 400
+    if len(data) > MAX_BATCH_EVENTS:
+        return jsonify({"error": f"Batch exceeds the maximum of {MAX_BATCH_EVENTS} sensor events"}), 413
+
+    report = [None] * len(data)
+    valid_events = []
+    valid_indices = []
+    for index, event_data in enumerate(data):
+        try:
+            valid_events.append(parse_sensor_event(event_data))
+            valid_indices.append(index)
+        except ValueError as e:
+            report[index] = {"index": index, "status": "rejected", "error": str(e)}
+
+    try:
+        service = get_container().sensor_event_service
+        results = service.add_sensor_events(valid_events) if valid_events else []
+    except Exception as e:
+        return jsonify({"error": "Internal server error", "message": f"{str(e)}"}), 500
+    for index, result in zip(valid_indices, results):
+        report[index] = {"index": index, **result}
+
+    summary = {status: sum(1 for item in report if item['status'] == status)
+               for status in ('written', 'rejected', 'duplicate', 'in_flight', 'failed')}
+    status_code = 200 if summary['written'] == len(report) else 207
+    return jsonify({"summary": summary, "results": report}), status_code
+
+
+def read_ndjson_lines(stream):
+    # Yields (line number, bytes) one line at a time, over-long lines are yielded as None
+    line_number = 0
+    while True:
+        line = stream.readline(MAX_STREAM_LINE_BYTES + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > MAX_STREAM_LINE_BYTES and not line.endswith(b'\n'):
+            # Skip the rest of the over-long line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_STREAM_LINE_BYTES)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+
+# Streaming bulk upload for gateway backlogs: newline-delimited JSON, one sensor event per line.
+# The body is read incrementally and written through a bounded pipeline, so memory stays flat for any size
+@app.route('/data/stream', methods=['POST'])
+def receive_sensor_event_stream():
+    service = get_container().sensor_event_service
+    try:
+        with BulkIngestPipeline(service.add_sensor_events, batch_size=STREAM_BATCH_EVENTS,
+                                max_pending_batches=STREAM_PENDING_BATCHES, writers=STREAM_WRITERS) as pipeline:
+            for line_number, line in read_ndjson_lines(request.stream):
+                if line is None:
+                    pipeline.reject(line_number, f"Line exceeds {MAX_STREAM_LINE_BYTES} bytes")
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    pipeline.add(line_number, parse_sensor_event(json.loads(line)))
+                except ValueError as e:
+                    # json.JSONDecodeError is a ValueError as well
+                    pipeline.reject(line_number, str(e))
+    except Exception as e:
+        return jsonify({"error": "Internal server error", "message": f"{str(e)}"}), 500
+    summary = pipeline.summary
+    if summary['lines'] == 0:
+        return jsonify({"error": "Request body must contain newline-delimited JSON sensor events"}), 400
+    status_code = 200 if summary['rejected'] == 0 and summary['failed'] == 0 and summary['in_flight'] == 0 else 207
+    return jsonify({"summary": summary, "errors": pipeline.errors}), status_code
+
+
+def split_list_arg(name):
+    value = request.args.get(name)
+    return [part for part in value.split(',') if part] if value else None
+
+
+def read_page_args(is_valid_token):
+    """
+    Arguments shared by the event read endpoints: from, to, limit, fields, the token's resume state and the
+    token scope; ValueError if invalid. is_valid_token checks that the resume state has the shape the endpoint
+    resumes from. The scope binds tokens to the path and the from, to, types and fields they were issued for,
+    only limit may change from page to page.
+    """
+    from_date, to_date = request.args.get('from'), request.args.get('to')
+    if not from_date or not to_date:
+        raise ValueError("Query parameters 'from' and 'to' are required (%Y-%m-%dT%H:%M:%S)")
+    start_range_unix = convert_to_unix_epoch(from_date)
+    end_range_unix = convert_to_unix_epoch(to_date)
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_EVENTS))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_EVENTS:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_EVENTS}")
+    fields = SensorEventProjection.validate_fields(split_list_arg('fields'))
+    scope = json_codec.dumps([request.path, start_range_unix, end_range_unix,
+                              sorted(set(split_list_arg('types') or ())), sorted(fields or ())]).decode()
+    return from_date, to_date, limit, fields, decode_token(request.args.get('token'), scope, is_valid_token), scope
+
+
+def stream_event_page(pages, decode, next_token):
+    """
+    Streams {"items": [...], "next_token": ...} while the pages of wire items are read, one chunk per page,
+    so a page is never held in memory as a whole. next_token() is called once all items are written.
+    The first page is read before the response starts, so a query that fails right away gets an error status.
+    A failure after the response started ends the body with "error" instead of "next_token".
+    With DYNAMODB_USAGE_IN_RESPONSES=1 the request's DynamoDB usage follows as "usage".
+    """
+    pages = iter(pages)
+    try:
+        first_page = next(pages, None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Read stream failed: {e}")
+        return jsonify({"error": "Internal server error", "message": f"{str(e)}"}), 500
+    if first_page is None:
+        pages = iter(())
+    else:
+        pages = chain([first_page], pages)
+
+    def generate():
+        yield b'{"items":['
+        first = True
+        try:
+            for items in pages:
+                if not items:
+                    continue
+                chunk = b','.join(json_codec.dumps(decode(item).to_json()) for item in items)
+                yield chunk if first else b',' + chunk
+                first = False
+            tail = b'],"next_token":' + json_codec.dumps(next_token())
+        except Exception as e:
+            print(f"Read stream failed: {e}")
+            tail = b'],"error":' + json_codec.dumps(str(e))
+        usage = tracking.current()
+        if USAGE_IN_RESPONSES and usage is not None:
+            tail += b',"usage":' + json_codec.dumps(usage.summary())
+        yield tail + b'}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+# Events of one sensor in a time range, oldest first
+@app.route('/sensors/<sensor_id>/events', methods=['GET'])
+def read_sensor_events(sensor_id):
+    try:
+        from_date, to_date, limit, fields, start_key, scope = read_page_args(
+            lambda state: is_start_key(state, key_attributes('GSI_Events_By_Sensor')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    service = get_container().sensor_event_service
+    paginator = service.iter_sensorevents_by_sensorid_in_time_range(sensor_id, from_date, to_date, max_items=limit,
+                                                                     page_size=limit, start_key=start_key,
+                                                                     fields=fields, decode=False)
+    return stream_event_page(paginator.pages(), service.event_decoder(fields),
+                             lambda: encode_token(paginator.last_evaluated_key, scope))
+
+
+# Events recorded in a parcel in a time range, optionally only of the comma-separated `types`
+@app.route('/parcels/<parcel_id>/events', methods=['GET'])
+def read_parcel_events(parcel_id):
+    service = get_container().sensor_event_service
+    try:
+        sensor_types = split_list_arg('types')
+        if sensor_types:
+            DataType.validate_data_types(sensor_types)
+        index = 'GSI_Events_By_Parcel_Type' if service.uses_parcel_type_index(sensor_types) \
+            else 'GSI_AllSensorEvents_Parcel'
+        from_date, to_date, limit, fields, start_key, scope = read_page_args(
+            lambda state: is_start_key(state, key_attributes(index)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    paginator = service.iter_sensor_events_by_parcelid_in_time_range(parcel_id, from_date, to_date, sensor_types,
+                                                                     max_items=limit, page_size=limit,
+                                                                     start_key=start_key, fields=fields,
+                                                                     decode=False)
+    return stream_event_page(paginator.pages(), service.event_decoder(fields),
+                             lambda: encode_token(paginator.last_evaluated_key, scope))
+
+
+def take_pages(items, limit, state):
+    # Chunks the first `limit` items; state receives the last SK handed out and whether more items follow
+    try:
+        while not state['more']:
+            chunk = list(islice(items, min(STREAM_CHUNK_EVENTS, limit + 1 - state['count'])))
+            if not chunk:
+                return
+            if state['count'] + len(chunk) > limit:
+                chunk = chunk[:limit - state['count']]
+                state['more'] = True
+            if chunk:
+                state['count'] += len(chunk)
+                state['last_sk'] = chunk[-1]['SK']['S']
+                yield chunk
+    finally:
+        items.close()
+
+
+def is_field_resume_state(state):
+    # {'start_after': SK of the last event handed out}, Event#<epoch>#<sensorId>
+    start_after = state.get('start_after')
+    return set(state) == {'start_after'} and isinstance(start_after, str) \
+        and re.fullmatch(r'Event#\d+#.+', start_after) is not None
+
+
+# Events of one data type across the whole field in a time range, in time order
+@app.route('/events/<data_type>', methods=['GET'])
+def read_field_events(data_type):
+    try:
+        from_date, to_date, limit, fields, resume, scope = read_page_args(is_field_resume_state)
+        DataType.validate_data_types([data_type])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    service = get_container().sensor_event_service
+    # One event more than the page tells whether another page follows
+    items = service.iter_sensor_events_for_field_in_time_range_by_type(
+        from_date, to_date, data_type, max_items=limit + 1, start_after=resume['start_after'] if resume else None,
+        fields=fields, decode=False)
+    state = {'count': 0, 'last_sk': None, 'more': False}
+    return stream_event_page(take_pages(items, limit, state), service.event_decoder(fields),
+                             lambda: encode_token({'start_after': state['last_sk']} if state['more'] else None,
+                                                  scope))
+
+
+# Daily (date=%Y-%m-%d) or monthly (month & year) aggregates of the comma-separated `types`
+@app.route('/aggregates', methods=['GET'])
+def read_aggregates():
+    service = get_container().sensor_event_service
+    data_types = split_list_arg('types')
+    date = request.args.get('date')
+    try:
+        month_year = (int(request.args['month']), int(request.args['year'])) \
+            if 'month' in request.args or 'year' in request.args else None
+        service.resolve_aggregate_period(data_types, date, month_year)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid aggregate period: {e}"}), 400
+    aggregates = service.query_aggregates(data_types, date, month_year)
+    return Response(json_codec.dumps({data_type: [aggregate.to_json() for aggregate in items]
+                                      for data_type, items in aggregates.items()}),
+                    mimetype='application/json')
+
+
+@app.route('/data/buffer', methods=['GET'])
+def write_behind_stats():
+    service = get_container().sensor_event_service
+    if service.write_behind is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **service.write_behind.stats()}), 200
+
+
+@app.route('/data/buffer/dead-letters', methods=['GET'])
+def write_behind_dead_letters():
+    service = get_container().sensor_event_service
+    if service.write_behind is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, "dead_letters": list(service.write_behind.dead_letters)}), 200
+
+
+# Writes the dead letters again, the ones that still fail are kept
+@app.route('/data/buffer/dead-letters/retry', methods=['POST'])
+def retry_write_behind_dead_letters():
+    service = get_container().sensor_event_service
+    if service.write_behind is None:
+        return jsonify({"error": "Write-behind mode is not enabled"}), 409
+    try:
+        return jsonify(service.write_behind.retry_dead_letters()), 200
+    except Exception as e:
+        return jsonify({"error": "Internal server error", "message": f"{str(e)}"}), 500
+
+
+# Counters of retried deliveries dropped by the recently-accepted key cache or the conditional write backstop
+@app.route('/data/idempotency', methods=['GET'])
+def idempotency_stats():
+    return jsonify(get_container().sensor_event_service.idempotency_stats()), 200
+
+
+# Prometheus text exposition of DynamoDB, HTTP and ingest metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
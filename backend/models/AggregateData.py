@@ -8,6 +8,9 @@ class ParcelAggregate:
         self.max = float(parcel_data['max']['N'])
         self.mean = float(parcel_data['mean']['N'])
 
+    def to_json(self):
+        return {'min': self.min, 'median': self.median, 'max': self.max, 'mean': self.mean}
+
     def __repr__(self):
         return f"ParcelAggregate(min={self.min}, median={self.median}, max={self.max}, mean={self.mean})"
 
@@ -22,6 +25,11 @@ class AggregateData:
         self.parcel_agg = {parcel_id: ParcelAggregate(agg['M'])
                            for parcel_id, agg in item['parcel_agg']['M'].items()}
 
+    def to_json(self):
+        return {'pk': self.pk, 'sk': self.sk, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'median': self.median,
+                'parcel_agg': {parcel_id: agg.to_json() for parcel_id, agg in self.parcel_agg.items()}}
+
     def __repr__(self):
         parcel_agg_repr = ", ".join(f"{k}: {v}" for k, v in self.parcel_agg.items())
         return (f"AggregateData(pk={self.pk}, sk={self.sk}, mean={self.mean}, "
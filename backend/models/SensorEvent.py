@@ -1,12 +1,11 @@
 import json
+import math
 from enum import Enum
 from datetime import datetime
 from typing import List
 
-from dateutil import parser
-
-
-# from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch, get_first_of_month_as_unix_timestamp
+from utils.sensor_events import time_utils
+from utils.sensor_events.sharding import event_partition_key, parcel_type_key
 
 
 # Enums
@@ -33,25 +32,36 @@ class DataType(Enum):
                 raise ValueError(f"Invalid data type: {data_type_str}")
 
 
+def _number(name, value):
+    # DynamoDB rejects a whole BatchWriteItem chunk for one value that is not a finite number
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number, got {value!r}")
+    return value
+
+
+def _text(name, value):
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{name} must be a non-empty string, got {value!r}")
+    return value
+
+
 # Sensor Event
 
 class SensorEvent:
 
     def to_entity(self):
-        from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch, \
-            get_first_of_month_as_unix_timestamp
         lat, lon = self.metadata.location
         geoJson = "{},{}".format(lat, lon)
-        timestamp_str = self.data.timestamp
-        sk_formatted = f"Event#{convert_to_unix_epoch(timestamp_str)}#{self.sensorId}"
-        start_of_month = get_first_of_month_as_unix_timestamp(self.data.timestamp)
+        sk_formatted = f"Event#{self.data.epoch}#{self.sensorId}"
+        start_of_month = time_utils.month_start_of_epoch(self.data.epoch)
         return {
-            'PK': {'S': f"{self.data.dataType}#{str(start_of_month)}"},
+            'PK': {'S': event_partition_key(self.data.dataType, start_of_month, self.sensorId)},
             'SK': {'S': sk_formatted},
             's_id': {'S': f"Event#{self.sensorId}"},
             'data_point': {'N': str(self.data.dataPoint)},
             'geoJson': {'S': geoJson},
             'parcel_id': {'S': self.metadata.parcel_id},
+            'parcel_type': {'S': parcel_type_key(self.metadata.parcel_id, self.data.dataType)},
             'battery_level': {'N': str(self.metadata.batteryLevel)},
             'data_type': {'S': self.data.dataType}
         }
@@ -65,17 +75,22 @@ class SensorEvent:
 
         def __init__(self, location, parcel_id, battery_level):
             self.location = self.__convert_location_to_tuple(location)  # Expected to be a tuple (longitude, latitude)
-            self.batteryLevel = battery_level
-            self.parcel_id = parcel_id
+            self.batteryLevel = _number('battery_level', battery_level)
+            self.parcel_id = _text('parcel_id', parcel_id)
 
     class Data:
-        def __init__(self, dataType, dataPoint, timestamp):
+        def __init__(self, dataType, dataPoint, timestamp=None, epoch=None):
             self.dataType = DataType(dataType).value
-            self.dataPoint = dataPoint
-            self.timestamp = parser.parse(timestamp).strftime("%Y-%m-%dT%H:%M:%S")
+            self.dataPoint = _number('dataPoint', dataPoint)
+            # The timestamp is parsed once, the epoch is reused for keys and partitions
+            if epoch is not None:
+                self.epoch = int(epoch)
+                self.timestamp = time_utils.epoch_to_iso(self.epoch)
+            else:
+                self.epoch, self.timestamp = time_utils.normalize_timestamp(timestamp)
 
     def __init__(self, sensorId, metadata, data):
-        self.sensorId = sensorId
+        self.sensorId = _text('sensorId', sensorId)
         self.metadata = self.Metadata(**metadata)
         self.data = self.Data(**data)
 
@@ -130,12 +145,10 @@ class SensorEvent:
         }
         data_type = entity["data_type"]["S"]
         data_point = float(entity["data_point"]["N"])
-        from utils.sensor_events.sensor_events_generation import unix_to_iso
-        timestamp = unix_to_iso(int(entity["SK"]["S"].split("#")[1]))
         data = {
             "dataType": data_type,
             "dataPoint": data_point,
-            "timestamp": timestamp
+            "epoch": int(entity["SK"]["S"].split("#")[1])
         }
         sensor_event = cls(sensor_id, metadata, data)
         sensor_event.PK = pk
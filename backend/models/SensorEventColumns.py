@@ -0,0 +1,130 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+EVENT_PREFIX_LENGTH = len("Event#")
+
+
+def _encode_categorical(values):
+    # Dictionary-encodes strings: int32 codes into an array of distinct values, in order of first appearance
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32)
+    return codes, np.array(list(index), dtype=object)
+
+
+def _remap(codes, mapping):
+    # Translates codes through mapping, missing codes (-1) stay missing
+    remapped = np.full(len(codes), -1, dtype=np.int32)
+    present = codes >= 0
+    remapped[present] = mapping[codes[present]]
+    return remapped
+
+
+def _missing_categorical(count):
+    # Column that was not read: all codes -1 (missing), no categories
+    return np.full(count, -1, dtype=np.int32), np.empty(0, dtype=object)
+
+
+class SensorEventColumns:
+    """
+    Column-oriented result of an event query, decoded straight from the DynamoDB wire items.
+    epoch int64, data_point float64, battery_level float32; PK, sensor_id, parcel_id and data_type
+    are dictionary-encoded (codes + categories) like pandas categoricals.
+    Items of a projected query fill the attributes they lack with NaN / missing codes.
+    """
+
+    CATEGORICAL_COLUMNS = ('PK', 'sensor_id', 'parcel_id', 'data_type')
+
+    def __init__(self, epoch: np.ndarray, data_point: np.ndarray, battery_level: np.ndarray,
+                 categoricals: Dict[str, tuple]):
+        self.epoch = epoch
+        self.data_point = data_point
+        self.battery_level = battery_level
+        self.categoricals = categoricals
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32),
+                   {name: (np.empty(0, dtype=np.int32), np.empty(0, dtype=object))
+                    for name in cls.CATEGORICAL_COLUMNS})
+
+    @classmethod
+    def from_entities(cls, items: List[Dict], fields: Optional[Iterable[str]] = None):
+        # fields: the attributes the query projected, None when all were read
+        count = len(items)
+        read = (lambda name: True) if fields is None else set(fields).__contains__
+        epoch = np.fromiter((item['SK']['S'].split('#', 2)[1] for item in items), dtype=np.int64, count=count)
+        if read('data_point'):
+            data_point = np.fromiter((item['data_point']['N'] for item in items), dtype=np.float64, count=count)
+        else:
+            data_point = np.full(count, np.nan, dtype=np.float64)
+        if read('battery_level'):
+            battery_level = np.fromiter((item['battery_level']['N'] for item in items), dtype=np.float32,
+                                        count=count)
+        else:
+            battery_level = np.full(count, np.nan, dtype=np.float32)
+        categoricals = {
+            'PK': _encode_categorical(item['PK']['S'] for item in items),
+            'sensor_id': (_encode_categorical(item['s_id']['S'][EVENT_PREFIX_LENGTH:] for item in items)
+                          if read('s_id') else
+                          _encode_categorical(item['SK']['S'].split('#', 2)[2] for item in items)),
+            'parcel_id': (_encode_categorical(item['parcel_id']['S'] for item in items)
+                          if read('parcel_id') else _missing_categorical(count)),
+            'data_type': (_encode_categorical(item['data_type']['S'] for item in items)
+                          if read('data_type') else
+                          _encode_categorical(item['PK']['S'].split('#', 1)[0] for item in items))
+        }
+        return cls(epoch, data_point, battery_level, categoricals)
+
+    @classmethod
+    def concat(cls, parts: List['SensorEventColumns']):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        categoricals = {}
+        for name in cls.CATEGORICAL_COLUMNS:
+            # Remap each part's codes onto the union of categories
+            index = {}
+            codes = []
+            for part in parts:
+                part_codes, part_categories = part.categoricals[name]
+                mapping = np.fromiter((index.setdefault(value, len(index)) for value in part_categories),
+                                      dtype=np.int32, count=len(part_categories))
+                codes.append(_remap(part_codes, mapping))
+            categoricals[name] = (np.concatenate(codes), np.array(list(index), dtype=object))
+        return cls(np.concatenate([part.epoch for part in parts]),
+                   np.concatenate([part.data_point for part in parts]),
+                   np.concatenate([part.battery_level for part in parts]),
+                   categoricals)
+
+    def map_categories(self, name, func):
+        # Applies func once per distinct value of a categorical column, values mapped together are merged
+        codes, categories = self.categoricals[name]
+        mapping, mapped_categories = _encode_categorical(func(value) for value in categories)
+        categoricals = dict(self.categoricals)
+        categoricals[name] = (_remap(codes, mapping), mapped_categories)
+        return SensorEventColumns(self.epoch, self.data_point, self.battery_level, categoricals)
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def column(self, name) -> np.ndarray:
+        # Materializes a categorical column as an object array of strings, None where it was not read
+        codes, categories = self.categoricals[name]
+        return np.append(categories, None)[codes]
+
+    def as_frame(self):
+        import pandas as pd
+        frame = {'epoch': self.epoch, 'data_point': self.data_point, 'battery_level': self.battery_level}
+        for name in self.CATEGORICAL_COLUMNS:
+            codes, categories = self.categoricals[name]
+            frame[name] = pd.Categorical.from_codes(codes, categories=categories)
+        return pd.DataFrame(frame, columns=['PK', 'epoch', 'sensor_id', 'parcel_id', 'data_type',
+                                            'data_point', 'battery_level'])
+
+    def __repr__(self):
+        return (f"SensorEventColumns(rows={len(self)}, "
+                f"sensors={len(self.categoricals['sensor_id'][1])}, "
+                f"parcels={len(self.categoricals['parcel_id'][1])})")
@@ -0,0 +1,59 @@
+from typing import Iterable, Optional
+
+
+class SensorEventProjection:
+    """
+    Lightweight event decoded from a projected query: only the requested attributes are decoded,
+    the others stay None. PK, sensor_id, epoch and data_type come from the keys and are always set.
+    """
+
+    # Non-key attributes of an event item that can be requested
+    FIELDS = ('data_point', 'parcel_id', 'battery_level', 'geoJson', 'data_type', 's_id')
+
+    __slots__ = ('PK', 'sensor_id', 'epoch', 'data_type', 'data_point', 'parcel_id', 'battery_level', 'location')
+
+    def __init__(self, PK, sensor_id, epoch, data_type, data_point=None, parcel_id=None, battery_level=None,
+                 location=None):
+        self.PK = PK
+        self.sensor_id = sensor_id
+        self.epoch = epoch
+        self.data_type = data_type
+        self.data_point = data_point
+        self.parcel_id = parcel_id
+        self.battery_level = battery_level
+        self.location = location
+
+    @classmethod
+    def validate_fields(cls, fields: Optional[Iterable[str]]):
+        if fields is None:
+            return None
+        fields = tuple(fields)
+        for field in fields:
+            if field not in cls.FIELDS:
+                raise ValueError(f"Invalid event field: {field}")
+        return fields
+
+    @classmethod
+    def from_entity(cls, entity):
+        pk = entity['PK']['S']
+        _, epoch, sensor_id = entity['SK']['S'].split('#', 2)
+        data_type = entity['data_type']['S'] if 'data_type' in entity else pk.split('#', 1)[0]
+        data_point = entity.get('data_point')
+        parcel_id = entity.get('parcel_id')
+        battery_level = entity.get('battery_level')
+        location = entity.get('geoJson')
+        if location is not None:
+            lat, lon = location['S'].strip("()").split(",")
+            location = (float(lat), float(lon))
+        return cls(pk, sensor_id, int(epoch), data_type,
+                   float(data_point['N']) if data_point is not None else None,
+                   parcel_id['S'] if parcel_id is not None else None,
+                   float(battery_level['N']) if battery_level is not None else None,
+                   location)
+
+    def to_json(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.to_json().items())
+        return f"SensorEventProjection({fields})"
@@ -14,7 +14,9 @@ class SensorLocationHistory:
         self.geohash = response_item['SK']['S'].split('#')[1]
         self.parcel_id = response_item.get('id_parcel', {}).get('S')
         if 'moved_at' in response_item.keys():
-            self.moved_at = unix_to_iso(int(response_item['moved_at']['N']))
+            # Parcel retirements used to store moved_at as a string
+            moved_at = response_item['moved_at']
+            self.moved_at = unix_to_iso(int(moved_at.get('N') or moved_at['S']))
         else:
             self.moved_at = None
         lat, lon = map(float, self.geo_json.split(','))
@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class AggregateCache:
+    """
+    LRU cache of aggregate query results keyed by (data_type, prefix, period), bounded to `max_entries`.
+    Aggregates of a closed period do not change once WorkerService has written them, those entries never expire.
+    Entries of the current period, and empty results that the worker may still fill, expire after `ttl_s`.
+    WorkerService invalidates a period whenever it rewrites it.
+    """
+
+    def __init__(self, max_entries=10000, ttl_s=60.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, results of queries that started before it are not stored
+        self.generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'invalidated': 0}
+
+    def get(self, key: Hashable) -> Optional[list]:
+        # The cached items, None on a miss (an empty list is a cached "no aggregates")
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                items, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return items
+                del self._entries[key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key: Hashable, items: list, closed: bool, generation: int = None):
+        expires_at = None if closed and items else time.monotonic() + self.ttl_s
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (items, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evicted'] += 1
+
+    def invalidate_period(self, prefix: str, period: int):
+        # Drops the entries of every data type for the period
+        with self._lock:
+            self.generation += 1
+            keys = [key for key in self._entries if key[1:] == (prefix, period)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidated'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'size': len(self._entries), 'capacity': self.max_entries, 'ttl_s': self.ttl_s}
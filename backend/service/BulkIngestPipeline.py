@@ -0,0 +1,79 @@
+import queue
+import threading
+from typing import Callable, List, Dict, Tuple
+
+from backend.models.SensorEvent import SensorEvent
+
+
+class BulkIngestPipeline:
+    """
+    Bounded producer/consumer pipeline for bulk uploads: the request thread parses lines into batches,
+    `writers` threads persist them with `write_events` (SensorEventService.add_sensor_events).
+    `submit` blocks while `max_pending_batches` batches are waiting, so at most
+    (max_pending_batches + writers) * batch_size events are held in memory regardless of upload size.
+    """
+    _STOP = object()
+
+    def __init__(self, write_events: Callable[[List[SensorEvent]], List[Dict]], batch_size=500,
+                 max_pending_batches=4, writers=4, max_reported_errors=100):
+        self.write_events = write_events
+        self.batch_size = batch_size
+        self.max_reported_errors = max_reported_errors
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._batch: List[Tuple[int, SensorEvent]] = []
+        self._lock = threading.Lock()
+        self.summary = {'lines': 0, 'written': 0, 'rejected': 0, 'duplicate': 0, 'in_flight': 0, 'failed': 0}
+        self.errors = []
+        self._writers = [threading.Thread(target=self._run, name=f"bulk-ingest-{i}", daemon=True)
+                         for i in range(writers)]
+        for writer in self._writers:
+            writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, line_number: int, sensor_event: SensorEvent):
+        with self._lock:
+            self.summary['lines'] += 1
+        self._batch.append((line_number, sensor_event))
+        if len(self._batch) >= self.batch_size:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def reject(self, line_number: int, error: str):
+        with self._lock:
+            self.summary['lines'] += 1
+            self._record('rejected', line_number, error)
+
+    def _record(self, status, line_number, error=None):
+        # Caller holds the lock
+        self.summary[status] += 1
+        if error and len(self.errors) < self.max_reported_errors:
+            self.errors.append({'line': line_number, 'status': status, 'error': error})
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is self._STOP:
+                return
+            try:
+                results = self.write_events([sensor_event for _, sensor_event in batch])
+            except Exception as e:
+                results = [{'status': 'failed', 'error': str(e)}] * len(batch)
+            with self._lock:
+                for (line_number, _), result in zip(batch, results):
+                    self._record(result['status'], line_number, result.get('error'))
+
+    def close(self):
+        # Flushes the partial batch and waits until every submitted batch is written
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        for _ in self._writers:
+            self._queue.put(self._STOP)
+        for writer in self._writers:
+            writer.join()
+        return self.summary
@@ -0,0 +1,332 @@
+import math
+import threading
+import time
+from collections import OrderedDict, Counter
+from typing import Dict, List, Optional
+
+from playground import calculate_pks
+from utils.fan_out import bounded_map
+from utils.metrics import registry
+from utils.pagination import QueryPaginator
+from utils.projection import with_projection
+from utils.sensor_events import time_utils
+from utils.sensor_events.sensor_events_generation import get_first_of_month_as_unix_timestamp
+from utils.sensor_events.sharding import event_partition_keys
+from utils.tracking import track
+
+# Read cost model: eventually consistent reads cost 0.5 RCU per started 4 KB of items read, per query page
+EVENT_ITEM_BYTES = 250
+RCU_BYTES = 4096
+RCU_PER_READ = 0.5
+
+# Access paths for "events of types T in parcel P during range R"
+PARCEL_TYPE = 'parcel_type'  # GSI_Events_By_Parcel_Type, one query per type, reads only the matching events
+PARCEL = 'parcel'  # GSI_AllSensorEvents_Parcel, reads the parcel's events of all types and filters the types
+FIELD = 'field'  # {type}#{month}[#shard] base partitions, reads the whole field's events and filters the parcel
+SENSOR = 'sensor'  # GSI_Events_By_Sensor, one query per sensor of the types currently placed in the parcel
+
+planning_duration = registry.histogram(
+    'event_query_planning_duration_seconds', 'Time spent choosing the access path of parcel event queries, per path')
+
+
+def read_units(items: float, queries: int) -> float:
+    # Every query costs at least one read, items are read in 4 KB units
+    return max(queries, math.ceil(items * EVENT_ITEM_BYTES / RCU_BYTES)) * RCU_PER_READ
+
+
+class QueryPlan:
+    __slots__ = ('path', 'estimated_items', 'estimated_rcu', 'queries', 'sensor_ids', 'candidates',
+                 'sampling_queries', 'sampling_rcu')
+
+    def __init__(self, path, estimated_items=None, estimated_rcu=None, queries=1, sensor_ids=None,
+                 candidates=None):
+        self.path = path
+        self.estimated_items = estimated_items
+        self.estimated_rcu = estimated_rcu
+        self.queries = queries
+        self.sensor_ids = sensor_ids
+        # Estimated RCU per path, None for a path that was skipped
+        self.candidates = candidates or {}
+        # Statistics queries issued to make this plan and the read capacity they consumed
+        self.sampling_queries = 0
+        self.sampling_rcu = 0.0
+
+    def __repr__(self):
+        if self.estimated_rcu is None:
+            return f"QueryPlan(path={self.path}, queries={self.queries})"
+        return (f"QueryPlan(path={self.path}, estimated_items={self.estimated_items:.0f}, "
+                f"estimated_rcu={self.estimated_rcu:.1f}, queries={self.queries}, "
+                f"sampling_rcu={self.sampling_rcu:.1f})")
+
+
+class SamplingBudget:
+    """Statistics queries one plan may still issue, and the queries and read capacity it spent."""
+
+    def __init__(self, max_queries):
+        self.remaining = max_queries
+        self.queries = 0
+        self.rcu = 0.0
+        self._lock = threading.Lock()
+
+    def spend(self, capacity_units):
+        with self._lock:
+            self.queries += 1
+            self.rcu += capacity_units
+
+
+class EventQueryPlanner:
+    """
+    Picks the cheapest access path for parcel event queries from estimated items read and RCU.
+    Queries over all types use the parcel index without statistics, it reads exactly the matching events with
+    a single query. Type-filtered queries estimate the parcel/type index (when enabled), the parcel index,
+    the field partitions and, when the caller only needs the sensors currently placed in the parcel,
+    the per-sensor index.
+
+    Statistics are event counts of one partition in sample windows of `sample_s` seconds, aligned to multiples
+    of `sample_s` so that overlapping ranges share them. A range is estimated from up to `samples` windows
+    spread evenly over it, their COUNT queries run concurrently. Counts per window and sensor lists per
+    parcel are cached for `stats_ttl_s`, at most `max_stats` entries.
+
+    Sampling is paid for by the query being planned: one plan issues at most `max_sample_queries` uncached
+    windows, spent on the candidates from the cheapest to sample to the most expensive. A candidate whose windows
+    do not fit is skipped, and the field partitions are not sampled when their lower bound (one read per partition
+    query, at least the events of the other paths) already loses. The plan carries the queries and RCU it spent,
+    and the planning is a nested unit of work of the request's DynamoDB usage (utils/tracking.py).
+    """
+
+    def __init__(self, service, sample_s=3600, stats_ttl_s=3600.0, max_stats=10000, samples=3,
+                 max_sample_queries=24):
+        self.service = service
+        self.dynamodb = service.dynamodb
+        self.sample_s = max(1, sample_s)
+        self.samples = max(1, samples)
+        # The parcel index is sampled first, it always fits
+        self.max_sample_queries = max(self.samples, max_sample_queries)
+        self.stats_ttl_s = stats_ttl_s
+        self.max_stats = max_stats
+        self._stats_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'plans': 0, 'stats_queries': 0, 'stats_rcu': 0.0, 'skipped_candidates': 0}
+        self._chosen = Counter()
+        self._last_plan = None
+
+    def plan_parcel_events(self, parcel_id, start_range_unix, end_range_unix, data_types: Optional[List[str]],
+                           current_sensors_only=False) -> QueryPlan:
+        start = time.perf_counter()
+        sampling = SamplingBudget(self.max_sample_queries)
+        if not data_types:
+            plan = QueryPlan(PARCEL)
+        else:
+            data_types = list(dict.fromkeys(data_types))
+            with track('EventQueryPlanner.plan_parcel_events', log=False):
+                candidates = self._estimate_candidates(parcel_id, data_types, start_range_unix, end_range_unix,
+                                                       current_sensors_only, sampling)
+            plan = min((candidate for candidate in candidates.values() if candidate is not None),
+                       key=lambda candidate: (candidate.estimated_rcu, candidate.queries))
+            plan.candidates = {path: candidate.estimated_rcu if candidate is not None else None
+                               for path, candidate in candidates.items()}
+        plan.sampling_queries = sampling.queries
+        plan.sampling_rcu = sampling.rcu
+        planning_duration.observe(time.perf_counter() - start, path=plan.path)
+        with self._lock:
+            self._stats['plans'] += 1
+            self._stats['skipped_candidates'] += sum(1 for rcu in plan.candidates.values() if rcu is None)
+            self._chosen[plan.path] += 1
+            self._last_plan = {'parcel_id': parcel_id, 'data_types': data_types, 'start': start_range_unix,
+                               'end': end_range_unix, 'path': plan.path, 'estimated_items': plan.estimated_items,
+                               'estimated_rcu': plan.estimated_rcu, 'candidates': plan.candidates,
+                               'sampling_queries': plan.sampling_queries, 'sampling_rcu': plan.sampling_rcu}
+        return plan
+
+    def _estimate_candidates(self, parcel_id, data_types, start, end, current_sensors_only,
+                             sampling: SamplingBudget) -> Dict[str, Optional[QueryPlan]]:
+        # Cheapest to sample first: the parcel index needs `samples` windows, the field one per partition
+        candidates = {PARCEL: self._estimate_parcel(parcel_id, start, end, sampling)}
+        if self.service.parcel_type_index:
+            candidates[PARCEL_TYPE] = self._estimate_parcel_type(parcel_id, data_types, start, end, sampling)
+        if current_sensors_only:
+            candidates[SENSOR] = self._estimate_sensors(parcel_id, data_types, start, end, sampling)
+        field_ranges = self._field_ranges(data_types, start, end)
+        # The field partitions hold every event the other paths read, and cost a read per partition query
+        lower_bound_items = max((candidates[path].estimated_items for path in (PARCEL_TYPE, SENSOR)
+                                 if candidates.get(path) is not None), default=0)
+        best_rcu = min(candidate.estimated_rcu for candidate in candidates.values() if candidate is not None)
+        if read_units(lower_bound_items, len(field_ranges)) >= best_rcu:
+            candidates[FIELD] = None
+        else:
+            candidates[FIELD] = self._estimate_field(field_ranges, sampling)
+        return candidates
+
+    # Candidate estimates, None when the sampling budget cannot cover them
+    def _estimate_parcel(self, parcel_id, start, end, sampling) -> Optional[QueryPlan]:
+        items, = self._estimate_items([(('parcel', parcel_id), self.service.parcel_events_query_params,
+                                        (parcel_id,), start, end, self.samples)], sampling)
+        if items is None:
+            return None
+        return QueryPlan(PARCEL, items, read_units(items, 1))
+
+    def _estimate_parcel_type(self, parcel_id, data_types, start, end, sampling) -> Optional[QueryPlan]:
+        per_type = self._estimate_items([(('parcel_type', parcel_id, data_type),
+                                          self.service.parcel_type_events_query_params, (parcel_id, data_type),
+                                          start, end, self.samples) for data_type in data_types], sampling)
+        if None in per_type:
+            return None
+        return QueryPlan(PARCEL_TYPE, sum(per_type), sum(read_units(items, 1) for items in per_type),
+                         len(data_types))
+
+    def _field_ranges(self, data_types, start, end):
+        months = self._month_overlaps(start, end)
+        # The sample budget is spread over the month partitions
+        samples = max(1, self.samples // len(months)) if months else 1
+        return [(('field', partition_key), self.service.field_events_query_params, (partition_key,),
+                 month_start_range, month_end_range, samples)
+                for data_type in data_types
+                for month_start, month_start_range, month_end_range in months
+                for partition_key in event_partition_keys(data_type, month_start)]
+
+    def _estimate_field(self, ranges, sampling) -> Optional[QueryPlan]:
+        per_partition = self._estimate_items(ranges, sampling)
+        if None in per_partition:
+            return None
+        items = sum(per_partition)
+        return QueryPlan(FIELD, items, read_units(items, len(ranges)), len(ranges))
+
+    def _estimate_sensors(self, parcel_id, data_types, start, end, sampling) -> Optional[QueryPlan]:
+        sensors = self._parcel_sensors(parcel_id, sampling)
+        sensor_ids = [sensor_id for data_type in data_types for sensor_id in sensors.get(data_type, ())]
+        # One sensor of each type stands in for all of them
+        sampled_types = [data_type for data_type in data_types if sensors.get(data_type)]
+        per_sensor = self._estimate_items([(('sensor', sensors[data_type][0]),
+                                            self.service.sensor_events_query_params, (sensors[data_type][0],),
+                                            start, end, self.samples) for data_type in sampled_types], sampling)
+        if None in per_sensor:
+            return None
+        items = sum(count * len(sensors[data_type]) for data_type, count in zip(sampled_types, per_sensor))
+        rcu = sum(read_units(count, 1) * len(sensors[data_type])
+                  for data_type, count in zip(sampled_types, per_sensor))
+        return QueryPlan(SENSOR, items, rcu, len(sensor_ids), sensor_ids)
+
+    # Statistics
+    def _month_overlaps(self, start_range_unix, end_range_unix):
+        # (first_of_month, start, end) of every month partition the range covers
+        month_starts = [get_first_of_month_as_unix_timestamp(month)
+                        for month in calculate_pks(time_utils.epoch_to_iso(start_range_unix),
+                                                   time_utils.epoch_to_iso(end_range_unix))]
+        bounds = month_starts[1:] + [end_range_unix]
+        return [(month_start, max(start_range_unix, month_start), min(end_range_unix, month_end))
+                for month_start, month_end in zip(month_starts, bounds)]
+
+    def _sample_windows(self, start, end, samples) -> List[tuple]:
+        # Aligned windows around the middles of `samples` equal slices of [start, end]
+        if end <= start:
+            return []
+        step = (end - start) / samples
+        windows = []
+        for i in range(samples):
+            middle = int(start + step * (i + 0.5))
+            window_start = middle - middle % self.sample_s
+            windows.append((window_start, window_start + self.sample_s))
+        return list(dict.fromkeys(windows))
+
+    def _estimate_items(self, ranges, sampling: SamplingBudget) -> List[Optional[float]]:
+        """
+        Estimated items read for every (key, params_builder, args, start, end, samples) range: the event rate
+        in its sample windows times the range's length. Windows missing from the cache are counted concurrently,
+        those beyond the plan's sampling budget are left out. A range left without any window is estimated as None.
+        """
+        windows = [self._sample_windows(start, end, samples) for _, _, _, start, end, samples in ranges]
+        sampled_windows = []
+        counts = {}
+        missing = {}
+        for (key, params_builder, args, _, _, _), range_windows in zip(ranges, windows):
+            kept = []
+            for window in range_windows:
+                window_key = key + window
+                if window_key not in counts and window_key not in missing:
+                    count = self._cached(window_key)
+                    if count is not None:
+                        counts[window_key] = count
+                    elif len(missing) < sampling.remaining:
+                        missing[window_key] = params_builder(*args, *window)
+                    else:
+                        continue
+                kept.append(window)
+            sampled_windows.append(kept)
+        sampling.remaining -= len(missing)
+        missing_keys = list(missing)
+        for window_key, count in zip(missing_keys, bounded_map(self._count, [(missing[window_key], sampling)
+                                                                             for window_key in missing_keys],
+                                                               self.service.max_concurrency)):
+            self._store(window_key, count)
+            counts[window_key] = count
+        estimates = []
+        for (key, _, _, start, end, _), range_windows, kept in zip(ranges, windows, sampled_windows):
+            if range_windows and not kept:
+                estimates.append(None)
+                continue
+            sampled_s = sum(window_end - window_start for window_start, window_end in kept)
+            sampled = sum(counts[key + window] for window in kept)
+            estimates.append(sampled * (end - start) / sampled_s if sampled_s else 0.0)
+        return estimates
+
+    def _parcel_sensors(self, parcel_id, sampling: SamplingBudget) -> Dict[str, List[str]]:
+        # Sensor ids per type currently placed in the parcel
+        key = ('sensors', parcel_id)
+        sensors = self._cached(key)
+        if sensors is None:
+            params, operation = self.service.sensor_service.active_sensors_params(parcel_id)
+            paginator = QueryPaginator(self.dynamodb, with_projection(params, ()), operation=operation)
+            sensors = {}
+            for item in paginator:
+                _, sensor_type, sensor_id = item['SK']['S'].split('#', 2)
+                sensors.setdefault(sensor_type, []).append(sensor_id)
+            sampling.remaining -= 1
+            self._record_stats_query(paginator.consumed_capacity, sampling)
+            self._store(key, sensors)
+        return sensors
+
+    def _count(self, params, sampling: SamplingBudget) -> int:
+        # Items read (before filters) in the key range, paging through COUNT results
+        params = dict(params, Select='COUNT')
+        count = 0
+        while True:
+            response = self.dynamodb.query(**params)
+            count += response.get('ScannedCount', response.get('Count', 0))
+            self._record_stats_query(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0), sampling)
+            if not response.get('LastEvaluatedKey'):
+                return count
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _record_stats_query(self, capacity_units, sampling: SamplingBudget):
+        sampling.spend(capacity_units)
+        with self._lock:
+            self._stats['stats_queries'] += 1
+            self._stats['stats_rcu'] += capacity_units
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._stats_cache.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._stats_cache[key]
+                return None
+            self._stats_cache.move_to_end(key)
+            return value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._stats_cache[key] = (value, time.monotonic() + self.stats_ttl_s)
+            self._stats_cache.move_to_end(key)
+            while len(self._stats_cache) > self.max_stats:
+                self._stats_cache.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._stats_cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, chosen=dict(self._chosen), cached_stats=len(self._stats_cache),
+                        last_plan=self._last_plan)
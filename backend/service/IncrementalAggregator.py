@@ -0,0 +1,280 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from utils.fan_out import bounded_map
+from utils.polygon_def import query_max_concurrency
+from utils.quantile_sketch import QuantileSketch
+from utils.sensor_events import time_utils
+from utils.sensor_events.sharding import base_partition_key
+
+# Accumulator items: PK {dataType}#{first_of_month}, SK AggInc#Day#{day} for the field, AggInc#Day#{day}#{parcelId}
+# per parcel. Sketch buckets are top-level number attributes q_<bucket>, DynamoDB only ADDs to top-level attributes
+SK_PREFIX = 'AggInc#Day#'
+BUCKET_PREFIX = 'q_'
+# Bucket ADDs per UpdateItem, keeps the update expression well below its 4 KB limit
+BUCKETS_PER_UPDATE = 100
+
+
+class Accumulator:
+    """count, sum, min, max and a quantile sketch of the data points of one data type and day."""
+    __slots__ = ('count', 'total', 'min', 'max', 'sketch')
+
+    def __init__(self, relative_accuracy):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other: 'Accumulator'):
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def is_empty(self):
+        return self.count == 0 and not self.sketch.counts and self.min is None and self.max is None
+
+    @classmethod
+    def from_item(cls, item: Dict, relative_accuracy) -> 'Accumulator':
+        accumulator = cls(float(item['sketch_accuracy']['N']) if 'sketch_accuracy' in item else relative_accuracy)
+        accumulator.count = int(item.get('count', {}).get('N', 0))
+        accumulator.total = float(item.get('sum', {}).get('N', 0))
+        if 'min' in item:
+            accumulator.min = float(item['min']['N'])
+        if 'max' in item:
+            accumulator.max = float(item['max']['N'])
+        for name, value in item.items():
+            if name.startswith(BUCKET_PREFIX):
+                accumulator.sketch.counts[name[len(BUCKET_PREFIX):]] = int(value['N'])
+        return accumulator
+
+    def aggregate_values(self) -> Dict:
+        # mean, min, max and median in the attribute format of the Agg# items; the median is the sketch's
+        # estimate, min and max fall back to it until their conditional updates have landed
+        minimum = self.min if self.min is not None else self.sketch.quantile(0)
+        maximum = self.max if self.max is not None else self.sketch.quantile(1)
+        return {'mean': {'N': str(self.total / self.count)}, 'min': {'N': str(minimum)},
+                'max': {'N': str(maximum)}, 'median': {'N': str(self.sketch.quantile(0.5))}}
+
+
+class IncrementalAggregator:
+    """
+    Folds written events into per-day accumulators, one per data type for the whole field and one per parcel,
+    and flushes them every `flush_interval_s` on a background thread: count, sum and sketch buckets with
+    UpdateItem ADD, min and max with conditional SETs (skipped when a known stored bound already covers them).
+    Updates that fail are merged back and retried with the next flush. `on_flushed` receives the
+    (partition key, day) pairs that were written.
+    ADD is not idempotent: an update retried after a lost response counts its delta twice. The worker's full
+    recomputation (Agg# items) stays exact and is preferred by readers once it ran.
+    """
+
+    def __init__(self, dynamodb, table_name, relative_accuracy=0.01, flush_interval_s=2.0,
+                 on_flushed: Callable[[Set[Tuple[str, int]]], None] = None, skip_types: Iterable[str] = (),
+                 max_concurrency=query_max_concurrency, max_known_bounds=10000):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.relative_accuracy = relative_accuracy
+        self.flush_interval_s = flush_interval_s
+        self.on_flushed = on_flushed
+        self.skip_types = set(skip_types)
+        self.max_concurrency = max_concurrency
+        self.max_known_bounds = max_known_bounds
+        self._pending: Dict[Tuple[str, str], Accumulator] = {}
+        # (PK, SK) -> [min, max] known to be stored, a value inside them needs no conditional update
+        self._known_bounds = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {'recorded': 0, 'flushes': 0, 'updates': 0, 'bound_updates_skipped': 0, 'failed_updates': 0,
+                       'flush_latency_last_s': 0.0}
+        self._worker = None
+        if flush_interval_s > 0:
+            self._worker = threading.Thread(target=self._run, name='incremental-aggregator', daemon=True)
+            self._worker.start()
+
+    def record(self, entity: Dict):
+        # Called for every event this process wrote
+        data_type = entity['data_type']['S']
+        if data_type in self.skip_types:
+            return
+        epoch = int(entity['SK']['S'].split('#', 2)[1])
+        year, month, day = time_utils.epoch_to_wall(epoch)[:3]
+        day_start = time_utils.wall_to_epoch(year, month, day)
+        partition_key = base_partition_key(entity['PK']['S'])
+        value = float(entity['data_point']['N'])
+        with self._lock:
+            for sort_key in (f"{SK_PREFIX}{day_start}", f"{SK_PREFIX}{day_start}#{entity['parcel_id']['S']}"):
+                accumulator = self._pending.get((partition_key, sort_key))
+                if accumulator is None:
+                    accumulator = self._pending[(partition_key, sort_key)] = Accumulator(self.relative_accuracy)
+                accumulator.add(value)
+            self._stats['recorded'] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval_s):
+            self.flush()
+
+    def flush(self) -> int:
+        # Writes the pending accumulators, returns how many were written completely
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            start = time.perf_counter()
+            keys = list(pending)
+            retries = bounded_map(self._write, [(key, pending[key]) for key in keys], self.max_concurrency,
+                                  return_exceptions=True)
+            written = set()
+            with self._lock:
+                for key, retry in zip(keys, retries):
+                    if isinstance(retry, Exception):
+                        retry = pending[key]
+                    if retry is None:
+                        written.add((key[0], int(key[1][len(SK_PREFIX):].split('#', 1)[0])))
+                        continue
+                    if key in self._pending:
+                        retry.merge(self._pending[key])
+                    self._pending[key] = retry
+                self._stats['flushes'] += 1
+                self._stats['flush_latency_last_s'] = time.perf_counter() - start
+        if written and self.on_flushed is not None:
+            self.on_flushed(written)
+        return len(written)
+
+    def _write(self, key, accumulator: Accumulator) -> Optional[Accumulator]:
+        # Returns None once everything is stored, otherwise the part that has to be retried
+        partition_key, sort_key = key
+        retry = Accumulator(accumulator.sketch.relative_accuracy)
+        buckets = list(accumulator.sketch.counts.items())
+        chunks = [buckets[i:i + BUCKETS_PER_UPDATE] for i in range(0, len(buckets), BUCKETS_PER_UPDATE)] or [[]]
+        for index, chunk in enumerate(chunks):
+            count, total = (accumulator.count, accumulator.total) if index == 0 else (0, 0.0)
+            try:
+                self._add(partition_key, sort_key, count, total, chunk)
+            except (ClientError, BotoCoreError, Exception) as e:
+                print(f"Accumulator {partition_key} {sort_key} could not be updated: {e}")
+                retry.count += count
+                retry.total += total
+                retry.sketch.counts.update(chunk)
+                self._count('failed_updates')
+        for bound in ('min', 'max'):
+            value = getattr(accumulator, bound)
+            if value is None:
+                continue
+            try:
+                self._update_bound(partition_key, sort_key, bound, value)
+            except (ClientError, BotoCoreError, Exception) as e:
+                print(f"Accumulator {partition_key} {sort_key} {bound} could not be updated: {e}")
+                setattr(retry, bound, value)
+                self._count('failed_updates')
+        return None if retry.is_empty() else retry
+
+    def _add(self, partition_key, sort_key, count, total, buckets):
+        names = {'#accuracy': 'sketch_accuracy'}
+        values = {':accuracy': {'N': str(self.relative_accuracy)}}
+        additions = []
+        if count:
+            names.update({'#count': 'count', '#sum': 'sum'})
+            values.update({':count': {'N': str(count)}, ':sum': {'N': repr(total)}})
+            additions += ['#count :count', '#sum :sum']
+        for index, (bucket, bucket_count) in enumerate(buckets):
+            names[f'#b{index}'] = f"{BUCKET_PREFIX}{bucket}"
+            values[f':b{index}'] = {'N': str(bucket_count)}
+            additions.append(f'#b{index} :b{index}')
+        if not additions:
+            return
+        self.dynamodb.update_item(
+            TableName=self.table_name,
+            Key={'PK': {'S': partition_key}, 'SK': {'S': sort_key}},
+            UpdateExpression=f"SET #accuracy = if_not_exists(#accuracy, :accuracy) ADD {', '.join(additions)}",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values)
+        self._count('updates')
+
+    def _update_bound(self, partition_key, sort_key, bound, value):
+        # Sets min (max) only if the item has none or a larger (smaller) one
+        key = (partition_key, sort_key)
+        position = 0 if bound == 'min' else 1
+        with self._lock:
+            known = self._known_bounds.get(key)
+            if known is not None and known[position] is not None \
+                    and (value >= known[position] if bound == 'min' else value <= known[position]):
+                self._stats['bound_updates_skipped'] += 1
+                return
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'PK': {'S': partition_key}, 'SK': {'S': sort_key}},
+                UpdateExpression='SET #bound = :value',
+                ConditionExpression=f"attribute_not_exists(#bound) OR #bound {'>' if bound == 'min' else '<'} :value",
+                ExpressionAttributeNames={'#bound': bound},
+                ExpressionAttributeValues={':value': {'N': repr(value)}})
+            self._count('updates')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        # Either way the stored bound is now at least as extreme as value
+        with self._lock:
+            known = self._known_bounds.setdefault(key, [None, None])
+            if known[position] is None or (value < known[position] if bound == 'min' else value > known[position]):
+                known[position] = value
+            self._known_bounds.move_to_end(key)
+            while len(self._known_bounds) > self.max_known_bounds:
+                self._known_bounds.popitem(last=False)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def aggregate_item(self, partition_key, sort_key, items: List[Dict], day: int = None) -> Optional[Dict]:
+        """
+        Merges accumulator items (all days of the month, or only `day`) into an item in the format of the
+        worker's Agg# items, None if they hold no data points.
+        """
+        field = Accumulator(self.relative_accuracy)
+        parcels: Dict[str, Accumulator] = {}
+        for item in items:
+            _, _, item_day, *parcel_id = item['SK']['S'].split('#', 3)
+            if day is not None and int(item_day) != day:
+                continue
+            accumulator = Accumulator.from_item(item, self.relative_accuracy)
+            if parcel_id:
+                if parcel_id[0] in parcels:
+                    parcels[parcel_id[0]].merge(accumulator)
+                else:
+                    parcels[parcel_id[0]] = accumulator
+            else:
+                field.merge(accumulator)
+        if field.count == 0:
+            return None
+        return {'PK': {'S': partition_key}, 'SK': {'S': sort_key}, **field.aggregate_values(),
+                'parcel_agg': {'M': {parcel_id: {'M': accumulator.aggregate_values()}
+                                     for parcel_id, accumulator in parcels.items() if accumulator.count}}}
+
+    def close(self, timeout=None):
+        # Stops the background flushes and writes what is still pending
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), known_bounds=len(self._known_bounds),
+                        relative_accuracy=self.relative_accuracy)
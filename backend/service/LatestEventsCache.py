@@ -0,0 +1,160 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+
+class _SensorRing:
+    """
+    The latest `capacity` events of one sensor, oldest to newest from `start`, in parallel typed arrays.
+    Location, parcel and partition key rarely change, consecutive events share one (PK, geoJson, parcel_id) tuple.
+    """
+    __slots__ = ('sensor_id', 'data_type', 'epochs', 'data_points', 'battery_levels', 'places', 'start', 'size',
+                 'warmed_at')
+
+    def __init__(self, sensor_id, capacity, warmed_at):
+        self.sensor_id = sensor_id
+        self.data_type = None
+        self.epochs = array('q', [0]) * capacity
+        self.data_points = array('d', [0.0]) * capacity
+        self.battery_levels = array('d', [0.0]) * capacity
+        self.places = [None] * capacity
+        self.start = 0
+        self.size = 0
+        self.warmed_at = warmed_at
+
+    def _slot(self, offset):
+        return (self.start + offset) % len(self.epochs)
+
+    def push(self, entity):
+        epoch = int(entity['SK']['S'].split('#', 2)[1])
+        if self.size and epoch <= self.epochs[self._slot(self.size - 1)]:
+            self._insert_out_of_order(entity, epoch)
+            return
+        self.data_type = entity['data_type']['S']
+        place = (entity['PK']['S'], entity['geoJson']['S'], entity['parcel_id']['S'])
+        if self.size:
+            previous = self.places[self._slot(self.size - 1)]
+            if previous == place:
+                place = previous
+        if self.size < len(self.epochs):
+            slot = self._slot(self.size)
+            self.size += 1
+        else:
+            slot = self.start
+            self.start = self._slot(1)
+        self.epochs[slot] = epoch
+        self.data_points[slot] = float(entity['data_point']['N'])
+        self.battery_levels[slot] = float(entity['battery_level']['N'])
+        self.places[slot] = place
+
+    def _insert_out_of_order(self, entity, epoch):
+        # Late or repeated event: rebuild in order, the same timestamp replaces the held event
+        entities = [held for held in self.entities(self.size)[::-1]
+                    if int(held['SK']['S'].split('#', 2)[1]) != epoch]
+        if self.size == len(self.epochs) and epoch < self.epochs[self.start] and len(entities) == self.size:
+            return
+        entities.append(entity)
+        entities.sort(key=lambda held: int(held['SK']['S'].split('#', 2)[1]))
+        self.start = self.size = 0
+        for held in entities[-len(self.epochs):]:
+            self.push(held)
+
+    def entities(self, n) -> List[Dict]:
+        # Newest first, in the wire format of the event items
+        items = []
+        for offset in range(self.size - 1, max(self.size - n, 0) - 1, -1):
+            slot = self._slot(offset)
+            pk, geo_json, parcel_id = self.places[slot]
+            sensor_id = self.sensor_id
+            items.append({
+                'PK': {'S': pk},
+                'SK': {'S': f"Event#{self.epochs[slot]}#{sensor_id}"},
+                's_id': {'S': f"Event#{sensor_id}"},
+                'data_point': {'N': repr(self.data_points[slot])},
+                'geoJson': {'S': geo_json},
+                'parcel_id': {'S': parcel_id},
+                'battery_level': {'N': repr(self.battery_levels[slot])},
+                'data_type': {'S': self.data_type}
+            })
+        return items
+
+
+class LatestEventsCache:
+    """
+    Latest events per sensor for "latest N" / "last reading" reads, bounded to `capacity` events per sensor
+    and `max_sensors` sensors (least recently read are evicted).
+    A sensor is loaded with `load_latest(sensor_id, capacity)` on its first read and kept current by `record`
+    for events written by this process; after `max_age_s` it is reloaded to pick up other writers.
+    Reads of more than `capacity` events bypass the cache.
+    """
+
+    def __init__(self, load_latest: Callable[[str, int], List[Dict]], capacity=32, max_sensors=10000,
+                 max_age_s=60.0):
+        self.load_latest = load_latest
+        self.capacity = capacity
+        self.max_sensors = max_sensors
+        self.max_age_s = max_age_s
+        self._rings: OrderedDict = OrderedDict()
+        self._loading: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'evicted': 0, 'recorded': 0}
+
+    def latest(self, sensor_id, n) -> List[Dict]:
+        # The n most recent event items of the sensor, newest first
+        if n > self.capacity:
+            with self._lock:
+                self._stats['bypassed'] += 1
+            return self.load_latest(sensor_id, n)
+        with self._lock:
+            ring = self._rings.get(sensor_id)
+            if ring is not None and time.monotonic() - ring.warmed_at < self.max_age_s:
+                self._rings.move_to_end(sensor_id)
+                self._stats['hits'] += 1
+                return ring.entities(n)
+            self._stats['misses'] += 1
+            pending = self._loading.setdefault(sensor_id, [])
+        try:
+            loaded = self.load_latest(sensor_id, self.capacity)
+        except Exception:
+            with self._lock:
+                self._loading.pop(sensor_id, None)
+            raise
+        with self._lock:
+            ring = _SensorRing(sensor_id, self.capacity, time.monotonic())
+            # Events written while the load was running are applied on top of it
+            for entity in reversed(loaded):
+                ring.push(entity)
+            for entity in self._loading.pop(sensor_id, pending):
+                ring.push(entity)
+            self._rings[sensor_id] = ring
+            self._rings.move_to_end(sensor_id)
+            while len(self._rings) > self.max_sensors:
+                self._rings.popitem(last=False)
+                self._stats['evicted'] += 1
+            return ring.entities(n)
+
+    def record(self, entity: Dict):
+        # Called for every event this process wrote; sensors that are not cached are left alone
+        sensor_id = entity['s_id']['S'].split('#', 1)[1]
+        with self._lock:
+            if sensor_id in self._loading:
+                # A (re)load is running, its result replaces the ring
+                self._loading[sensor_id].append(entity)
+            ring = self._rings.get(sensor_id)
+            if ring is not None:
+                ring.push(entity)
+                self._stats['recorded'] += 1
+
+    def invalidate(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._rings.clear()
+            else:
+                self._rings.pop(sensor_id, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sensors=len(self._rings), capacity=self.capacity,
+                        max_sensors=self.max_sensors)
@@ -5,13 +5,15 @@ from backend.models.MaintenanceOperationByUser import MaintenanceOperation
 from backend.models.SensorDetails import SensorDetails
 from backend.models.SensorMaintenance import SensorMaintenance, MaintenanceDetails
 from dynamodbgeo import GeoDataManagerConfiguration, GeoDataManager
-from utils.polygon_def import create_dynamodb_client, hashKeyLength
+from utils.pagination import QueryPaginator
+from utils.polygon_def import get_shared_dynamodb_client, hashKeyLength
 from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch
+from utils.tracking import tracked
 
 
 class MaintenanceService:
-    def __init__(self):
-        self.dynamodb = create_dynamodb_client()
+    def __init__(self, dynamodb=None, sensor_service=None):
+        self.dynamodb = dynamodb or get_shared_dynamodb_client()
         self.config = GeoDataManagerConfiguration(self.dynamodb, 'IoT')
         self.config.hashKeyAttributeName = 'PK'
         self.config.rangeKeyAttributeName = 'SK'
@@ -19,10 +21,9 @@ class MaintenanceService:
         self.config.hashKeyLength = hashKeyLength
         self.table_name = 'IoT'
         self.gsi_name = 'GSI_Users_Roles_Maintenance'
+        self.sensor_service = sensor_service
 
-    def get_sensors_scheduled_or_in_maintenance(self, scheduled=False, assigned_to=None, from_date=None, to_date=None):
-        response_items = []
-        consumed_capacity=0
+    def maintenance_query_params(self, scheduled=False, assigned_to=None, from_date=None, to_date=None):
         params = {
             "TableName": self.table_name,
             "IndexName": 'GSI_Users_Roles_Maintenance',
@@ -39,23 +40,30 @@ class MaintenanceService:
             params["KeyConditionExpression"] += " AND GSI_SK BETWEEN :from_date AND :to_date"
             params["ExpressionAttributeValues"][":from_date"] = {'S': f"Maintenance#{convert_to_unix_epoch(from_date)}"}
             params["ExpressionAttributeValues"][":to_date"] = {'S': f"Maintenance#{convert_to_unix_epoch(to_date)}"}
+        return params
+
+    def iter_sensors_scheduled_or_in_maintenance(self, scheduled=False, assigned_to=None, from_date=None,
+                                                 to_date=None, max_items=None, page_size=None,
+                                                 start_key=None) -> QueryPaginator:
+        params = self.maintenance_query_params(scheduled, assigned_to, from_date, to_date)
+        return QueryPaginator(self.dynamodb, params, decode=SensorDetails, max_items=max_items,
+                              page_size=page_size, start_key=start_key)
+
+    @tracked()
+    def get_sensors_scheduled_or_in_maintenance(self, scheduled=False, assigned_to=None, from_date=None, to_date=None):
+        response_items = []
+        paginator = self.iter_sensors_scheduled_or_in_maintenance(scheduled, assigned_to, from_date, to_date)
         try:
-            while True:
-                response = self.dynamodb.query(**params)
-                response_items.extend(response.get('Items', []))
-                consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-                if 'LastEvaluatedKey' not in response:
-                    break
-                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
-            print(f'Sensors in Maintenance: {len(response_items)}, Consumed Capacity Units: {consumed_capacity}')
-            return [SensorDetails(item) for item in response_items]
+            for page in paginator.pages():
+                response_items.extend(page)
+            return response_items
         except (BotoCoreError, ClientError, Exception) as error:
             print(f"An error occurred: {error}")
             return response_items
 
 
 
-    def get_maintenance_operations_by_user(self, user_email, start_date=None, end_date=None):
+    def operations_by_user_query_params(self, user_email, start_date=None, end_date=None):
         if (start_date is None) != (end_date is None):
             raise ValueError("Either both start_date and end_date must be provided or neither")
         params = {
@@ -78,50 +86,55 @@ class MaintenanceService:
             params['ExpressionAttributeNames']['#sk'] = 'GSI_SK'
             params['ExpressionAttributeValues'][':start'] = {'S': f"Maintenance#{start_timestamp}"}
             params['ExpressionAttributeValues'][':end'] = {'S': f"Maintenance#{end_timestamp}"}
+        return params
+
+    def iter_maintenance_operations_by_user(self, user_email, start_date=None, end_date=None, max_items=None,
+                                            page_size=None, start_key=None) -> QueryPaginator:
+        params = self.operations_by_user_query_params(user_email, start_date, end_date)
+        return QueryPaginator(self.dynamodb, params, decode=MaintenanceOperation, max_items=max_items,
+                              page_size=page_size, start_key=start_key)
+
+    @tracked()
+    def get_maintenance_operations_by_user(self, user_email, start_date=None, end_date=None):
+        paginator = self.iter_maintenance_operations_by_user(user_email, start_date, end_date)
+        return paginator.all()
 
-        response = self.dynamodb.query(**params)
-        items = response.get('Items', [])
-        consumed_capacity_units = response.get('ConsumedCapacity', {}).get('CapacityUnits')
-        if consumed_capacity_units is not None:
-            print(f"Maintenance Operation by User {user_email}, Consumed Capacity Units: {consumed_capacity_units}")
-        return [MaintenanceOperation(item) for item in items]
 
+    def latest_operations_query_params(self, sensor_id, n):
+        return {
+            'TableName': self.table_name,
+            'KeyConditionExpression': "PK = :pk and begins_with(SK, :sk)",
+            'ExpressionAttributeValues': {
+                ":pk": {'S': f"Sensor#{sensor_id}"},
+                ":sk": {'S': "Maintenance#"}
+            },
+            'ScanIndexForward': False,
+            'Limit': n,
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
 
+    @tracked()
     def get_latest_n_maintenance_operations_for_sensor(self, sensor_id, n):
-        response_items = []
-        last_evaluated_key = None
-        consumed_capacity = 0
+        # max_items sets the page Limit, so at most n operations are read
+        paginator = QueryPaginator(self.dynamodb, self.latest_operations_query_params(sensor_id, n),
+                                   decode=SensorMaintenance, max_items=n)
         try:
-            while True:
-                response = self.dynamodb.query(
-                    TableName=self.table_name,
-                    KeyConditionExpression="PK = :pk and begins_with(SK, :sk)",
-                    ExpressionAttributeValues={
-                        ":pk": {'S': f"Sensor#{sensor_id}"},
-                        ":sk": {'S': "Maintenance#"}
-                    },
-                    ScanIndexForward=False,
-                    Limit=n,
-                    # Pagination
-                    **({'ExclusiveStartKey': last_evaluated_key} if last_evaluated_key else {}),
-                    ReturnConsumedCapacity='TOTAL'
-                )
-                response_items.extend(response.get('Items', []))
-                last_evaluated_key = response.get('LastEvaluatedKey')
-                consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-                if len(response_items) >= n or not last_evaluated_key:
-                    break
-            print(f'Sensor#Maintenance for ID {sensor_id}, Consumed Capacity Units: {consumed_capacity}')
+            operations = paginator.all()
         except (BotoCoreError, ClientError) as error:
             print(f"An error occurred: {error}")
             return None
-        return [SensorMaintenance(item) for item in response_items]
+        return operations
 
+    def get_sensor_service(self):
+        if self.sensor_service is None:
+            from backend.service.SensorService import SensorService
+            self.sensor_service = SensorService(dynamodb=self.dynamodb)
+        return self.sensor_service
+
+    @tracked()
     def put_sensor_into_maintenance(self, maintenance_details):
         try:
-            from backend.service.SensorService import SensorService
-            sensor_service = SensorService()
-            sensor_details = sensor_service.get_sensor_details_by_id(maintenance_details.sensor_id)
+            sensor_details = self.get_sensor_service().get_sensor_details_by_id(maintenance_details.sensor_id)
             updated_metadata_record = maintenance_details.generate_updated_metadata_record(self.table_name)
             new_maintenance_record = maintenance_details.generate_new_maintenance_record(self.table_name, sensor_details)
             transact_items = [updated_metadata_record, new_maintenance_record]
@@ -132,6 +145,7 @@ class MaintenanceService:
             print(f"Error adding maintenance operation: {e}")
             return False
 
+    @tracked()
     def conclude_maintenance_operation(self, sensor_id, sensor_type):
 
         try:
@@ -148,6 +162,7 @@ class MaintenanceService:
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"Error concluding maintenance operation: {e}")
 
+    @tracked()
     def schedule_sensor_maintenance(self, sensor_id, sensor_type, user_email):
         try:
             assigned_operation = SensorMaintenance.generate_scheduled_maintenance_record(self.table_name,
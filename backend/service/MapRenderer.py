@@ -0,0 +1,83 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List
+
+from utils.sensors.sensors_from_csv import parse_sensor_data, visualize_results, visualize_results_in_rectangle
+
+
+class MapRenderer:
+    """
+    Visualization stage for sensor query results: builds the folium map and saves it as
+    `<output_dir>/<name>.html`. Queries only hand over their results; with background=True the map is
+    built and written on one worker thread, at most `max_pending` renders wait and further ones are dropped.
+    """
+
+    def __init__(self, output_dir='vis_out/sensorservice', background=True, max_pending=8):
+        self.output_dir = output_dir
+        self.background = background
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._worker = None
+        self._lock = threading.Lock()
+        self._stats = {'rendered': 0, 'dropped': 0, 'failed': 0, 'render_seconds': 0.0}
+
+    def render_radius(self, name, center_point, radius_meters, results: List[Dict]):
+        self.submit(name, lambda: visualize_results(center_point, radius_meters, parse_sensor_data(results)))
+
+    def render_rectangle(self, name, polygon, results: List[Dict]):
+        self.submit(name, lambda: visualize_results_in_rectangle(subpolygon=polygon,
+                                                                 sensors=parse_sensor_data(results)))
+
+    def render_sensors(self, name, sensors: List[Dict]):
+        # sensors: already parsed with parse_sensor_data
+        self.submit(name, lambda: visualize_results(center_point=None, radius=None, sensors=sensors))
+
+    def submit(self, name, build_map: Callable):
+        if not self.background:
+            self._render(name, build_map)
+            return
+        self._ensure_worker()
+        try:
+            self._pending.put_nowait((name, build_map))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            print(f"Map {name} dropped, {self._pending.maxsize} renders are already pending")
+
+    def flush(self):
+        # Blocks until all submitted maps are written
+        if self._worker is not None:
+            self._pending.join()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='map-renderer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            name, build_map = self._pending.get()
+            try:
+                self._render(name, build_map)
+            finally:
+                self._pending.task_done()
+
+    def _render(self, name, build_map):
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            build_map().save(os.path.join(self.output_dir, f"{name}.html"))
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"Map {name} could not be rendered: {e}")
+            return
+        with self._lock:
+            self._stats['rendered'] += 1
+            self._stats['render_seconds'] += time.perf_counter() - start
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=self._pending.qsize(), background=self.background)
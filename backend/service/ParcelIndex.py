@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import Callable, List, Optional
+
+from shapely import STRtree
+from shapely.prepared import prep
+
+from backend.models.Parcel import Parcel
+
+
+class _Snapshot:
+    def __init__(self, parcels: List[Parcel], generation, expires_at):
+        self.parcels = parcels
+        self.tree = STRtree([parcel.polygon for parcel in parcels])
+        self.prepared = [prep(parcel.polygon) for parcel in parcels]
+        self.generation = generation
+        self.expires_at = expires_at
+
+
+class ParcelIndex:
+    """
+    Cached spatial index of the active parcels: an STRtree over the parcel polygons plus prepared geometries,
+    so a point lookup checks only the parcels whose bounding box contains the point.
+    The parcels are (re)loaded with `load_parcels` on first use, after `ttl_s` and after `invalidate()`;
+    concurrent callers wait for a single reload. Snapshots are immutable and swapped as a whole; the generation,
+    the current snapshot and the counters change only under `_lock`, which the reload takes as well.
+    """
+
+    def __init__(self, load_parcels: Callable[[], List[Parcel]], ttl_s=300.0):
+        self.load_parcels = load_parcels
+        self.ttl_s = ttl_s
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'loads': 0, 'invalidations': 0}
+
+    def invalidate(self):
+        # A load that started before the invalidation is not trusted afterwards
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def _fresh(self, snapshot) -> bool:
+        # Caller holds _lock
+        return snapshot is not None and snapshot.generation == self._generation \
+            and snapshot.expires_at > time.monotonic()
+
+    def _current(self) -> _Snapshot:
+        with self._lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                self._stats['hits'] += 1
+                return snapshot
+        with self._load_lock:
+            with self._lock:
+                snapshot = self._snapshot
+                if self._fresh(snapshot):
+                    return snapshot
+                generation = self._generation
+            # Loaded outside _lock, lookups of a still valid snapshot and invalidations do not wait for it
+            snapshot = _Snapshot(self.load_parcels(), generation, time.monotonic() + self.ttl_s)
+            with self._lock:
+                self._snapshot = snapshot
+                self._stats['loads'] += 1
+            return snapshot
+
+    def parcels(self) -> List[Parcel]:
+        return list(self._current().parcels)
+
+    def find_parcel(self, point) -> Optional[Parcel]:
+        # The parcel containing the point, like is_point_in_parcel over all active parcels
+        snapshot = self._current()
+        for index in sorted(snapshot.tree.query(point)):
+            if snapshot.prepared[index].contains(point):
+                return snapshot.parcels[index]
+        return None
+
+    def intersecting(self, polygon) -> List[Parcel]:
+        snapshot = self._current()
+        return [snapshot.parcels[index] for index in sorted(snapshot.tree.query(polygon))
+                if snapshot.prepared[index].intersects(polygon)]
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return dict(self._stats, size=len(snapshot.parcels) if snapshot else 0, ttl_s=self.ttl_s)
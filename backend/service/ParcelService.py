@@ -6,75 +6,136 @@ from botocore.exceptions import BotoCoreError, ClientError
 from shapely import Polygon
 
 from backend.models.Parcel import Parcel
+from backend.service.ParcelIndex import ParcelIndex
 from dynamodbgeo import GeoDataManagerConfiguration, GeoDataManager
 from utils import polygon_def
-from utils.polygon_def import create_dynamodb_client, hashKeyLength
+from utils.fan_out import bounded_map
+from utils.pagination import QueryPaginator
+from utils.polygon_def import get_shared_dynamodb_client, hashKeyLength, parcel_index_ttl_s
 from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch
+from utils.tracking import tracked
+
+# TransactWriteItems accepts at most 100 items
+TRANSACT_MAX_ITEMS = 100
 
 
 class ParcelService:
-    def __init__(self):
-        self.dynamodb = create_dynamodb_client()
+    def __init__(self, dynamodb=None, sensor_service=None):
+        self.dynamodb = dynamodb or get_shared_dynamodb_client()
         self.config = GeoDataManagerConfiguration(self.dynamodb, 'IoT')
         self.config.hashKeyAttributeName = 'PK'
         self.config.rangeKeyAttributeName = 'SK'
         self.geoDataManager = GeoDataManager(self.config)
         self.config.hashKeyLength = hashKeyLength
+        self.sensor_service = sensor_service
+        self.parcel_index = ParcelIndex(self._query_active_parcels, ttl_s=parcel_index_ttl_s)
+
+    @tracked()
+    def find_active_parcel_for_point(self, point) -> Parcel:
+        # Served from the cached spatial index, None if the point lies in no active parcel
+        return self.parcel_index.find_parcel(point)
 
+    @tracked()
     def retire_parcel(self, parcel_id):
+        """
+        Detaches every active sensor from the parcel (metadata loses its location, the current location record
+        gets moved_at), then marks the parcel inactive. Sensors are detached in transactions of at most
+        TRANSACT_MAX_ITEMS items that run concurrently; the parcel is only retired once all of them succeeded,
+        so a failed retirement can be repeated and picks up the sensors still placed in the parcel.
+        """
         try:
-            from backend.service.SensorService import SensorService
-            sensor_service = SensorService()
+            sensor_service = self.get_sensor_service()
             sensors_details = sensor_service.get_all_active_sensors_in_field_or_with_optional_parcel_id(parcel_id)
-            sensor_ids = [sensor['sensor_id'].split("#")[1] for sensor in sensors_details]
-            sensors_location_histories = sensor_service.batch_get_sensor_locations_histories(sensor_ids, True)
-            transact_items = []
+            sensor_types = {sensor['sensor_id'].split("#")[1]: sensor['sensor_type'] for sensor in sensors_details}
+            errors = {}
+            sensors_location_histories = sensor_service.batch_get_sensor_locations_histories(
+                list(sensor_types), True, errors)
+            if errors:
+                raise Exception(f"Current locations of {len(errors)} sensors could not be retrieved")
+            current_date = convert_to_unix_epoch(datetime.now().strftime("%Y-%m-%dT%H:%M:%S"))
+            chunks = self.chunk_transact_items([
+                (sensor_id, self.detach_sensor_items(sensor_id, sensor_type, sensors_location_histories[sensor_id],
+                                                     current_date))
+                for sensor_id, sensor_type in sensor_types.items()])
+            results = bounded_map(self._transact_write, [(items,) for _, items in chunks],
+                                  sensor_service.max_concurrency, return_exceptions=True)
+            failed = []
+            for (sensor_ids, _), result in zip(chunks, results):
+                if isinstance(result, Exception):
+                    failed.append(result)
+                    continue
+                for sensor_id in sensor_ids:
+                    location = sensors_location_histories[sensor_id]
+                    sensor_service.index_retired_sensor(sensor_types[sensor_id], sensor_id,
+                                                        location[0].sk if location else None, current_date)
+            if failed:
+                raise Exception(f"{len(failed)} of {len(chunks)} sensor transactions failed: {failed[0]}")
+            self.dynamodb.update_item(
+                TableName=self.config.tableName,
+                Key={
+                    'PK': {'S': f'Parcel'},
+                    'SK': {'S': f'{parcel_id}'}
+                },
+                UpdateExpression='SET active_to = :val REMOVE active',
+                ExpressionAttributeValues={
+                    ':val': {'S': str(dateutil.utils.today())}
+                })
+            print(f"Retired parcel {parcel_id} with {len(sensor_types)} sensors in {len(chunks)} transactions")
+            self.parcel_index.invalidate()
+            return True
+        except (BotoCoreError, ClientError, Exception) as error:
+            print(f"An error occurred: {error}")
+            return False
+
+    def detach_sensor_items(self, sensor_id, sensor_type, current_location, moved_at):
+        # Transaction items removing one sensor from its parcel, kept together in a single transaction
+        transact_items = [{
+            'Update': {
+                'TableName': self.config.tableName,
+                'Key': {
+                    'PK': {'S': f"Sensor#{sensor_id}"},
+                    'SK': {'S': f"Metadata#{sensor_type}#{sensor_id}"}
+                },
+                'UpdateExpression': 'REMOVE curr_parcelid, hash_key, geohash, geoJson'
+            }
+        }]
+        if current_location:
             transact_items.append({
                 'Update': {
                     'TableName': self.config.tableName,
                     'Key': {
-                        'PK': {'S': f'Parcel'},
-                        'SK': {'S': f'{parcel_id}'}
+                        'PK': {'S': f"Sensor#{sensor_id}"},
+                        'SK': {'S': f"{current_location[0].sk}"}
                     },
-                    'UpdateExpression': 'SET active_to = :val REMOVE active',
+                    'UpdateExpression': 'SET moved_at = :movedAt',
                     'ExpressionAttributeValues': {
-                        ':val': {'S': str(dateutil.utils.today())}
+                        ':movedAt': {'N': str(moved_at)}
                     }
                 }
             })
-            for key, value in sensors_location_histories.items():
-                sensor_id = key
-                transact_items.append({
-                    'Update': {
-                        'TableName': self.config.tableName,
-                        'Key': {
-                            'PK': {'S': f"Sensor#{sensor_id}"},
-                            'SK': {'S': f"Metadata#{value[0].sensor_type}#{sensor_id}"}
-                        },
-                        'UpdateExpression': 'REMOVE curr_parcelid, hash_key, geohash, geoJson'
-                    }
-                })
-                current_date = convert_to_unix_epoch(datetime.now().strftime("%Y-%m-%dT%H:%M:%S"))
-                transact_items.append({
-                    'Update': {
-                        'TableName': self.config.tableName,
-                        'Key': {
-                            'PK': {'S': f"Sensor#{sensor_id}"},
-                            'SK': {'S': f"{value[0].sk}"}
-                        },
-                        'UpdateExpression': 'SET moved_at = :movedAt',
-                        'ExpressionAttributeValues': {
-                            ':movedAt': {'S': str(current_date)}
-                        }
-                    }
-                })
-            response = self.dynamodb.transact_write_items(TransactItems=transact_items)
-            return True
-        except (BotoCoreError, ClientError, Exception) as error:
-            print(f"An error occurred: {error}")
-            return False
+        return transact_items
+
+    def _transact_write(self, transact_items):
+        return self.dynamodb.transact_write_items(TransactItems=transact_items)
 
+    @staticmethod
+    def chunk_transact_items(grouped_items):
+        # (key, items) groups packed into transactions of at most TRANSACT_MAX_ITEMS, a group is never split
+        chunks = []
+        for key, items in grouped_items:
+            if not chunks or len(chunks[-1][1]) + len(items) > TRANSACT_MAX_ITEMS:
+                chunks.append(([], []))
+            chunks[-1][0].append(key)
+            chunks[-1][1].extend(items)
+        return chunks
+
+    def get_sensor_service(self):
+        if self.sensor_service is None:
+            from backend.service.SensorService import SensorService
+            self.sensor_service = SensorService(dynamodb=self.dynamodb, parcel_service=self)
+        return self.sensor_service
 
+    @tracked()
     def add_parcel(self, entry):
         try:
             parcel_polygon = Polygon(entry['polygon_coord'])
@@ -82,11 +143,9 @@ class ParcelService:
             is_in_field = field_bounds.contains(parcel_polygon)
             if not is_in_field:
                 raise ValueError("Polygon is not in field")
-            existing_parcels = self.get_all_active_parcels_in_field()
-            for parcel in existing_parcels:
-                existing_parcel_polygon = parcel.polygon
-                if parcel_polygon.intersects(existing_parcel_polygon):
-                    raise Exception(f"Planned parcel clashes with currently active parcel id {parcel.SK}")
+            clashing_parcels = self.parcel_index.intersecting(parcel_polygon)
+            if clashing_parcels:
+                raise Exception(f"Planned parcel clashes with currently active parcel id {clashing_parcels[0].SK}")
             parcel_id = uuid.uuid4()
             new_parcel = {
                 'PK': 'Parcel',
@@ -106,53 +165,63 @@ class ParcelService:
             if 'active' in entry:
                 new_parcel['active'] = entry['active']
             self.dynamodb.put_item(TableName=self.config.tableName, Item=new_parcel)
+            self.parcel_index.invalidate()
             return parcel_id
         except (BotoCoreError, ClientError, Exception) as error:
             print(f"An error occurred: {error}")
             return None
 
 
+    def active_parcels_query_params(self, plant_type=None):
+        key_condition_expression = "active = :pk_val"
+        expression_attribute_values = {
+            ":pk_val": {'N': '1'}
+        }
+        if plant_type is not None:
+            key_condition_expression += f" AND begins_with(SK, :sk_val)"
+            expression_attribute_values[":sk_val"] = {'S': f"{plant_type.capitalize()}#"}
+        return {
+            'TableName': self.config.tableName,
+            'IndexName': 'GSI_Active_Parcels',
+            'KeyConditionExpression': key_condition_expression,
+            'ExpressionAttributeValues': expression_attribute_values,
+            'ReturnConsumedCapacity': 'Indexes'
+        }
+
+    def _query_active_parcels(self, plant_type=None):
+        # Errors propagate, the parcel index must not cache an empty field
+        paginator = QueryPaginator(self.dynamodb, self.active_parcels_query_params(plant_type))
+        return self.parse_area_response(paginator.all())
+
+    @tracked()
     def get_all_active_parcels_in_field_optionally_by_plant_type(self, plant_type=None):
         try:
-            key_condition_expression = "active = :pk_val"
-            expression_attribute_values = {
-                ":pk_val": {'N': '1'}
-            }
-            if plant_type is not None:
-                key_condition_expression += f" AND begins_with(SK, :sk_val)"
-                expression_attribute_values[":sk_val"] = {'S': f"{plant_type.capitalize()}#"}
-            response = self.dynamodb.query(
-                TableName=self.config.tableName,
-                IndexName='GSI_Active_Parcels',
-                KeyConditionExpression=key_condition_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ReturnConsumedCapacity='Indexes'
-            )
-            items = response.get('Items', [])
-            data = self.parse_area_response(items)
-            return data
+            return self._query_active_parcels(plant_type)
         except (BotoCoreError, ClientError, Exception) as error:
             print(f"An error occurred: {error}")
         return []
 
 
 
+    def all_parcels_query_params(self, plant_type=None):
+        key_condition_expression = "PK = :pk_val"
+        expression_attribute_values = {
+            ":pk_val": {'S': 'Parcel'}
+        }
+        if plant_type is not None:
+            key_condition_expression += " AND begins_with(SK, :sk_val)"
+            expression_attribute_values[":sk_val"] = {'S': f"{plant_type.capitalize()}#"}
+        return {
+            'TableName': self.config.tableName,
+            'KeyConditionExpression': key_condition_expression,
+            'ExpressionAttributeValues': expression_attribute_values,
+            'ReturnConsumedCapacity': 'Indexes'
+        }
+
+    @tracked()
     def get_all_parcels_optionally_by_plant_type(self, plant_type=None):
         try:
-            key_condition_expression = "PK = :pk_val"
-            expression_attribute_values = {
-                ":pk_val": {'S': 'Parcel'}
-            }
-            if plant_type is not None:
-                key_condition_expression += " AND begins_with(SK, :sk_val)"
-                expression_attribute_values[":sk_val"] = {'S': f"{plant_type.capitalize()}#"}
-            response = self.dynamodb.query(
-                TableName=self.config.tableName,
-                KeyConditionExpression=key_condition_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ReturnConsumedCapacity='Indexes'
-            )
-            print(response['ConsumedCapacity']['CapacityUnits'])
+            response = self.dynamodb.query(**self.all_parcels_query_params(plant_type))
             items = response.get('Items', [])
             data = self.parse_area_response(items)
             return data
@@ -184,16 +253,19 @@ class ParcelService:
     def get_all_active_parcels_in_field(self):
         return self.get_all_active_parcels_in_field_optionally_by_plant_type()
 
-    def get_parcel_by_id(self, id):
-        response = self.dynamodb.get_item(
-            TableName=self.config.tableName,
-            Key={
+    def parcel_key_params(self, id):
+        return {
+            'TableName': self.config.tableName,
+            'Key': {
                 self.config.hashKeyAttributeName: {'S': 'Parcel'},
                 self.config.rangeKeyAttributeName: {'S': id}
             },
-            ReturnConsumedCapacity='TOTAL'
-        )
-        print(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    @tracked()
+    def get_parcel_by_id(self, id):
+        response = self.dynamodb.get_item(**self.parcel_key_params(id))
         item = response.get('Item', None)
         if item:
             return self.parse_area_response([item])[0]
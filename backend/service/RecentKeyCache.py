@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Outcomes of RecentKeyCache.claim
+CLAIMED = 'claimed'
+IN_FLIGHT = 'in_flight'
+COMMITTED = 'committed'
+
+
+class EventInFlightError(Exception):
+    """A retried event arrived while the write of its first delivery is still running, the retry must be repeated."""
+
+
+class RecentKeyCache:
+    """
+    Thread-safe LRU map of recently accepted keys with a time-to-live.
+    `claim` reserves a key as in flight; `commit` marks it written once the write succeeded, and `release`
+    frees it again when the write failed so the client's retry goes through. A claim of a committed key is a
+    suppressed duplicate, a claim of an in-flight key is a conflict: its outcome is not known yet.
+    """
+
+    def __init__(self, max_size=100000, ttl_s=900.0):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        # key -> [expires_at, committed]
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'claimed': 0, 'committed': 0, 'suppressed': 0, 'in_flight_conflicts': 0, 'released': 0,
+                       'evicted': 0, 'expired': 0}
+
+    def claim(self, key) -> str:
+        # CLAIMED if the key is now reserved, COMMITTED for a duplicate, IN_FLIGHT while the first write runs
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._keys.move_to_end(key)
+                    if entry[1]:
+                        self._stats['suppressed'] += 1
+                        return COMMITTED
+                    self._stats['in_flight_conflicts'] += 1
+                    return IN_FLIGHT
+                del self._keys[key]
+                self._stats['expired'] += 1
+            self._keys[key] = [now + self.ttl_s, False]
+            self._stats['claimed'] += 1
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+                self._stats['evicted'] += 1
+            return CLAIMED
+
+    def commit(self, key):
+        # The key's write succeeded, later claims within the TTL are duplicates
+        with self._lock:
+            self._keys[key] = [time.monotonic() + self.ttl_s, True]
+            self._keys.move_to_end(key)
+            self._stats['committed'] += 1
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+                self._stats['evicted'] += 1
+
+    def release(self, key):
+        with self._lock:
+            if self._keys.pop(key, None) is not None:
+                self._stats['released'] += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._keys.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'size': len(self._keys), 'capacity': self.max_size, 'ttl_s': self.ttl_s}
@@ -1,6 +1,8 @@
+import threading
+import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import chain
 from typing import Tuple, List, Dict, Optional
 
 import shapely
@@ -10,264 +12,753 @@ from shapely import Point
 
 from backend.models.AggregateData import AggregateData
 from backend.models.SensorEvent import SensorEvent, DataType
+from backend.models.SensorEventColumns import SensorEventColumns
+from backend.models.SensorEventProjection import SensorEventProjection
+from backend.service.AggregateCache import AggregateCache
+from backend.service.EventQueryPlanner import EventQueryPlanner, QueryPlan, PARCEL, PARCEL_TYPE, FIELD, SENSOR
+from backend.service.IncrementalAggregator import IncrementalAggregator, SK_PREFIX as INCREMENTAL_SK_PREFIX
+from backend.service.LatestEventsCache import LatestEventsCache
+from backend.service.RecentKeyCache import RecentKeyCache, EventInFlightError, CLAIMED, COMMITTED, IN_FLIGHT
 from backend.service.SensorService import SensorService
+from backend.service.WriteBehindBuffer import WriteBehindBuffer
 from dynamodbgeo import GeoDataManager, GeoDataManagerConfiguration
 from playground import calculate_pks
-from utils.polygon_def import hashKeyLength, create_dynamodb_client
+from utils.batch_write import batch_write_items, item_key, unique_items, item_errors
+from utils.polygon_def import hashKeyLength, get_shared_dynamodb_client, event_dedup_cache_size, event_dedup_ttl_s, \
+    event_conditional_writes, query_max_concurrency, event_parcel_type_index, latest_events_capacity, \
+    latest_events_max_sensors, latest_events_max_age_s, aggregate_cache_max_entries, aggregate_cache_ttl_s, \
+    event_query_planner, event_planner_sample_s, event_planner_stats_ttl_s, event_planner_max_sample_queries, \
+    incremental_aggregates, incremental_aggregates_flush_s, incremental_aggregates_accuracy
+from utils.fan_out import stream_pages, iter_completed, bounded_map
+from utils.pagination import QueryPaginator
+from utils.projection import with_projection
+from utils.sensor_events import time_utils
+from utils.sensor_events.sharding import event_partition_keys, iter_merge_by_sort_key, merge_by_sort_key, \
+    parcel_type_key
 from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch, get_first_of_month_as_unix_timestamp, \
     format_date
+from utils.tracking import tracked
 
 
 class SensorEventService:
-    def __init__(self):
-        self.dynamodb = create_dynamodb_client()
+    def __init__(self, dynamodb=None, sensor_service=None):
+        self.dynamodb = dynamodb or get_shared_dynamodb_client()
         self.table_name = 'IoT'
         self.config = GeoDataManagerConfiguration(self.dynamodb, self.table_name)
         self.config.hashKeyAttributeName = 'PK'
         self.config.rangeKeyAttributeName = 'SK'
         self.geoDataManager = GeoDataManager(self.config)
         self.config.hashKeyLength = hashKeyLength
-        self.sensor_service=SensorService()
+        self.sensor_service = sensor_service or SensorService(dynamodb=self.dynamodb)
+        self.write_behind = None
+        self.max_concurrency = query_max_concurrency
+        self.parcel_type_index = event_parcel_type_index
+        self.query_planner = EventQueryPlanner(self, event_planner_sample_s, event_planner_stats_ttl_s,
+                                               max_sample_queries=event_planner_max_sample_queries) \
+            if event_query_planner else None
+        self.aggregate_cache = AggregateCache(aggregate_cache_max_entries, aggregate_cache_ttl_s) \
+            if aggregate_cache_max_entries > 0 else None
+        # Latest-N reads are served from memory, fed by the events this service writes
+        self.latest_events = LatestEventsCache(self._load_latest_event_items, latest_events_capacity,
+                                               latest_events_max_sensors, latest_events_max_age_s) \
+            if latest_events_max_sensors > 0 else None
+        # Keys of recently accepted events (SK = Event#<epoch>#<sensorId>), retried deliveries are dropped
+        self.recent_events = RecentKeyCache(event_dedup_cache_size, event_dedup_ttl_s) \
+            if event_dedup_cache_size > 0 else None
+        self.conditional_writes = event_conditional_writes
+        self._counter_lock = threading.Lock()
+        self.conditional_duplicates = 0
+        # Per-day accumulators maintained from the events this service writes, Rain is not aggregated
+        self.incremental_aggregates = IncrementalAggregator(
+            self.dynamodb, self.table_name, incremental_aggregates_accuracy, incremental_aggregates_flush_s,
+            on_flushed=self._incremental_aggregates_flushed, skip_types=[DataType.RAIN.value]) \
+            if incremental_aggregates else None
 
+    @tracked()
     def query_aggregates(self, data_types: List[str] = None, date: str = None,
                          month_year: Optional[Tuple[int, int]] = None):
         try:
-            if data_types is None:
-                raise ValueError("Missing data_types parameter. Please provide the data types to query by.")
-            elif (date is not None and month_year is not None) or (date is None and month_year is None):
-                raise ValueError("Please provide either a date or a month&year, not both or neither.")
-            elif date:
-                day = format_date(date)
-                first_of_month = get_first_of_month_as_unix_timestamp(day)
-                unix_date = convert_to_unix_epoch(day)
-                prefix = 'Day'
-            else:
-                month, year = month_year
-                first_of_month = convert_to_unix_epoch(datetime(year, month, 1)
-                                                       .strftime("%Y-%m-%dT%H:%M:%S"))
-                prefix = 'Month'
-            DataType.validate_data_types(data_types)
-            consumed_capacity = 0
-            with ThreadPoolExecutor(max_workers=len(data_types)) as executor:
-                futures = []
-                for type in data_types:
-                    query_params = {
-                        'TableName': self.table_name,
-                        'KeyConditionExpression': "PK = :pk_val AND SK = :sk_val",
-                        'ExpressionAttributeValues': {
-                            ':pk_val': {'S': f"{type}#{first_of_month}"},
-                            ':sk_val': {'S': f"Agg#{prefix}#{unix_date if prefix == 'Day' else first_of_month}"}
-                        },
-                        'ReturnConsumedCapacity': 'TOTAL'
-                    }
-                    future = executor.submit(self.dynamodb.query, **query_params)
-                    futures.append(future)
-                results = {}
-                for future in as_completed(futures):
-                    response = future.result()
-                    if len(response['Items']) > 0:
-                        items = [AggregateData(item) for item in response.get('Items', [])]
-                        data_type = items[0].pk.split("#")[0]
-                        results[data_type] = items
-                    consumed_capacity += response.get('ConsumedCapacity')['CapacityUnits']
-            print('Consumed Capacity', consumed_capacity)
+            first_of_month, prefix, unix_date = self.resolve_aggregate_period(data_types, date, month_year)
+            period = unix_date if prefix == 'Day' else first_of_month
+            results, missing, generation = self.cached_aggregates(data_types, prefix, period)
+            if not missing:
+                return results
+            closed = self.is_aggregate_period_closed(date, month_year)
+            for index, future in iter_completed(self._query_aggregate_items,
+                                                [(data_type, first_of_month, prefix, period)
+                                                 for data_type in missing],
+                                                len(missing)):
+                items, incremental = future.result()
+                items = [AggregateData(item) for item in items]
+                # Accumulators keep changing with late events, they are only cached for the TTL
+                self.cache_aggregates(missing[index], prefix, period, items, closed and not incremental,
+                                      generation)
+                if len(items) > 0:
+                    results[missing[index]] = items
             return results
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred: {e}")
             return {}
 
+    def _query_aggregate_items(self, data_type, first_of_month, prefix, period):
+        # Returns (Agg# items, whether they were merged from the incremental accumulators)
+        response = self.dynamodb.query(**self.aggregate_query_params(data_type, first_of_month, prefix, period))
+        items = response.get('Items', [])
+        if items or self.incremental_aggregates is None:
+            return items, False
+        paginator = QueryPaginator(self.dynamodb, self.incremental_aggregate_query_params(
+            data_type, first_of_month, prefix, period))
+        return self.incremental_aggregate_items(data_type, first_of_month, prefix, period, paginator.all()), True
+
+    def incremental_aggregate_items(self, data_type, first_of_month, prefix, period, items: List[Dict]):
+        # The accumulator items of the period merged into one Agg# item, [] if they hold no data points
+        item = self.incremental_aggregates.aggregate_item(f"{data_type}#{first_of_month}", f"Agg#{prefix}#{period}",
+                                                          items, period if prefix == 'Day' else None)
+        return [item] if item is not None else []
+
+    def _incremental_aggregates_flushed(self, written):
+        # Cached aggregates of the days and months that received data points are stale
+        for partition_key, day in written:
+            self.invalidate_aggregates('Day', day)
+            self.invalidate_aggregates('Month', int(partition_key.split('#', 1)[1]))
+
+    def incremental_aggregates_stats(self):
+        if self.incremental_aggregates is None:
+            return {'enabled': False}
+        return self.incremental_aggregates.stats()
+
+    def shutdown_incremental_aggregates(self, timeout=None):
+        # Writes the accumulators that are still pending
+        if self.incremental_aggregates is not None:
+            self.incremental_aggregates.close(timeout)
+
+    def cached_aggregates(self, data_types: List[str], prefix, period):
+        # Returns ({data_type: items} served from the cache, data types that have to be queried, cache generation)
+        if self.aggregate_cache is None:
+            return {}, list(data_types), None
+        generation = self.aggregate_cache.generation
+        results, missing = {}, []
+        for data_type in data_types:
+            items = self.aggregate_cache.get((data_type, prefix, period))
+            if items is None:
+                missing.append(data_type)
+            elif items:
+                results[data_type] = list(items)
+        return results, missing, generation
+
+    def cache_aggregates(self, data_type, prefix, period, items: List[AggregateData], closed: bool,
+                         generation: int = None):
+        if self.aggregate_cache is not None:
+            self.aggregate_cache.put((data_type, prefix, period), list(items), closed, generation)
+
+    def invalidate_aggregates(self, prefix, period):
+        # Called after the aggregates of a period were (re)written
+        if self.aggregate_cache is not None:
+            self.aggregate_cache.invalidate_period(prefix, period)
+
+    def query_planner_stats(self):
+        return self.query_planner.stats() if self.query_planner is not None else {'enabled': False}
+
+    def aggregate_cache_stats(self):
+        return self.aggregate_cache.stats() if self.aggregate_cache is not None else {'enabled': False}
+
+    @staticmethod
+    def is_aggregate_period_closed(date: str = None, month_year: Optional[Tuple[int, int]] = None):
+        # A day or month is closed once it has ended, its aggregates no longer change
+        if date:
+            period_end = datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)
+        else:
+            month, year = month_year
+            period_end = datetime(year + month // 12, month % 12 + 1, 1)
+        return convert_to_unix_epoch(period_end) <= time.time()
+
+    @staticmethod
+    def resolve_aggregate_period(data_types: List[str] = None, date: str = None,
+                                 month_year: Optional[Tuple[int, int]] = None):
+        # Returns (first_of_month, 'Day' | 'Month', unix_date) for the requested aggregate period
+        if data_types is None:
+            raise ValueError("Missing data_types parameter. Please provide the data types to query by.")
+        elif (date is not None and month_year is not None) or (date is None and month_year is None):
+            raise ValueError("Please provide either a date or a month&year, not both or neither.")
+        elif date:
+            day = format_date(date)
+            first_of_month = get_first_of_month_as_unix_timestamp(day)
+            unix_date = convert_to_unix_epoch(day)
+            prefix = 'Day'
+        else:
+            month, year = month_year
+            first_of_month = convert_to_unix_epoch(datetime(year, month, 1)
+                                                   .strftime("%Y-%m-%dT%H:%M:%S"))
+            unix_date = None
+            prefix = 'Month'
+        DataType.validate_data_types(data_types)
+        return first_of_month, prefix, unix_date
+
+    # Query parameter builders, shared with the asyncio data layer in backend/service/aio
+    def aggregate_query_params(self, data_type, first_of_month, prefix, period):
+        return {
+            'TableName': self.table_name,
+            'KeyConditionExpression': "PK = :pk_val AND SK = :sk_val",
+            'ExpressionAttributeValues': {
+                ':pk_val': {'S': f"{data_type}#{first_of_month}"},
+                ':sk_val': {'S': f"Agg#{prefix}#{period}"}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    def incremental_aggregate_query_params(self, data_type, first_of_month, prefix, period):
+        # The field and parcel accumulators of one day, or of every day of the month
+        sort_key_prefix = f"{INCREMENTAL_SK_PREFIX}{period}" if prefix == 'Day' else INCREMENTAL_SK_PREFIX
+        return {
+            'TableName': self.table_name,
+            'KeyConditionExpression': "PK = :pk_val AND begins_with(SK, :sk_prefix)",
+            'ExpressionAttributeValues': {
+                ':pk_val': {'S': f"{data_type}#{first_of_month}"},
+                ':sk_prefix': {'S': sort_key_prefix}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    def parcel_events_query_params(self, parcel_id, start_range_unix, end_range_unix,
+                                   sensor_type_filters: List[str] = None, fields: List[str] = None):
+        query_params = {
+            'TableName': self.table_name,
+            'IndexName': 'GSI_AllSensorEvents_Parcel',
+            'KeyConditionExpression': "parcel_id = :pid AND SK BETWEEN :start_range AND :end_range",
+            'ExpressionAttributeValues': {
+                ':pid': {'S': parcel_id},
+                ':start_range': {'S': f"Event#{start_range_unix}#"},
+                ':end_range': {'S': f"Event#{end_range_unix}#"}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        if sensor_type_filters:
+            type_filter_expressions = []
+            for i, sensor_type in enumerate(sensor_type_filters):
+                type_key_placeholder = f":typeval{i}"
+                query_params['ExpressionAttributeValues'][type_key_placeholder] = {'S': sensor_type}
+                type_filter_expressions.append(f"data_type = {type_key_placeholder}")
+            query_params['FilterExpression'] = " OR ".join(type_filter_expressions)
+        return self.event_projection(query_params, fields)
+
+    def parcel_type_events_query_params(self, parcel_id, data_type, start_range_unix, end_range_unix,
+                                        fields: List[str] = None):
+        # Reads only the events of one data type, unlike a FilterExpression that pays for the others too
+        return self.event_projection({
+            'TableName': self.table_name,
+            'IndexName': 'GSI_Events_By_Parcel_Type',
+            'KeyConditionExpression': "parcel_type = :ptype AND SK BETWEEN :start_range AND :end_range",
+            'ExpressionAttributeValues': {
+                ':ptype': {'S': parcel_type_key(parcel_id, data_type)},
+                ':start_range': {'S': f"Event#{start_range_unix}#"},
+                ':end_range': {'S': f"Event#{end_range_unix}#"}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }, fields)
+
+    def field_events_query_params(self, partition_key, start_range_unix, end_range_unix, start_after: str = None,
+                                  fields: List[str] = None, parcel_id: str = None):
+        # start_after: SK of the last event already seen, the range then starts right behind it
+        query_params = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': f"PK = :pval AND SK BETWEEN :sval AND :eval",
+            'ExpressionAttributeValues': {
+                ':pval': {'S': partition_key},
+                ':sval': {'S': f'{start_after}\x00' if start_after else f'Event#{start_range_unix}#'},
+                ':eval': {'S': f'Event#{end_range_unix}#'}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        return self.event_projection(self.parcel_filter(query_params, parcel_id), fields)
+
+    def sensor_events_query_params(self, sensor_id, start_range_unix, end_range_unix, fields: List[str] = None,
+                                   parcel_id: str = None):
+        query_params = {
+            'TableName': self.table_name,
+            'IndexName': 'GSI_Events_By_Sensor',
+            'KeyConditionExpression': f"s_id = :pval AND SK BETWEEN :sval AND :eval",
+            'ExpressionAttributeValues': {
+                ':pval': {'S': f"Event#{sensor_id}"},
+                ':sval': {'S': f"Event#{start_range_unix}"},
+                ':eval': {'S': f"Event#{end_range_unix}"}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        return self.event_projection(self.parcel_filter(query_params, parcel_id), fields)
+
+    @staticmethod
+    def parcel_filter(query_params, parcel_id: str = None):
+        # Keeps only the events recorded in the parcel, used when the key does not select it
+        if parcel_id is not None:
+            query_params['FilterExpression'] = 'parcel_id = :pid'
+            query_params['ExpressionAttributeValues'][':pid'] = {'S': parcel_id}
+        return query_params
+
+    def latest_events_query_params(self, sensor_id, limit, fields: List[str] = None):
+        return self.event_projection({
+            'TableName': self.table_name,
+            'IndexName': 'GSI_Events_By_Sensor',
+            'KeyConditionExpression': f"s_id = :pval AND begins_with(SK, :skval)",
+            'ExpressionAttributeValues': {
+                ':pval': {'S': f"Event#{sensor_id}"},
+                ':skval': {'S': 'Event#'}
+            },
+            'ScanIndexForward': False,
+            'Limit': limit,
+            'ReturnConsumedCapacity': 'TOTAL'
+        }, fields)
+
+    # Field selection: `fields` names the event attributes to read (SensorEventProjection.FIELDS), keys are
+    # always read. Projected queries return SensorEventProjection instead of SensorEvent.
+    @staticmethod
+    def event_projection(params, fields: List[str] = None):
+        return with_projection(params, SensorEventProjection.validate_fields(fields))
+
+    @staticmethod
+    def event_decoder(fields: List[str] = None):
+        return SensorEvent.from_entity if fields is None else SensorEventProjection.from_entity
+
+    @tracked()
     def query_events_in_rectangle_for_timerange(self, polygon_coords: List[Tuple[float, float]],
-                                                from_date: str, to_date: str):
+                                                from_date: str, to_date: str, errors: Dict[str, str] = None,
+                                                fields: List[str] = None):
+        # Pass a dict as `errors` to receive the sensors whose events could not be read (sensor_id -> error)
         try:
-            from backend.service.SensorService import SensorService
-            sensor_service = SensorService()
-            active_sensors_in_rectangle = (sensor_service
+            active_sensors_in_rectangle = (self.sensor_service
                                            .get_active_sensors_in_rectangle_for_time_range(polygon_coords,
                                                                                            from_date, to_date))
-            grouped_items = defaultdict(list)
-            for active_sensor in active_sensors_in_rectangle:
-                sensor_events = self.query_sensorevents_by_sensorid_in_time_range(active_sensor.sensor_id,
-                                                                                  from_date, to_date)
-                grouped_items[active_sensor.sensor_type].extend(sensor_events)
-            return grouped_items
+            return self._query_events_of_sensors(active_sensors_in_rectangle, from_date, to_date, errors, fields)
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred: {e}")
             return {}
 
-    def query_sensor_events_by_parcelid_in_time_range(self, parcel_id, from_date, to_date,
-                                                      sensor_type_filters: List[str] = None):
+    def _query_events_of_sensors(self, active_sensors, from_date, to_date, errors: Dict[str, str] = None,
+                                 fields: List[str] = None):
+        """
+        Queries the events of every sensor on the shared query pool, at most max_concurrency at a time.
+        Events are grouped by sensor type as each sensor finishes; a failing sensor is recorded in `errors`
+        instead of aborting the others.
+        """
         start_range_unix = convert_to_unix_epoch(from_date)
         end_range_unix = convert_to_unix_epoch(to_date)
+        decode = self.event_decoder(fields)
+        grouped_items = defaultdict(list)
+        failed = {}
+        total = 0
+        for index, future in iter_completed(self._query_sensor_event_items,
+                                            [(sensor.sensor_id, start_range_unix, end_range_unix, fields)
+                                             for sensor in active_sensors],
+                                            self.max_concurrency):
+            sensor = active_sensors[index]
+            try:
+                items = future.result()
+            except (ClientError, BotoCoreError, Exception) as e:
+                failed[sensor.sensor_id] = str(e)
+                continue
+            grouped_items[sensor.sensor_type].extend(map(decode, items))
+            total += len(items)
+        if failed:
+            print(f"Events of {len(failed)} of {len(active_sensors)} sensors could not be retrieved")
+        if errors is not None:
+            errors.update(failed)
+        print(f"Total {total}")
+        return grouped_items
+
+    @tracked()
+    def query_sensor_events_by_parcelid_in_time_range(self, parcel_id, from_date, to_date,
+                                                      sensor_type_filters: List[str] = None, columnar=False,
+                                                      fields: List[str] = None, current_sensors_only=False):
+        """
+        columnar=True returns one SensorEventColumns (with a data_type column) instead of events grouped by type.
+        The access path is chosen by the query planner; current_sensors_only=True additionally lets it read
+        per sensor, which only reaches the sensors placed in the parcel now (not those moved away during the range).
+        """
         try:
-            query_params = {
-                'TableName': self.table_name,
-                'IndexName': 'GSI_AllSensorEvents_Parcel',
-                'KeyConditionExpression': "parcel_id = :pid AND SK BETWEEN :start_range AND :end_range",
-                'ExpressionAttributeValues': {
-                    ':pid': {'S': parcel_id},
-                    ':start_range': {'S': f"Event#{start_range_unix}#"},
-                    ':end_range': {'S': f"Event#{end_range_unix}#"}
-                },
-                'ReturnConsumedCapacity': 'TOTAL'
-            }
             if sensor_type_filters:
-                type_filter_expressions = []
-                for i, sensor_type in enumerate(sensor_type_filters):
-                    type_key_placeholder = f":typeval{i}"
-                    query_params['ExpressionAttributeValues'][type_key_placeholder] = {'S': sensor_type}
-                    type_filter_expressions.append(f"data_type = {type_key_placeholder}")
-                query_params['FilterExpression'] = " OR ".join(type_filter_expressions)
-            response = self.dynamodb.query(**query_params)
-            items = [SensorEvent.from_entity(item) for item in response.get('Items', [])]
-            consumed_capacity = response.get('ConsumedCapacity')['CapacityUnits']
-            print('Consumed Capacity', consumed_capacity)
+                DataType.validate_data_types(sensor_type_filters)
+            start_range_unix = convert_to_unix_epoch(from_date)
+            end_range_unix = convert_to_unix_epoch(to_date)
+            if self.query_planner is not None:
+                plan = self.query_planner.plan_parcel_events(parcel_id, start_range_unix, end_range_unix,
+                                                             sensor_type_filters, current_sensors_only)
+            else:
+                plan = QueryPlan(PARCEL_TYPE if sensor_type_filters and self.parcel_type_index else PARCEL)
+            items = self._query_parcel_items_by_plan(plan, parcel_id, from_date, to_date, sensor_type_filters,
+                                                     fields)
+            if columnar:
+                return SensorEventColumns.from_entities(items, fields)
+            decode = self.event_decoder(fields)
             grouped_items = defaultdict(list)
             for item in items:
-                grouped_items[item.data.dataType].append(item)
+                # The partition key starts with the data type, whether or not data_type was projected
+                grouped_items[item['PK']['S'].split('#', 1)[0]].append(decode(item))
             return grouped_items
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred: {e}")
-            return {}
+            return SensorEventColumns.empty() if columnar else {}
+
+    def _query_parcel_items_by_plan(self, plan: QueryPlan, parcel_id, from_date, to_date,
+                                    data_types: List[str] = None, fields=None):
+        # Runs the planned access path, returns the items in SK order
+        if plan.path == PARCEL_TYPE:
+            return self._query_parcel_items_by_type(parcel_id, from_date, to_date, data_types, fields)
+        start_range_unix = convert_to_unix_epoch(from_date)
+        end_range_unix = convert_to_unix_epoch(to_date)
+        if plan.path == FIELD:
+            return merge_by_sort_key([list(self._iter_field_event_items(from_date, to_date, data_type,
+                                                                        fields=fields, parcel_id=parcel_id))
+                                      for data_type in dict.fromkeys(data_types)])
+        if plan.path == SENSOR:
+            return merge_by_sort_key(bounded_map(self._query_sensor_event_items,
+                                                 [(sensor_id, start_range_unix, end_range_unix, fields, parcel_id)
+                                                  for sensor_id in plan.sensor_ids],
+                                                 self.max_concurrency))
+        paginator = QueryPaginator(self.dynamodb, self.parcel_events_query_params(
+            parcel_id, start_range_unix, end_range_unix, data_types, fields))
+        return paginator.all()
+
+    def _query_parcel_items_by_type(self, parcel_id, from_date, to_date, data_types: List[str], fields=None):
+        # One fully paged query per data type, run concurrently; the results are merged back into SK order
+        DataType.validate_data_types(data_types)
+        start_range_unix = convert_to_unix_epoch(from_date)
+        end_range_unix = convert_to_unix_epoch(to_date)
+        results = bounded_map(self._query_parcel_type_items,
+                              [(parcel_id, data_type, start_range_unix, end_range_unix, fields)
+                               for data_type in dict.fromkeys(data_types)],
+                              self.max_concurrency)
+        return merge_by_sort_key(results)
+
+    def _query_parcel_type_items(self, parcel_id, data_type, start_range_unix, end_range_unix, fields=None):
+        paginator = QueryPaginator(self.dynamodb, self.parcel_type_events_query_params(
+            parcel_id, data_type, start_range_unix, end_range_unix, fields))
+        return paginator.all()
+
+    def uses_parcel_type_index(self, sensor_type_filters: List[str] = None):
+        # A single type is read from the parcel/type index, several types are filtered on the parcel index
+        return bool(sensor_type_filters) and len(set(sensor_type_filters)) == 1 and self.parcel_type_index
+
+    # Lazy variants: iterate for SensorEvents, .pages() for lists per page, last_evaluated_key to resume
+    def iter_sensor_events_by_parcelid_in_time_range(self, parcel_id, from_date, to_date,
+                                                     sensor_type_filters: List[str] = None, max_items=None,
+                                                     page_size=None, start_key=None, fields: List[str] = None,
+                                                     decode=True) -> QueryPaginator:
+        if self.uses_parcel_type_index(sensor_type_filters):
+            DataType.validate_data_types(sensor_type_filters)
+            query_params = self.parcel_type_events_query_params(parcel_id, sensor_type_filters[0],
+                                                                convert_to_unix_epoch(from_date),
+                                                                convert_to_unix_epoch(to_date), fields)
+        else:
+            query_params = self.parcel_events_query_params(parcel_id, convert_to_unix_epoch(from_date),
+                                                           convert_to_unix_epoch(to_date), sensor_type_filters,
+                                                           fields)
+        return QueryPaginator(self.dynamodb, query_params, decode=self.event_decoder(fields) if decode else None,
+                              max_items=max_items, page_size=page_size, start_key=start_key)
 
-    def query_sensor_events_for_field_in_time_range_by_type(self, start_range, end_range, data_type):
+    def iter_sensorevents_by_sensorid_in_time_range(self, sensor_id, start_range, end_range, max_items=None,
+                                                    page_size=None, start_key=None, fields: List[str] = None,
+                                                    decode=True) -> QueryPaginator:
+        query_params = self.sensor_events_query_params(sensor_id, convert_to_unix_epoch(start_range),
+                                                       convert_to_unix_epoch(end_range), fields)
+        return QueryPaginator(self.dynamodb, query_params, decode=self.event_decoder(fields) if decode else None,
+                              max_items=max_items, page_size=page_size, start_key=start_key)
+
+    def iter_latest_sensorevents_by_sensorid(self, sensor_id, max_items=None, page_size=None, start_key=None,
+                                             fields: List[str] = None, decode=True) -> QueryPaginator:
+        # Newest first
+        query_params = self.latest_events_query_params(sensor_id, None, fields)
+        del query_params['Limit']
+        return QueryPaginator(self.dynamodb, query_params, decode=self.event_decoder(fields) if decode else None,
+                              max_items=max_items, page_size=page_size, start_key=start_key)
+
+    def iter_sensor_events_for_field_in_time_range_by_type(self, start_range, end_range, data_type,
+                                                          max_items=None, start_after: str = None,
+                                                          fields: List[str] = None, decode=True):
+        """
+        Yields the SensorEvents of the whole field in time order, spanning month partitions and write shards.
+        Memory stays bounded: every partition buffers at most a couple of pages ahead of the consumer.
+        To resume, pass the SK of the last event received (Event#<epoch>#<sensorId>) as start_after.
+        decode=False yields the wire items.
+        """
+        decode = self.event_decoder(fields) if decode else (lambda item: item)
+        items = self._iter_field_event_items(start_range, end_range, data_type, start_after, fields)
+        try:
+            for count, item in enumerate(items):
+                if max_items is not None and count >= max_items:
+                    break
+                yield decode(item)
+        finally:
+            items.close()
+
+    @tracked()
+    def query_sensor_events_for_field_in_time_range_by_type(self, start_range, end_range, data_type, columnar=False,
+                                                            fields: List[str] = None):
         try:
-            pks = calculate_pks(start_range, end_range)
-            start_range_unix = convert_to_unix_epoch(start_range)
-            end_range_unix = convert_to_unix_epoch(end_range)
-            items = []
-            consumed_capacity = 0
-            network_calls_count = 0
-            for pk in pks:
-                first_of_month = get_first_of_month_as_unix_timestamp(pk)
-                last_evaluated_key = None
-                while True:
-                    query_params = {
-                        'TableName': self.table_name,
-                        'KeyConditionExpression': f"PK = :pval AND SK BETWEEN :sval AND :eval",
-                        'ExpressionAttributeValues': {
-                            ':pval': {'S': f"{data_type}#{first_of_month}"},
-                            ':sval': {'S': f'Event#{start_range_unix}#'},
-                            ':eval': {'S': f'Event#{end_range_unix}#'}
-                        },
-                        'ReturnConsumedCapacity': 'TOTAL'
-                    }
-                    if last_evaluated_key:
-                        query_params['ExclusiveStartKey'] = last_evaluated_key
-                    response = self.dynamodb.query(**query_params)
-                    items.extend(response.get('Items', []))
-                    consumed_capacity += response.get('ConsumedCapacity')['CapacityUnits']
-                    network_calls_count += 1
-                    last_evaluated_key = response.get('LastEvaluatedKey')
-                    if not last_evaluated_key:
-                        break
-            print('Consumed Capacity', consumed_capacity)
-            return [SensorEvent.from_entity(item) for item in items]
+            items = list(self._iter_field_event_items(start_range, end_range, data_type, fields=fields))
+            if columnar:
+                return SensorEventColumns.from_entities(items, fields)
+            return list(map(self.event_decoder(fields), items))
         except (ClientError, BotoCoreError, ValueError, Exception) as e:
             print("Boto3 client error:", e)
-            return []
+            return SensorEventColumns.empty() if columnar else []
 
-    def query_sensorevents_by_sensorid_in_time_range(self, sensor_id, start_range, end_range):
+    def _iter_field_event_items(self, start_range, end_range, data_type, start_after: str = None,
+                                fields: List[str] = None, parcel_id: str = None):
+        """
+        Yields the event items of all month partitions (and their write shards) in time order.
+        All partitions are queried concurrently on the shared query pool, at most max_concurrency at a time,
+        and their pages are consumed as they arrive: month partitions are disjoint and follow each other,
+        the shards of one month are k-way merged by SK. Producers block once they are two pages ahead, so
+        the closing of the returned generator (or its consumer falling behind) stops further queries.
+        """
+        if start_after:
+            # Months before the resume point hold nothing new
+            start_range = time_utils.epoch_to_iso(int(start_after.split('#')[1]))
+        start_range_unix = convert_to_unix_epoch(start_range)
+        end_range_unix = convert_to_unix_epoch(end_range)
+        query_fields = SensorEventProjection.validate_fields(fields)
+        months = [event_partition_keys(data_type, get_first_of_month_as_unix_timestamp(pk))
+                  for pk in calculate_pks(start_range, end_range)]
+        # The merge of a month reads from all its shards at once, their producers must all be able to run:
+        # with bounded stream buffers a shard waiting for a pool slot would block the month's producers forever
+        streams = stream_pages(self._iter_event_partition_pages,
+                               [(partition_key, start_range_unix, end_range_unix, start_after, query_fields,
+                                 parcel_id)
+                                for partition_keys in months for partition_key in partition_keys],
+                               max(self.max_concurrency, max(map(len, months), default=1)))
         try:
-            start_range_unix = convert_to_unix_epoch(start_range)
-            end_range_unix = convert_to_unix_epoch(end_range)
-            last_evaluated_key = None
-            all_items = []
-            consumed_capacity=0
-            while True:
-                if last_evaluated_key:
-                    response = self.dynamodb.query(
-                        TableName=self.table_name,
-                        IndexName='GSI_Events_By_Sensor',
-                        KeyConditionExpression=f"s_id = :pval AND SK BETWEEN :sval AND :eval",
-                        ExpressionAttributeValues={
-                            ':pval': {'S': f"Event#{sensor_id}"},
-                            ':sval': {'S': f"Event#{start_range_unix}"},
-                            ':eval': {'S': f"Event#{end_range_unix}"}
-                        },
-                        ReturnConsumedCapacity='TOTAL',
-                        ExclusiveStartKey=last_evaluated_key
-                    )
-                else:
-                    response = self.dynamodb.query(
-                        TableName=self.table_name,
-                        IndexName='GSI_Events_By_Sensor',
-                        KeyConditionExpression=f"s_id = :pval AND SK BETWEEN :sval AND :eval",
-                        ExpressionAttributeValues={
-                            ':pval': {'S': f"Event#{sensor_id}"},
-                            ':sval': {'S': f"Event#{start_range_unix}"},
-                            ':eval': {'S': f"Event#{end_range_unix}"}
-                        },
-                        ReturnConsumedCapacity='TOTAL'
-                    )
-                consumed_capacity += response.get('ConsumedCapacity')['CapacityUnits']
-                items = response.get('Items', [])
-                all_items.extend(items)
-                print('Consumed Capacity', consumed_capacity)
-                last_evaluated_key = response.get('LastEvaluatedKey')
-                if not last_evaluated_key:
-                    break
-            return [SensorEvent.from_entity(item) for item in all_items]
+            offset = 0
+            for partition_keys in months:
+                month_streams = streams[offset:offset + len(partition_keys)]
+                offset += len(partition_keys)
+                yield from iter_merge_by_sort_key([chain.from_iterable(stream) for stream in month_streams])
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def _iter_event_partition_pages(self, partition_key, start_range_unix, end_range_unix, start_after=None,
+                                    fields=None, parcel_id=None):
+        # Yields the items of one event partition page by page
+        paginator = QueryPaginator(self.dynamodb, self.field_events_query_params(partition_key, start_range_unix,
+                                                                                 end_range_unix, start_after,
+                                                                                 fields, parcel_id))
+        yield from paginator.raw_pages()
+
+    def _query_sensor_event_items(self, sensor_id, start_range_unix, end_range_unix, fields=None, parcel_id=None):
+        # Pages the sensor's events to completion; errors propagate
+        paginator = QueryPaginator(self.dynamodb, self.sensor_events_query_params(sensor_id, start_range_unix,
+                                                                                  end_range_unix, fields,
+                                                                                  parcel_id))
+        return paginator.all()
+
+    @tracked()
+    def query_sensorevents_by_sensorid_in_time_range(self, sensor_id, start_range, end_range, columnar=False,
+                                                     fields: List[str] = None):
+        try:
+            all_items = self._query_sensor_event_items(sensor_id, convert_to_unix_epoch(start_range),
+                                                       convert_to_unix_epoch(end_range), fields)
+            if columnar:
+                return SensorEventColumns.from_entities(all_items, fields)
+            return list(map(self.event_decoder(fields), all_items))
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred while retrieving sensor events for sensor {sensor_id}:", e)
-            return []
+            return SensorEventColumns.empty() if columnar else []
+
+    def _claim_event(self, entry) -> str:
+        # CLAIMED, COMMITTED for an accepted duplicate or IN_FLIGHT while the first delivery is being written
+        if self.recent_events is None:
+            return CLAIMED
+        return self.recent_events.claim(entry['SK']['S'])
+
+    def _commit_event(self, entry):
+        if self.recent_events is not None:
+            self.recent_events.commit(entry['SK']['S'])
+
+    def _release_event(self, entry):
+        if self.recent_events is not None:
+            self.recent_events.release(entry['SK']['S'])
+
+    def begin_sensor_event_write(self, sensor_event):
+        """
+        Claims the event's key before it is put. Returns the entity and the put_item parameters,
+        or None as parameters for an event that was already written.
+        Raises EventInFlightError for a retry that arrives while the first delivery is still being written.
+        Shared with AsyncSensorEventService, which awaits the put itself.
+        """
+        sensor_event_entry = sensor_event.to_entity()
+        claim = self._claim_event(sensor_event_entry)
+        if claim == COMMITTED:
+            return sensor_event_entry, None
+        if claim == IN_FLIGHT:
+            raise EventInFlightError(f"Sensor event {sensor_event_entry['SK']['S']} is still being written")
+        put_params = {'TableName': self.table_name, 'Item': sensor_event_entry}
+        if self.conditional_writes:
+            put_params['ConditionExpression'] = 'attribute_not_exists(SK)'
+        return sensor_event_entry, put_params
+
+    def finish_sensor_event_write(self, sensor_event_entry, error=None):
+        # Records the outcome of the put prepared by begin_sensor_event_write, returns the s_id or None if it failed
+        if error is None:
+            self._record_written(sensor_event_entry)
+            return sensor_event_entry['s_id']
+        if isinstance(error, ClientError) and error.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            with self._counter_lock:
+                self.conditional_duplicates += 1
+            self._commit_event(sensor_event_entry)
+            return sensor_event_entry['s_id']
+        self._release_event(sensor_event_entry)
+        print(f"Error adding sensor event to DB: {error}")
+        return None
 
+    @tracked()
     def add_sensor_event(self, sensor_event):
-        try:
-            sensor_event_entry = sensor_event.to_entity()
-            self.dynamodb.put_item(TableName=self.table_name, Item=sensor_event_entry)
+        """
+        Idempotent: an event that was already written is acknowledged without writing it again.
+        Raises EventInFlightError for a retry that arrives while the first delivery is still being written.
+        """
+        sensor_event_entry, put_params = self.begin_sensor_event_write(sensor_event)
+        if put_params is None:
             return sensor_event_entry['s_id']
+        try:
+            self.dynamodb.put_item(**put_params)
         except (ClientError, BotoCoreError, Exception) as e:
-            print(f"Error adding sensor event to DB: {e}")
-            return None
+            return self.finish_sensor_event_write(sensor_event_entry, e)
+        return self.finish_sensor_event_write(sensor_event_entry)
+
+    def _record_written(self, entry):
+        # Commits the event's key and feeds the in-memory views of the events this process wrote
+        self._commit_event(entry)
+        if self.latest_events is not None:
+            self.latest_events.record(entry)
+        if self.incremental_aggregates is not None:
+            self.incremental_aggregates.record(entry)
+
+    def idempotency_stats(self):
+        stats = self.recent_events.stats() if self.recent_events is not None else {'enabled': False}
+        return {**stats, 'conditional_writes': self.conditional_writes,
+                'conditional_duplicates': self.conditional_duplicates}
+
+    @tracked()
+    def add_sensor_events(self, sensor_events: List[SensorEvent]):
+        """
+        Batch counterpart of add_sensor_event: writes the events with parallel BatchWriteItem calls.
+        Returns one result dict per event in input order with its status, s_id and error (if any).
+        """
+        results = []
+        entries = []
+        seen_keys = {}
+        for sensor_event in sensor_events:
+            entry = sensor_event.to_entity()
+            key = item_key(entry)
+            if key in seen_keys:
+                # BatchWriteItem rejects a whole request if it contains the same key twice
+                results.append({'status': 'duplicate', 's_id': entry['s_id']['S'],
+                                'error': f"Duplicate of event at index {seen_keys[key]}"})
+                continue
+            claim = self._claim_event(entry)
+            if claim == COMMITTED:
+                results.append({'status': 'duplicate', 's_id': entry['s_id']['S'],
+                                'error': "Event was already ingested"})
+                continue
+            if claim == IN_FLIGHT:
+                # Retryable: the first delivery may still fail
+                results.append({'status': 'in_flight', 's_id': entry['s_id']['S'],
+                                'error': "Event is still being written, retry later"})
+                continue
+            seen_keys[key] = len(results)
+            results.append({'status': 'pending', 's_id': entry['s_id']['S'], 'error': None})
+            entries.append(entry)
+        errors = batch_write_items(self.dynamodb, self.table_name, entries)
+        entry_errors = dict(zip((item_key(entry) for entry in entries), errors))
+        for entry, error in zip(entries, errors):
+            if error:
+                self._release_event(entry)
+            else:
+                self._record_written(entry)
+        for key, index in seen_keys.items():
+            error = entry_errors.get(key)
+            results[index]['status'] = 'failed' if error else 'written'
+            results[index]['error'] = error
+        print(f"Batch wrote {len(entries) - sum(1 for e in errors if e)} of {len(sensor_events)} sensor events")
+        return results
+
+    @tracked()
+    def write_entities(self, entities: List[Dict]):
+        # BatchWriteItem rejects requests containing the same key twice, the last entity per key is written
+        unique_entities = unique_items(entities)
+        errors = batch_write_items(self.dynamodb, self.table_name, unique_entities)
+        return item_errors(entities, dict(zip(map(item_key, unique_entities), errors)))
+
+    def enable_write_behind(self, max_queue_size=10000, flush_size=25, max_delay_s=0.5, workers=2,
+                            dead_letter_file=None):
+        """
+        Opt-in write-behind mode: enqueue_sensor_event only buffers the entity,
+        background workers persist it in batches. Call shutdown_write_behind to drain the queue.
+        Entities that fail every retry are appended to `dead_letter_file` until they are retried.
+        """
+        if self.write_behind is None:
+            self.write_behind = WriteBehindBuffer(self._write_buffered_entities, max_queue_size=max_queue_size,
+                                                  flush_size=flush_size, max_delay_s=max_delay_s, workers=workers,
+                                                  dead_letter_file=dead_letter_file)
+        return self.write_behind
+
+    def _write_buffered_entities(self, entities: List[Dict]):
+        errors = self.write_entities(entities)
+        for entity, error in zip(entities, errors):
+            if error:
+                self._release_event(entity)
+            else:
+                self._record_written(entity)
+        return errors
 
+    def enqueue_sensor_event(self, sensor_event):
+        # Written duplicates count as accepted, a duplicate of a queued event raises EventInFlightError
+        if self.write_behind is None:
+            raise RuntimeError("Write-behind mode is not enabled")
+        entry = sensor_event.to_entity()
+        claim = self._claim_event(entry)
+        if claim == COMMITTED:
+            return True
+        if claim == IN_FLIGHT:
+            raise EventInFlightError(f"Sensor event {entry['SK']['S']} is queued and not written yet")
+        if not self.write_behind.offer(entry):
+            self._release_event(entry)
+            return False
+        return True
+
+    def shutdown_write_behind(self, timeout=None):
+        if self.write_behind is not None:
+            self.write_behind.close(timeout)
+            stats = self.write_behind.stats()
+            print(f"Write-behind drained: {stats['written']} written, {stats['failed']} failed, "
+                  f"{stats['dead_letters']} dead letters"
+                  f"{f' kept in {self.write_behind.dead_letter_file}' if self.write_behind.dead_letter_file else ''}")
+
+    @tracked()
     def add_records(self, records: List[Dict]):
         self.dynamodb.transact_write_items(TransactItems=records)
 
-    def query_latest_n_sensorevents_by_sensorid(self, sensor_id, n):
+    @tracked()
+    def query_latest_n_sensorevents_by_sensorid(self, sensor_id, n, fields: List[str] = None):
         try:
-            items = []
-            last_evaluated_key = None
-            remaining_items = n
-            consumed_capacity=0
-            while remaining_items > 0:
-                if last_evaluated_key:
-                    response = self.dynamodb.query(
-                        TableName=self.table_name,
-                        IndexName='GSI_Events_By_Sensor',
-                        KeyConditionExpression=f"s_id = :pval",
-                        ExpressionAttributeValues={
-                            ':pval': {'S': f"Event#{sensor_id}"}
-                        },
-                        ScanIndexForward=False,
-                        Limit=remaining_items,
-                        ExclusiveStartKey=last_evaluated_key,
-                        ReturnConsumedCapacity='TOTAL'
-                    )
-                else:
-                    response = self.dynamodb.query(
-                        TableName=self.table_name,
-                        IndexName='GSI_Events_By_Sensor',
-                        KeyConditionExpression=f"s_id = :pval AND begins_with(SK, :skval)",
-                        ExpressionAttributeValues={
-                            ':pval': {'S': f"Event#{sensor_id}"},
-                            ':skval': {'S': 'Event#'}
-                        },
-                        ScanIndexForward=False,
-                        Limit=remaining_items,
-                        ReturnConsumedCapacity='TOTAL'
-                    )
-                batch_items = response.get('Items', [])
-                items.extend(batch_items)
-                remaining_items -= len(batch_items)
-                consumed_capacity += response.get('ConsumedCapacity')['CapacityUnits']
-                print('Consumed Capacity', consumed_capacity)
-                last_evaluated_key = response.get('LastEvaluatedKey')
-                if not last_evaluated_key:
-                    break
-            return [SensorEvent.from_entity(item) for item in items]
+            if self.latest_events is not None:
+                return list(map(self.event_decoder(fields), self.latest_events.latest(sensor_id, n)))
+            paginator = self.iter_latest_sensorevents_by_sensorid(sensor_id, max_items=n, fields=fields)
+            return paginator.all()
         except (ClientError, BotoCoreError, Exception) as e:
             print("Boto3 client error:", e)
-            return [], None
+            return []
+
+    def query_last_sensorevent_by_sensorid(self, sensor_id):
+        # The sensor's most recent reading, None if it has none or it could not be read
+        sensor_events = self.query_latest_n_sensorevents_by_sensorid(sensor_id, 1)
+        return sensor_events[0] if sensor_events else None
+
+    def _load_latest_event_items(self, sensor_id, n):
+        paginator = self.iter_latest_sensorevents_by_sensorid(sensor_id, max_items=n, decode=False)
+        return paginator.all()
+
+    def latest_events_stats(self):
+        return self.latest_events.stats() if self.latest_events is not None else {'enabled': False}
 
     def get_previous_month_timestamp(self, current_month_unix_timestamp):
         current_month_datetime = datetime.fromtimestamp(current_month_unix_timestamp)
@@ -275,23 +766,17 @@ class SensorEventService:
         first_day_of_previous_month = first_day_of_current_month - relativedelta(months=1)
         return int(first_day_of_previous_month.timestamp())
 
+    @tracked()
     def query_events_in_radius_for_timerange(self,
                                 center_point: shapely.geometry.point.Point,
                                 radius_meters: float,
                                 from_date,
-                                to_date):
+                                to_date,
+                                errors: Dict[str, str] = None,
+                                fields: List[str] = None):
         try:
-            from backend.service.SensorService import SensorService
-            sensor_service = SensorService()
-            active_sensors_in_radius = sensor_service.get_active_sensors_in_radius_for_time_range(center_point, radius_meters, from_date, to_date)
-            total = 0
-            grouped_items = defaultdict(list)
-            for active_sensor in active_sensors_in_radius:
-                sensor_events = self.query_sensorevents_by_sensorid_in_time_range(active_sensor.sensor_id, from_date, to_date)
-                total+=len(sensor_events)
-                grouped_items[active_sensor.sensor_type].append(sensor_events)
-            print(f"Total {total}")
-            return grouped_items
+            active_sensors_in_radius = self.sensor_service.get_active_sensors_in_radius_for_time_range(center_point, radius_meters, from_date, to_date)
+            return self._query_events_of_sensors(active_sensors_in_radius, from_date, to_date, errors, fields)
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred: {e}")
             return {}
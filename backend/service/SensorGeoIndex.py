@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def item_key(item) -> Tuple[str, str]:
+    return item['PK']['S'], item['SK']['S']
+
+
+def item_lat_lon(item) -> Tuple[float, float]:
+    lat, lon = item['geoJson']['S'].split(',')
+    return float(lat), float(lon)
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+# Predicates mirroring the GSI sort key prefixes and filter expressions of the SensorService geo queries
+def metadata_of_type(sensor_type: str = None):
+    prefix = f"Metadata#{sensor_type}#" if sensor_type else "Metadata#"
+    return lambda item: item['geohash']['S'].startswith(prefix)
+
+
+def located_between(start_range_unix: int, end_range_unix: int):
+    # placed_at <= end AND (attribute_not_exists(moved_at) OR moved_at >= start)
+    def predicate(item):
+        if not item['geohash']['S'].startswith('Location#'):
+            return False
+        if 'placed_at' not in item or float(item['placed_at']['N']) > end_range_unix:
+            return False
+        moved_at = item.get('moved_at')
+        return moved_at is None or float(next(iter(moved_at.values()))) >= start_range_unix
+    return predicate
+
+
+class SensorGeoIndex:
+    """
+    In-process copy of the items of GSI_Geohash6_FullGeohash (metadata of active sensors, all location records),
+    bucketed in a lat/lon grid of `cell_deg` degrees. Radius and bounding box queries only visit the covering cells.
+    The index is loaded with `load_items` and kept current with put/update/discard by the writing service.
+    It answers queries while it is younger than `max_age_s`, writes of other processes are not seen before that;
+    a stale index returns None (the caller queries DynamoDB) and reloads in the background.
+    """
+
+    def __init__(self, load_items: Callable[[], Iterable[Dict]], max_age_s=300.0, cell_deg=0.002):
+        self.load_items = load_items
+        self.max_age_s = max_age_s
+        self.cell_deg = cell_deg
+        self._items: Dict[Tuple[str, str], Dict] = {}
+        self._cells: Dict[Tuple[int, int], set] = defaultdict(set)
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._loading = False
+        self._pending_updates = None
+        self._stats = {'hits': 0, 'fallbacks': 0, 'loads': 0, 'load_errors': 0, 'updates': 0}
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def is_fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.max_age_s
+
+    def load(self):
+        with self._lock:
+            self._pending_updates = []
+        try:
+            items = list(self.load_items())
+        except Exception:
+            with self._lock:
+                self._pending_updates = None
+                self._stats['load_errors'] += 1
+            raise
+        loaded = {item_key(item): item for item in items if 'geoJson' in item and 'geohash' in item}
+        cells = defaultdict(set)
+        for key, item in loaded.items():
+            cells[self._cell(*item_lat_lon(item))].add(key)
+        with self._lock:
+            self._items, self._cells = loaded, cells
+            # Writes of this process that raced with the scan are applied on top of it
+            for update in self._pending_updates:
+                update()
+            self._pending_updates = None
+            self._loaded_at = time.monotonic()
+            self._stats['loads'] += 1
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Sensor index could not be loaded: {e}")
+            finally:
+                with self._lock:
+                    self._loading = False
+        threading.Thread(target=run, name='sensor-index-load', daemon=True).start()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # Incremental maintenance, called after the corresponding write succeeded
+    def put(self, item: Dict):
+        self._apply(lambda: self._put(item))
+
+    def update(self, key: Tuple[str, str], attributes: Dict):
+        self._apply(lambda: self._update(key, attributes))
+
+    def discard(self, key: Tuple[str, str]):
+        self._apply(lambda: self._discard(key))
+
+    def _apply(self, update):
+        with self._lock:
+            self._stats['updates'] += 1
+            if self._pending_updates is not None:
+                self._pending_updates.append(update)
+            update()
+
+    def _put(self, item):
+        key = item_key(item)
+        self._discard(key)
+        if 'geoJson' in item and 'geohash' in item:
+            self._items[key] = item
+            self._cells[self._cell(*item_lat_lon(item))].add(key)
+
+    def _update(self, key, attributes):
+        item = self._items.get(key)
+        if item is None:
+            # The index missed this item, it cannot be trusted until the next load
+            self._loaded_at = None
+            return
+        self._put(dict(item, **attributes))
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            cell = self._cells.get(self._cell(*item_lat_lon(item)))
+            if cell is not None:
+                cell.discard(key)
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        (min_row, min_col), (max_row, max_col) = self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._items):
+            return list(self._items.values())
+        return [self._items[key]
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                for key in self._cells.get((row, col), ())]
+
+    def _fresh_or_refresh(self):
+        if self.is_fresh():
+            self._stats['hits'] += 1
+            return True
+        self._stats['fallbacks'] += 1
+        self.refresh_in_background()
+        return False
+
+    def in_radius(self, lat, lon, radius_m, predicate: Callable[[Dict], bool]) -> Optional[List[Dict]]:
+        # Items within radius_m of (lat, lon) matching predicate, nearest first; None if the index is stale
+        if not self._fresh_or_refresh():
+            return None
+        lat_delta = radius_m / METERS_PER_DEGREE_LAT
+        lon_delta = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        with self._lock:
+            candidates = self._candidates(lat - lat_delta, lon - lon_delta, lat + lat_delta, lon + lon_delta)
+        matches = []
+        for item in candidates:
+            if predicate(item):
+                distance = distance_m(lat, lon, *item_lat_lon(item))
+                if distance <= radius_m:
+                    matches.append((distance, item))
+        matches.sort(key=lambda match: match[0])
+        return [item for _, item in matches]
+
+    def in_bounds(self, min_lat, min_lon, max_lat, max_lon,
+                  predicate: Callable[[Dict], bool]) -> Optional[List[Dict]]:
+        # Items inside the bounding box matching predicate; None if the index is stale
+        if not self._fresh_or_refresh():
+            return None
+        with self._lock:
+            candidates = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        matches = []
+        for item in candidates:
+            lat, lon = item_lat_lon(item)
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and predicate(item):
+                matches.append(item)
+        return matches
+
+    def stats(self):
+        return dict(self._stats, size=len(self._items), fresh=self.is_fresh(), max_age_s=self.max_age_s)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 
 import shapely.geometry.point
 from botocore.exceptions import ClientError, BotoCoreError
@@ -9,94 +9,157 @@ from shapely import Point, Polygon
 from backend.models.SensorDetails import SensorDetails
 from backend.models.SensorLocationHistory import SensorLocationHistory
 from backend.models.SensorMetadata import SensorMetadata
+from backend.service.MapRenderer import MapRenderer
 from backend.service.ParcelService import ParcelService
+from backend.service.SensorGeoIndex import SensorGeoIndex, metadata_of_type, located_between
 from dynamodbgeo import GeoDataManagerConfiguration, GeoDataManager, QueryRadiusRequest, GeoPoint, \
     QueryRectangleRequest
-from utils.polygon_def import create_dynamodb_client, hashKeyLength
+from utils.fan_out import bounded_map
+from utils.pagination import QueryPaginator
+from utils.polygon_def import get_shared_dynamodb_client, hashKeyLength, sensor_geo_index_enabled, \
+    sensor_geo_index_max_age_s, query_max_concurrency, sensor_map_render_background
 from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch
-from utils.sensors.sensor_placing_generation import is_point_in_parcel
-from utils.sensors.sensors_from_csv import parse_sensor_data, visualize_results, visualize_results_in_rectangle
+from utils.sensors.sensors_from_csv import parse_sensor_item
+from utils.tracking import tracked
 
 
 class SensorService:
-    def __init__(self):
-        self.dynamodb = create_dynamodb_client()
+    def __init__(self, dynamodb=None, parcel_service=None):
+        self.dynamodb = dynamodb or get_shared_dynamodb_client()
         self.config = GeoDataManagerConfiguration(self.dynamodb, 'IoT')
         self.config.hashKeyAttributeName = 'PK'
         self.config.rangeKeyAttributeName = 'SK'
         self.geoDataManager = GeoDataManager(self.config)
         self.config.hashKeyLength = hashKeyLength
         self.table_name = 'IoT'
-        self.parcel_service = ParcelService()
+        self.parcel_service = parcel_service or ParcelService(dynamodb=self.dynamodb, sensor_service=self)
+        self.max_concurrency = query_max_concurrency
+        self.map_renderer = MapRenderer(background=sensor_map_render_background)
+        self.sensor_index = None
+        if sensor_geo_index_enabled:
+            self.enable_sensor_index()
+
+    def enable_sensor_index(self, max_age_s=sensor_geo_index_max_age_s):
+        # Geo queries are answered in process once the index has loaded, until then they go to DynamoDB
+        if self.sensor_index is None:
+            self.sensor_index = SensorGeoIndex(self._scan_geo_items, max_age_s=max_age_s)
+            self.sensor_index.refresh_in_background()
+        return self.sensor_index
+
+    def _scan_geo_items(self):
+        params = {'TableName': self.table_name, 'IndexName': 'GSI_Geohash6_FullGeohash',
+                  'ReturnConsumedCapacity': 'TOTAL'}
+        return QueryPaginator(self.dynamodb, params, operation='scan')
 
+    # Query methods render a map of their results only with render_map=True, see MapRenderer
+    @tracked()
     def get_active_sensors_in_rectangle_for_time_range(self, polygon_coords: List[Tuple[float, float]], from_date: str,
-                                                       to_date: str):
+                                                       to_date: str, render_map=False):
         try:
             start_range_unix = convert_to_unix_epoch(from_date)
             end_range_unix = convert_to_unix_epoch(to_date)
             polygon = Polygon(polygon_coords)
             min_lon, min_lat, max_lon, max_lat = polygon.bounds
-            query_rectangle_input = {
-                'GSI': {
-                    'Name': 'GSI_Geohash6_FullGeohash',
-                    'PK': {'name': 'hash_key', 'type': 'S'},
-                    'SK': {'name': 'geohash', 'value': f"Location#", 'type': 'S', 'composite': True}
-                },
-                "Filters": "placed_at <= :placementDate  AND "
-                           "(attribute_not_exists(moved_at) "
-                           "OR (moved_at >= :startDate AND moved_at <= :endDate) "
-                           "OR (moved_at >= :startDate AND moved_at >= :endDate))",
-                "ExpressionAttributeValues": {
-                    ':startDate': {'N': f"{start_range_unix}"},
-                    ':endDate': {'N': f"{end_range_unix}"},
-                    ':placementDate': {'N': f"{end_range_unix}"}
-                }
-            }
-            response = self.geoDataManager.queryRectangle(
-                QueryRectangleRequest(
-                    GeoPoint(min_lat, min_lon),
-                    GeoPoint(max_lat, max_lon), query_rectangle_input))
-            data = parse_sensor_data(response['results'])
-            map = visualize_results_in_rectangle(subpolygon=polygon, sensors=data)
-            map.save("vis_out/sensorservice/sensors-rectangle-timerange.html")
-            return [SensorDetails(item) for item in response['results']]
+            results = None
+            if self.sensor_index is not None:
+                results = self.sensor_index.in_bounds(min_lat, min_lon, max_lat, max_lon,
+                                                      located_between(start_range_unix, end_range_unix))
+            if results is None:
+                results = self._query_rectangle(min_lat, min_lon, max_lat, max_lon, "Location#", {
+                    "Filters": "placed_at <= :placementDate  AND "
+                               "(attribute_not_exists(moved_at) "
+                               "OR (moved_at >= :startDate AND moved_at <= :endDate) "
+                               "OR (moved_at >= :startDate AND moved_at >= :endDate))",
+                    "ExpressionAttributeValues": {
+                        ':startDate': {'N': f"{start_range_unix}"},
+                        ':endDate': {'N': f"{end_range_unix}"},
+                        ':placementDate': {'N': f"{end_range_unix}"}
+                    }
+                })
+            if render_map:
+                self.map_renderer.render_rectangle("sensors-rectangle-timerange", polygon, results)
+            return [SensorDetails(item) for item in results]
         except (ClientError, BotoCoreError, ValueError, Exception) as e:
             print(f"An error occurred while retrieving active sensors in rectangle: {e}")
             return []
+
+    @tracked()
+    def get_active_sensors_in_polygon(self, polygon_coords: List[Tuple[float, float]], sensor_type: str = None):
+        # Currently active sensors (optionally of one type) inside the polygon
+        try:
+            polygon = Polygon(polygon_coords)
+            min_lon, min_lat, max_lon, max_lat = polygon.bounds
+            results = None
+            if self.sensor_index is not None:
+                results = self.sensor_index.in_bounds(min_lat, min_lon, max_lat, max_lon,
+                                                      metadata_of_type(sensor_type))
+            if results is None:
+                prefix = f"Metadata#{sensor_type}#" if sensor_type else "Metadata#"
+                results = self._query_rectangle(min_lat, min_lon, max_lat, max_lon, prefix)
+            sensors = [SensorDetails(item) for item in results]
+            return [sensor for sensor in sensors if polygon.contains(sensor.location)]
+        except (ClientError, BotoCoreError, ValueError, Exception) as e:
+            print(f"An error occurred while retrieving active sensors in polygon: {e}")
+            return []
+
+    def _query_rectangle(self, min_lat, min_lon, max_lat, max_lon, geohash_prefix, filters=None):
+        query_rectangle_input = {
+            'GSI': {
+                'Name': 'GSI_Geohash6_FullGeohash',
+                'PK': {'name': 'hash_key', 'type': 'S'},
+                'SK': {'name': 'geohash', 'value': geohash_prefix, 'type': 'S', 'composite': True}
+            },
+            **(filters or {})
+        }
+        response = self.geoDataManager.queryRectangle(
+            QueryRectangleRequest(
+                GeoPoint(min_lat, min_lon),
+                GeoPoint(max_lat, max_lon), query_rectangle_input))
+        return response['results']
+
+    @tracked()
     def get_all_currently_active_sensors_in_radius_by_type(self, center_point: shapely.geometry.point.Point,
-                                                           radius_meters: float, sensor_type: str):
+                                                           radius_meters: float, sensor_type: str, render_map=False):
         try:
             lat, lon = center_point.y, center_point.x
-            query_radius_input = {
-                'GSI': {
-                    'Name': 'GSI_Geohash6_FullGeohash',
-                    'PK': {'name': 'hash_key', 'type': 'S'},
-                    'SK': {'name': 'geohash', 'value': f"Metadata#{sensor_type}#", 'type': 'S', 'composite': True}
-                }
-            }
-            response = self.geoDataManager.queryRadius(
-                QueryRadiusRequest(
-                    centerPoint=GeoPoint(lat, lon),
-                    radiusInMeter=radius_meters,
-                    query_input_dict=query_radius_input,
-                    sort=True
-                )
-            )
-            data_for_map = parse_sensor_data(response['results'])
-            map = visualize_results(center_point, radius_meters, data_for_map)
-            print(
-                f"Total active in radius: {len(data_for_map)},consumed Capacity Units {response['consumed_capacity']}")
-            map.save("vis_out/sensorservice/sensors-active-radius.html")
-            return [SensorDetails(item) for item in response['results']]
+            results = None
+            if self.sensor_index is not None:
+                results = self.sensor_index.in_radius(lat, lon, radius_meters, metadata_of_type(sensor_type))
+            if results is None:
+                results = self._query_radius(lat, lon, radius_meters, f"Metadata#{sensor_type}#")
+            print(f"Total active in radius: {len(results)}")
+            if render_map:
+                self.map_renderer.render_radius("sensors-active-radius", center_point, radius_meters, results)
+            return [SensorDetails(item) for item in results]
         except (BotoCoreError, ClientError, Exception) as error:
             print(f"An error occurred: {error}")
             return []
 
+    def _query_radius(self, lat, lon, radius_meters, geohash_prefix, filters=None):
+        # Sorted by distance from the center point
+        query_radius_input = {
+            'GSI': {
+                'Name': 'GSI_Geohash6_FullGeohash',
+                'PK': {'name': 'hash_key', 'type': 'S'},
+                'SK': {'name': 'geohash', 'value': geohash_prefix, 'type': 'S', 'composite': True}
+            },
+            **(filters or {})
+        }
+        response = self.geoDataManager.queryRadius(
+            QueryRadiusRequest(
+                centerPoint=GeoPoint(lat, lon),
+                radiusInMeter=radius_meters,
+                query_input_dict=query_radius_input,
+                sort=True
+            )
+        )
+        return response['results']
+
 
 
 
 
-    def get_sensor_location_history(self, sensor_id, get_last_location=False):
+    def location_history_query_params(self, sensor_id, get_last_location=False):
         params = {
             'TableName': self.table_name,
             'KeyConditionExpression': 'PK = :sensorId AND begins_with(SK, :locationPrefix)',
@@ -111,17 +174,29 @@ class SensorService:
             params['ScanIndexForward'] = False
             params['Limit'] = 1
             params['FilterExpression'] = 'attribute_not_exists(moved_at)'
+        return params
+
+    @tracked()
+    def get_sensor_location_history(self, sensor_id, get_last_location=False):
         try:
-            response = self.dynamodb.query(**params)
-            items = response.get('Items', [])
-            consumed_capacity = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-            print(f'Sensor locations for ID {sensor_id}, found {len(items)} records, Consumed Capacity Units: {consumed_capacity}')
-            location_histories = [SensorLocationHistory(item) for item in items]
-            return location_histories
+            return self._query_location_history(sensor_id, get_last_location)
         except (ClientError, BotoCoreError, ValueError, Exception) as e:
-            print(f"Error retrieving sensor location history: {e.response['Error']['Message']}")
+            print(f"Error retrieving sensor location history: {e}")
             return []
 
+    def _query_location_history(self, sensor_id, get_last_location=False):
+        # Errors propagate, callers decide whether a failed sensor aborts the whole operation
+        response = self.dynamodb.query(**self.location_history_query_params(sensor_id, get_last_location))
+        return [SensorLocationHistory(item) for item in response.get('Items', [])]
+
+    def index_retired_sensor(self, sensor_type, sensor_id, location_sk, moved_at):
+        # Mirrors a retirement (metadata leaves the geohash index, the location gets moved_at) in the sensor index
+        if self.sensor_index is not None:
+            self.sensor_index.discard((f"Sensor#{sensor_id}", f'Metadata#{sensor_type}#{sensor_id}'))
+            if location_sk is not None:
+                self.sensor_index.update((f"Sensor#{sensor_id}", location_sk), {'moved_at': {'N': str(moved_at)}})
+
+    @tracked()
     def retire_sensor(self, sensor_type, sensor_id):
         current_location = self.get_sensor_location_history(sensor_id=sensor_id, get_last_location=True)
         current_time_unix = convert_to_unix_epoch(datetime.now().strftime("%Y-%m-%dT%H:%M:%S"))
@@ -154,11 +229,13 @@ class SensorService:
         transact_items = [update_metadata_record, update_old_location]
         try:
             self.dynamodb.transact_write_items(TransactItems=transact_items)
+            self.index_retired_sensor(sensor_type, sensor_id, current_location[0].sk, current_time_unix)
             return True
         except (ClientError, BotoCoreError, Exception) as e:
             return False
 
-    def get_all_active_sensors_in_field_or_with_optional_parcel_id(self, parcel_id=None, sensor_type=None):
+    def active_sensors_params(self, parcel_id=None, sensor_type=None):
+        # Returns the request parameters and whether they are meant for query (by parcel) or scan (whole field)
         params = {'TableName': self.table_name,
                   'IndexName': 'GSI_Sensor_By_Parcel',
                   'ReturnConsumedCapacity': 'TOTAL'}
@@ -172,9 +249,9 @@ class SensorService:
                 'KeyConditionExpression': key_condition,
                 'ExpressionAttributeValues': expression_attribute_values
             })
-            dynamodb_operation = self.dynamodb.query
+            operation = 'query'
         else:
-            dynamodb_operation = self.dynamodb.scan
+            operation = 'scan'
             if sensor_type:
                 filter_expression = f"begins_with(SK, :type)"
                 expression_attribute_values = {':type': {'S': f'Metadata#{sensor_type}'}}
@@ -183,25 +260,29 @@ class SensorService:
                     'FilterExpression': filter_expression,
                     'ExpressionAttributeValues': expression_attribute_values
                 })
-        response = dynamodb_operation(**params)
-        data = response.get('Items', [])
-        total_consumed_capacity = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-        while 'LastEvaluatedKey' in response:
-            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
-            response = dynamodb_operation(**params)
-            data.extend(response.get('Items', []))
-            total_consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-        print(f'Total active sensors retrieved: {len(data)}, Consumed Capacity Units {total_consumed_capacity}')
-        parsed_data = parse_sensor_data(data)
-        map = visualize_results(center_point=None, radius=None, sensors=parsed_data)
-        map.save("vis_out/sensorservice/sensors-field-all.html")
+        return params, operation
+
+    def iter_active_sensors_in_field_or_with_optional_parcel_id(self, parcel_id=None, sensor_type=None,
+                                                                 max_items=None, page_size=None,
+                                                                 start_key=None) -> QueryPaginator:
+        params, operation = self.active_sensors_params(parcel_id, sensor_type)
+        return QueryPaginator(self.dynamodb, params, operation=operation, decode=parse_sensor_item,
+                              max_items=max_items, page_size=page_size, start_key=start_key)
+
+    @tracked()
+    def get_all_active_sensors_in_field_or_with_optional_parcel_id(self, parcel_id=None, sensor_type=None,
+                                                                   render_map=False):
+        paginator = self.iter_active_sensors_in_field_or_with_optional_parcel_id(parcel_id, sensor_type)
+        parsed_data = paginator.all()
+        if render_map:
+            self.map_renderer.render_sensors("sensors-field-all", parsed_data)
         return parsed_data
 
+    @tracked()
     def add_sensor(self, lon, lat, sensor_details):
         try:
             sensor_metadata = SensorMetadata(lon, lat, sensor_details)
-            all_parcels = self.parcel_service.get_all_active_parcels_in_field()
-            parcel_for_point = is_point_in_parcel(sensor_metadata.location, all_parcels)
+            parcel_for_point = self.parcel_service.find_active_parcel_for_point(sensor_metadata.location)
             if not parcel_for_point:
                 raise ValueError(f"The point does not fall within the coordinates of active parcels")
             sensor_id = uuid.uuid4()
@@ -217,28 +298,32 @@ class SensorService:
                          'ConditionExpression': 'attribute_not_exists(PK) AND attribute_not_exists(SK)'}}
             ]
             self.dynamodb.transact_write_items(TransactItems=transact_items)
+            if self.sensor_index is not None:
+                self.sensor_index.put(sensor_metadata_record)
+                self.sensor_index.put(sensor_location_record)
             return sensor_id
         except (ClientError, BotoCoreError, ValueError, Exception) as e:
             print(f"Error adding sensor to DB: {e}")
             return None
 
+    def sensor_details_query_params(self, sensor_id):
+        return {
+            'TableName': self.table_name,
+            'KeyConditionExpression': "PK = :pk_val AND begins_with(SK, :sk_val)",
+            'ExpressionAttributeValues': {
+                ":pk_val": {'S': f'Sensor#{sensor_id}'},
+                ":sk_val": {'S': 'Metadata#'}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    @tracked()
     def get_sensor_details_by_id(self, sensor_id):
         try:
-            response = self.dynamodb.query(
-                TableName=self.table_name,
-                KeyConditionExpression="PK = :pk_val AND begins_with(SK, :sk_val)",
-                ExpressionAttributeValues={
-                    ":pk_val": {'S': f'Sensor#{sensor_id}'},
-                    ":sk_val": {'S': 'Metadata#'}
-                },
-                ReturnConsumedCapacity='TOTAL'
-            )
+            response = self.dynamodb.query(**self.sensor_details_query_params(sensor_id))
             items = response.get('Items', [])
             if items:
-                sensor_details = SensorDetails(items[0])
-                consumed_capacity = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
-                print(f'Sensor#Metadata for ID {sensor_id}, Consumed Capacity Units: {consumed_capacity}')
-                return sensor_details
+                return SensorDetails(items[0])
             else:
                 print(f"No item found with Sensor ID: {sensor_id}")
                 return None
@@ -246,52 +331,59 @@ class SensorService:
             print(f"An error occurred: {error}")
             return None
 
-    def get_active_sensors_in_radius_for_time_range(self, center_point, radius_meters, from_date, to_date):
+    @tracked()
+    def get_active_sensors_in_radius_for_time_range(self, center_point, radius_meters, from_date, to_date,
+                                                    render_map=False):
         start_range_unix = convert_to_unix_epoch(from_date)
         end_range_unix = convert_to_unix_epoch(to_date)
-        query_radius_input = {
-            'GSI': {
-                'Name': 'GSI_Geohash6_FullGeohash',
-                'PK': {'name': 'hash_key', 'type': 'S'},
-                'SK': {'name': 'geohash', 'value': f"Location#", 'type': 'S', 'composite': True}
-            },
-            "Filters": "placed_at <= :placementDate  AND "
-                       "(attribute_not_exists(moved_at) "
-                       "OR (moved_at >= :startDate AND moved_at <= :endDate) "
-                       "OR (moved_at >= :startDate AND moved_at >= :endDate))",
-            "ExpressionAttributeValues": {
-                ':startDate': {'N': f"{start_range_unix}"},
-                ':endDate': {'N': f"{end_range_unix}"},
-                ':placementDate': {'N': f"{end_range_unix}"}
-            }
-        }
-
         lat, lon = center_point.y, center_point.x
-        # Perform the radius query
-        response = self.geoDataManager.queryRadius(
-            QueryRadiusRequest(
-                GeoPoint(lat, lon),  # center point
-                radius_meters,  # search radius in meters
-                query_radius_input,  # additional filter input
-                sort=True  # sort by distance from the center point
-            )
-        )
-
-        data = parse_sensor_data(response['results'])
-        map = visualize_results(center_point, radius_meters, data)
-
-        print('Radius Time Range: Total data', len(response['results']), 'with consumed Capacity Units',
-              response['consumed_capacity'])
-        map.save("vis_out/sensorservice/sensors-radius-timerange.html")
-        return [SensorDetails(item) for item in response['results']]
+        results = None
+        if self.sensor_index is not None:
+            results = self.sensor_index.in_radius(lat, lon, radius_meters,
+                                                  located_between(start_range_unix, end_range_unix))
+        if results is None:
+            results = self._query_radius(lat, lon, radius_meters, "Location#", {
+                "Filters": "placed_at <= :placementDate  AND "
+                           "(attribute_not_exists(moved_at) "
+                           "OR (moved_at >= :startDate AND moved_at <= :endDate) "
+                           "OR (moved_at >= :startDate AND moved_at >= :endDate))",
+                "ExpressionAttributeValues": {
+                    ':startDate': {'N': f"{start_range_unix}"},
+                    ':endDate': {'N': f"{end_range_unix}"},
+                    ':placementDate': {'N': f"{end_range_unix}"}
+                }
+            })
 
-    def batch_get_sensor_locations_histories(self, sensor_ids, get_last_location=False):
+        print('Radius Time Range: Total data', len(results))
+        if render_map:
+            self.map_renderer.render_radius("sensors-radius-timerange", center_point, radius_meters, results)
+        return [SensorDetails(item) for item in results]
+
+    @tracked()
+    def batch_get_sensor_locations_histories(self, sensor_ids, get_last_location=False,
+                                             errors: Dict[str, str] = None) -> Dict[str, List[SensorLocationHistory]]:
+        """
+        Location histories keyed by sensor id, the per-sensor queries run concurrently on the shared query pool.
+        Sensors whose query failed are left out of the result; pass a dict as `errors` to receive them
+        (sensor_id -> error), otherwise they are only reported.
+        """
+        results = bounded_map(self._query_location_history,
+                              [(sensor_id, get_last_location) for sensor_id in sensor_ids],
+                              self.max_concurrency, return_exceptions=True)
         all_sensor_histories = {}
-        for sensor_id in sensor_ids:
-            sensor_history = self.get_sensor_location_history(sensor_id, get_last_location)
-            all_sensor_histories[sensor_id] = sensor_history
+        failed = {}
+        for sensor_id, result in zip(sensor_ids, results):
+            if isinstance(result, Exception):
+                failed[sensor_id] = str(result)
+            else:
+                all_sensor_histories[sensor_id] = result
+        if failed:
+            print(f"Location histories of {len(failed)} of {len(sensor_ids)} sensors could not be retrieved")
+        if errors is not None:
+            errors.update(failed)
         return all_sensor_histories
 
+    @tracked()
     def move_sensor(self, sensor_type, sensor_id, new_lon, new_lat):
         # 1: Retrieve the sensor's current location history
         current_location = self.get_sensor_location_history(sensor_id=sensor_id, get_last_location=True)
@@ -302,8 +394,7 @@ class SensorService:
             return None
         # Check if coordinates are valid and fall in one of the parcels
         new_point = Point(new_lon, new_lat)
-        all_parcels = self.parcel_service.get_all_active_parcels_in_field()
-        parcel_for_point = is_point_in_parcel(new_point, all_parcels)
+        parcel_for_point = self.parcel_service.find_active_parcel_for_point(new_point)
         if not parcel_for_point:
             print(f"The point does not fall within the coordinates of active parcels")
             return None
@@ -362,6 +453,16 @@ class SensorService:
         transact_items = [update_metadata, new_location_history, update_old_location]
         try:
             self.dynamodb.transact_write_items(TransactItems=transact_items)
+            if self.sensor_index is not None:
+                self.sensor_index.put(new_location_history['Put']['Item'])
+                self.sensor_index.update((f"Sensor#{sensor_id}", f'Metadata#{sensor_type}#{sensor_id}'), {
+                    'curr_parcelid': {'S': parcel_for_point.SK},
+                    'hash_key': {'S': str(hashkey)},
+                    'geohash': {'S': f"Metadata#{sensor_type}#{geohash}"},
+                    'geoJson': {'S': f'{new_lat},{new_lon}'}
+                })
+                self.sensor_index.update((f"Sensor#{sensor_id}", current_location[0].sk),
+                                         {'moved_at': {'N': str(current_time_unix)}})
             print(f"Sensor {sensor_id} moved to new location: {new_lat}, {new_lon} in parcel {parcel_for_point.SK}")
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"Error moving sensor: {e}")
@@ -377,7 +478,8 @@ if __name__ == "__main__":
     rectangle = [(28.1250063, 46.6334964), (28.1256516, 46.6322131), (28.1285698, 46.6329204), (28.1278188, 46.6341654),
                   (28.1250063, 46.6334964)]
     sensor_service = SensorService()
-    sensor_service.get_all_currently_active_sensors_in_radius_by_type(center_point, 500, "SoilMoisture")
+    sensor_service.get_all_currently_active_sensors_in_radius_by_type(center_point, 500, "SoilMoisture",
+                                                                      render_map=True)
     sensor_det = sensor_service.get_sensor_details_by_id("c0db5e4b-58e8-4a48-a065-e13749aecb4d")
     print(sensor_det)
 
@@ -401,8 +503,10 @@ if __name__ == "__main__":
     ev = sensor_service.get_active_sensors_in_rectangle_for_time_range(
                                                                polygon_coords=rectangle,
                                                                from_date='2020-01-12T00:00:00',
-                                                               to_date='2024-10-12T16:00:00')
+                                                               to_date='2024-10-12T16:00:00',
+                                                               render_map=True)
     print(len(ev))
+    sensor_service.map_renderer.flush()
     #
     # sensor_service.get_all_currently_active_sensors_in_radius_by_type(center_point, 200, "SoilMoisture")
 
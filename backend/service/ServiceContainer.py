@@ -0,0 +1,82 @@
+import threading
+
+from utils.polygon_def import get_shared_dynamodb_client
+
+
+class ServiceContainer:
+    """
+    Creates every service at most once and wires them to one shared DynamoDB client.
+    Services are built lazily on first access, so importing the container is cheap.
+    """
+
+    def __init__(self, dynamodb=None):
+        self._dynamodb = dynamodb
+        self._lock = threading.RLock()
+        self._services = {}
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            self._dynamodb = get_shared_dynamodb_client()
+        return self._dynamodb
+
+    def _get_or_create(self, name, factory):
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = factory()
+                    self._services[name] = service
+        return service
+
+    @property
+    def parcel_service(self):
+        from backend.service.ParcelService import ParcelService
+        return self._get_or_create('parcel', lambda: ParcelService(dynamodb=self.dynamodb))
+
+    @property
+    def sensor_service(self):
+        from backend.service.SensorService import SensorService
+
+        def create():
+            sensor_service = SensorService(dynamodb=self.dynamodb, parcel_service=self.parcel_service)
+            self.parcel_service.sensor_service = sensor_service
+            return sensor_service
+        return self._get_or_create('sensor', create)
+
+    @property
+    def sensor_event_service(self):
+        from backend.service.SensorEventService import SensorEventService
+        return self._get_or_create('sensor_event', lambda: SensorEventService(dynamodb=self.dynamodb,
+                                                                              sensor_service=self.sensor_service))
+
+    @property
+    def maintenance_service(self):
+        from backend.service.MaintenanceService import MaintenanceService
+        return self._get_or_create('maintenance', lambda: MaintenanceService(dynamodb=self.dynamodb,
+                                                                             sensor_service=self.sensor_service))
+
+    @property
+    def user_service(self):
+        from backend.service.UserService import UserService
+        return self._get_or_create('user', lambda: UserService(dynamodb=self.dynamodb))
+
+    @property
+    def worker_service(self):
+        from backend.service.WorkerService import WorkerService
+        return self._get_or_create('worker', lambda: WorkerService(data_service=self.sensor_event_service))
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_container():
+    # Process-wide container, shared by all request handlers
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = ServiceContainer()
+    return _container
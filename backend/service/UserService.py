@@ -2,11 +2,12 @@ from botocore.exceptions import BotoCoreError, ClientError
 
 from backend.models.User import User
 from dynamodbgeo import GeoDataManagerConfiguration, GeoDataManager
-from utils.polygon_def import create_dynamodb_client, hashKeyLength
+from utils.polygon_def import get_shared_dynamodb_client, hashKeyLength
+from utils.tracking import tracked
 
 class UserService:
-    def __init__(self):
-        self.dynamodb = create_dynamodb_client()
+    def __init__(self, dynamodb=None):
+        self.dynamodb = dynamodb or get_shared_dynamodb_client()
         self.config = GeoDataManagerConfiguration(self.dynamodb, 'IoT')
         self.config.hashKeyAttributeName = 'PK'
         self.config.rangeKeyAttributeName = 'SK'
@@ -15,39 +16,41 @@ class UserService:
         self.table_name = 'IoT'
         self.gsi_name = 'GSI_Users_Roles_Maintenance'
 
+    def users_by_role_query_params(self, role):
+        return {
+            'TableName': self.table_name,
+            'IndexName': 'GSI_Users_Roles_Maintenance',
+            'KeyConditionExpression': "GSI_PK = :role",
+            'ExpressionAttributeValues': {":role": {'S': role}},
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    def user_key_params(self, user_email):
+        return {
+            'TableName': self.table_name,
+            'Key': {
+                'PK': {'S': f'User#{user_email}'},
+                'SK': {'S': f'User#{user_email}'}
+            },
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+
+    @tracked()
     def get_users_by_role(self, role):
         try:
 
-            response = self.dynamodb.query(
-                TableName=self.table_name,
-                IndexName='GSI_Users_Roles_Maintenance',
-                KeyConditionExpression="GSI_PK = :role",
-                ExpressionAttributeValues={":role": {'S': role}},
-                ReturnConsumedCapacity='TOTAL'
-            )
-            consumed_capacity_units = response.get('ConsumedCapacity', {}).get('CapacityUnits')
-            if consumed_capacity_units is not None:
-                print(f"Users by role {role}, Consumed Capacity Units: {consumed_capacity_units}")
+            response = self.dynamodb.query(**self.users_by_role_query_params(role))
             users_items = response.get('Items')
             return [User(item) for item in users_items]
         except (BotoCoreError, ClientError) as error:
             print(f"An error occurred: {error}")
             return None
 
+    @tracked()
     def get_user_details(self, user_email):
         try:
 
-            response = self.dynamodb.get_item(
-                TableName=self.table_name,
-                Key={
-                    'PK': {'S': f'User#{user_email}'},
-                    'SK': {'S': f'User#{user_email}'}
-                },
-                ReturnConsumedCapacity='TOTAL'
-            )
-            consumed_capacity_units = response.get('ConsumedCapacity', {}).get('CapacityUnits')
-            if consumed_capacity_units is not None:
-                print(f"User details for e-mail {user_email}, Consumed Capacity Units: {consumed_capacity_units}")
+            response = self.dynamodb.get_item(**self.user_key_params(user_email))
             user_item = response.get('Item')
             return User(user_item) if user_item else None
         except (BotoCoreError, ClientError) as error:
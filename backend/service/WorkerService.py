@@ -1,21 +1,28 @@
+import contextvars
 from calendar import monthrange
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, time
 from typing import Tuple, Optional
 
-import pandas as pd
 from botocore.exceptions import ClientError, BotoCoreError
 
 from backend.models.SensorEvent import DataType
+from backend.models.SensorEventColumns import SensorEventColumns
 from backend.service.SensorEventService import SensorEventService
 from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch
+from utils.sensor_events.sharding import base_partition_key
+from utils.tracking import tracked
 
 
 class WorkerService:
-    def __init__(self):
-        self.data_service=SensorEventService()
+    # The aggregation only reads the measurement and the parcel, keys are always returned
+    AGGREGATE_FIELDS = ('data_point', 'parcel_id')
+
+    def __init__(self, data_service=None):
+        self.data_service = data_service or SensorEventService()
 
     # Add aggregations to table
+    @tracked()
     def calculate_aggregates_per_period(self, date: datetime = None, month_year: Optional[Tuple[int, int]] = None):
         try:
             if date is not None and month_year is not None:
@@ -39,11 +46,15 @@ class WorkerService:
             results = {}
             with ThreadPoolExecutor() as executor:
                 futures = {
+                    # The per-type queries are accounted to this run
                     data_type: executor.submit(
+                        contextvars.copy_context().run,
                         self.data_service.query_sensor_events_for_field_in_time_range_by_type,
                         start_date,
                         end_date,
-                        data_type
+                        data_type,
+                        columnar=True,
+                        fields=self.AGGREGATE_FIELDS
                     ) for data_type in data_types
                 }
             for data_type, future in futures.items():
@@ -51,26 +62,24 @@ class WorkerService:
                     results[data_type] = future.result()
                 except Exception as e:
                     print(f'Exception occurred for {data_type}: {e}')
-            all_data = pd.DataFrame()
-            for data_type, result in results.items():
-                if not result:
-                    continue
-                if result and data_type != DataType.RAIN.value:
-                    data = [{'data_type': obj.data.dataType, 'parcel_id': obj.metadata.parcel_id, 'PK': obj.PK,
-                             'data': obj.data.dataPoint} for obj in result]
-                    df = pd.DataFrame(data)
-                    all_data = pd.concat([all_data, df])
-            if all_data.empty:
+            columns = SensorEventColumns.concat([result for data_type, result in results.items()
+                                                 if data_type != DataType.RAIN.value])
+            if len(columns) == 0:
                 print(f"No data found for date: {start_date}")
                 return False
-            aggregated_for_field = all_data.groupby('PK')['data'].agg(['mean', 'min', 'max', 'median'])
-            aggregated_by_parcel = all_data.groupby(['PK', 'parcel_id'])['data'].agg(['mean', 'min', 'max', 'median'])
+            # Aggregates are stored on the unsharded {dataType}#{first_of_month} partition
+            all_data = columns.map_categories('PK', base_partition_key).as_frame()
+            aggregated_for_field = all_data.groupby('PK', observed=True)['data_point'].agg(
+                ['mean', 'min', 'max', 'median'])
+            aggregated_by_parcel = all_data.groupby(['PK', 'parcel_id'], observed=True)['data_point'].agg(
+                ['mean', 'min', 'max', 'median'])
+            period = convert_to_unix_epoch(start_date)
             transact_items = []
             for pk, agg_data in aggregated_for_field.iterrows():
                    parcel_agg = aggregated_by_parcel.xs(pk, level='PK').to_dict('index')
                    item = {
                         'PK': {'S': pk},
-                        'SK': {'S': f'Agg#{prefix}#{convert_to_unix_epoch(start_date)}'},
+                        'SK': {'S': f'Agg#{prefix}#{period}'},
                         'mean': {'N': str(agg_data['mean'])},
                         'min': {'N': str(agg_data['min'])},
                         'max': {'N': str(agg_data['max'])},
@@ -81,6 +90,8 @@ class WorkerService:
                    }
                    transact_items.append({'Put': {'TableName': self.data_service.table_name, 'Item': item}})
             self.data_service.add_records(transact_items)
+            # Cached results of the period are stale now, closed periods would otherwise never be reloaded
+            self.data_service.invalidate_aggregates(prefix, period)
             return True
         except (ClientError, BotoCoreError, Exception) as e:
             print(f"An error occurred: {e}")
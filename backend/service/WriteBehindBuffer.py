@@ -0,0 +1,193 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Dict, Optional
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-memory queue of DynamoDB items flushed by background workers.
+    A batch is flushed once it holds `flush_size` items or its oldest item is `max_delay_s` old.
+    `write_batch` receives a list of items and returns a list aligned with it: None or an error message.
+    Items that still fail are dead letters: kept in memory (the newest `max_dead_letters`) and appended to
+    `dead_letter_file` as NDJSON, so they survive evictions and restarts until retry_dead_letters() writes them.
+    """
+    _STOP = object()
+
+    def __init__(self, write_batch: Callable[[List[Dict]], List[Optional[str]]], max_queue_size=10000,
+                 flush_size=25, max_delay_s=0.5, workers=2, max_dead_letters=10000, dead_letter_file=None):
+        self.write_batch = write_batch
+        self.max_queue_size = max_queue_size
+        self.flush_size = flush_size
+        self.max_delay_s = max_delay_s
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._workers = [threading.Thread(target=self._run, name=f"write-behind-{i}", daemon=True)
+                         for i in range(workers)]
+        self._closed = False
+        self._lock = threading.Lock()
+        # Items that still failed after batch retries, the file is the complete record when it is configured
+        self.dead_letters = deque(maxlen=max_dead_letters)
+        self.dead_letter_file = dead_letter_file
+        self._dead_letter_lock = threading.Lock()
+        self._retry_lock = threading.Lock()
+        self._stats = {'accepted': 0, 'rejected': 0, 'written': 0, 'failed': 0, 'flushes': 0,
+                       'flush_latency_total_s': 0.0, 'flush_latency_max_s': 0.0, 'flush_latency_last_s': 0.0,
+                       'dead_letters_evicted': 0, 'dead_letter_write_errors': 0}
+        # Dead letters of a previous run, or of a retry it did not finish, are retried with the new ones
+        for entry in self._read_dead_letter_file(self._retry_file) + self._read_dead_letter_file():
+            self.dead_letters.append(entry)
+        if self.dead_letters:
+            print(f"{len(self.dead_letters)} write-behind dead letters loaded from {self.dead_letter_file}")
+        for worker in self._workers:
+            worker.start()
+
+    def offer(self, item: Dict) -> bool:
+        # Non-blocking: False signals back-pressure to the caller
+        with self._lock:
+            if self._closed:
+                return False
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._stats['rejected'] += 1
+                return False
+            self._stats['accepted'] += 1
+            return True
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is self._STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay_s
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                # Put the marker back so the worker exits after flushing this batch
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            errors = self.write_batch(batch)
+        except Exception as e:
+            errors = [str(e)] * len(batch)
+        latency = time.perf_counter() - start
+        failed = [(item, error) for item, error in zip(batch, errors) if error]
+        for item, error in failed:
+            print(f"Write-behind flush failed for {item.get('SK', {}).get('S')}: {error}")
+            self._dead_letter({'item': item, 'error': error})
+        with self._lock:
+            self._stats['written'] += len(batch) - len(failed)
+            self._stats['failed'] += len(failed)
+            self._stats['flushes'] += 1
+            self._stats['flush_latency_total_s'] += latency
+            self._stats['flush_latency_last_s'] = latency
+            self._stats['flush_latency_max_s'] = max(self._stats['flush_latency_max_s'], latency)
+        return len(failed)
+
+    def _dead_letter(self, entry):
+        with self._dead_letter_lock:
+            if self.dead_letter_file is not None:
+                try:
+                    directory = os.path.dirname(self.dead_letter_file)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(entry) + '\n')
+                except OSError as e:
+                    print(f"Dead letter {entry['item'].get('SK', {}).get('S')} could not be persisted: {e}")
+                    self._count('dead_letter_write_errors')
+            if len(self.dead_letters) == self.dead_letters.maxlen:
+                evicted = self.dead_letters[0]
+                persisted = self.dead_letter_file is not None
+                print(f"Dead letter {evicted['item'].get('SK', {}).get('S')} evicted from memory"
+                      f"{f', it is kept in {self.dead_letter_file}' if persisted else ' and lost'}")
+                self._count('dead_letters_evicted')
+            self.dead_letters.append(entry)
+
+    def _read_dead_letter_file(self, path=None):
+        path = path or self.dead_letter_file
+        if path is None or not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @property
+    def _retry_file(self):
+        return f"{self.dead_letter_file}.retrying" if self.dead_letter_file is not None else None
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def drain_dead_letters(self) -> List[Dict]:
+        """
+        Removes and returns every dead letter: the file (evicted ones included), the ones whose append to it failed
+        and the ones of a retry that did not finish. They are moved to `<dead_letter_file>.retrying`, which
+        retry_dead_letters() removes only once it has written them or dead-lettered them again.
+        """
+        with self._dead_letter_lock:
+            if self.dead_letter_file is None:
+                entries = list(self.dead_letters)
+            else:
+                entries = self._read_dead_letter_file(self._retry_file) + self._read_dead_letter_file()
+                persisted = {json.dumps(entry, sort_keys=True) for entry in entries}
+                entries += [entry for entry in self.dead_letters if json.dumps(entry, sort_keys=True) not in persisted]
+                if entries:
+                    temporary_file = f"{self._retry_file}.tmp"
+                    with open(temporary_file, 'w', encoding='utf-8') as f:
+                        f.writelines(json.dumps(entry) + '\n' for entry in entries)
+                    os.replace(temporary_file, self._retry_file)
+                if os.path.exists(self.dead_letter_file):
+                    os.remove(self.dead_letter_file)
+            self.dead_letters.clear()
+        return entries
+
+    def retry_dead_letters(self) -> Dict:
+        """Writes the dead letters again in flush_size batches, the ones that fail again become dead letters."""
+        with self._retry_lock:
+            entries = self.drain_dead_letters()
+            failed = sum(self._flush([entry['item'] for entry in entries[i:i + self.flush_size]])
+                         for i in range(0, len(entries), self.flush_size))
+            if self._retry_file is not None and os.path.exists(self._retry_file):
+                os.remove(self._retry_file)
+        return {'retried': len(entries), 'written': len(entries) - failed, 'failed': failed}
+
+    def close(self, timeout=None):
+        """Stops accepting items and blocks until every accepted item has been flushed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(self._STOP)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self.max_queue_size
+        stats['flush_latency_avg_s'] = (stats['flush_latency_total_s'] / stats['flushes']) if stats['flushes'] else 0.0
+        stats['dead_letters'] = len(self.dead_letters)
+        stats['closed'] = self._closed
+        return stats
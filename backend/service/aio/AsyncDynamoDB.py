@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from typing import Dict, List, Optional, Awaitable, Iterable
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+
+from utils.metrics import instrument_client
+from utils.polygon_def import client, region_name, endpoint_url, aws_access_key_id, aws_secret_access_key, \
+    async_max_pool_connections, connect_timeout, read_timeout, max_retry_attempts, keepalive_timeout
+
+
+class AsyncDynamoDB:
+    """
+    One aiobotocore DynamoDB client, and therefore one connection pool, bound to the event loop it was opened on.
+    ASGI front ends open it in their startup hook; synchronous code goes through AsyncRuntime instead.
+    """
+
+    def __init__(self, max_pool_connections=async_max_pool_connections):
+        self.max_pool_connections = max_pool_connections
+        self._client_context = None
+        self.client = None
+
+    async def open(self):
+        if self.client is None:
+            config = AioConfig(max_pool_connections=self.max_pool_connections,
+                               connect_timeout=connect_timeout,
+                               read_timeout=read_timeout,
+                               retries={'max_attempts': max_retry_attempts, 'mode': 'standard'},
+                               connector_args={'keepalive_timeout': keepalive_timeout})
+            self._client_context = get_session().create_client(
+                client, region_name=region_name, endpoint_url=endpoint_url,
+                aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, config=config)
+            self.client = instrument_client(await self._client_context.__aenter__())
+        return self
+
+    async def close(self):
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client_context = None
+            self.client = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def query(self, **params):
+        return await self.client.query(**params)
+
+    async def scan(self, **params):
+        return await self.client.scan(**params)
+
+    async def get_item(self, **params):
+        return await self.client.get_item(**params)
+
+    async def put_item(self, **params):
+        return await self.client.put_item(**params)
+
+    async def batch_write_item(self, **params):
+        return await self.client.batch_write_item(**params)
+
+    async def transact_write_items(self, **params):
+        return await self.client.transact_write_items(**params)
+
+    async def query_all(self, params: Dict, max_items: Optional[int] = None, operation='query'):
+        """Pages a query (or scan) to completion. Returns (items, consumed capacity units)."""
+        params = dict(params)
+        items = []
+        consumed_capacity = 0
+        call = self.query if operation == 'query' else self.scan
+        while True:
+            response = await call(**params)
+            items.extend(response.get('Items', []))
+            consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+            last_evaluated_key = response.get('LastEvaluatedKey')
+            if not last_evaluated_key or (max_items is not None and len(items) >= max_items):
+                break
+            params['ExclusiveStartKey'] = last_evaluated_key
+        return (items[:max_items] if max_items is not None else items), consumed_capacity
+
+
+async def gather_bounded(awaitables: Iterable[Awaitable], limit: int, return_exceptions=False) -> List:
+    # asyncio.gather with at most `limit` awaitables in flight
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(run(awaitable) for awaitable in awaitables), return_exceptions=return_exceptions)
+
+
+class AsyncRuntime:
+    """
+    Process-wide event loop running on a daemon thread together with its AsyncDynamoDB.
+    Lets synchronous callers (Flask handlers, scripts) run coroutines of the async services.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='async-dynamodb', daemon=True)
+        self._thread.start()
+        self.dynamodb = AsyncDynamoDB()
+        self.run(self.dynamodb.open())
+
+    def run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def close(self):
+        self.run(self.dynamodb.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime():
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AsyncRuntime()
+    return _runtime
+
+
+def run_sync(coroutine, timeout=None):
+    return get_async_runtime().run(coroutine, timeout)
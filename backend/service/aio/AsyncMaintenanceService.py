@@ -0,0 +1,89 @@
+from botocore.exceptions import BotoCoreError, ClientError
+
+from backend.models.MaintenanceOperationByUser import MaintenanceOperation
+from backend.models.SensorDetails import SensorDetails
+from backend.models.SensorMaintenance import SensorMaintenance
+from backend.service.MaintenanceService import MaintenanceService
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB
+from backend.service.aio.AsyncSensorService import AsyncSensorService
+from utils.tracking import tracked
+
+
+class AsyncMaintenanceService:
+    """asyncio counterpart of MaintenanceService, transaction items are built by the synchronous models."""
+
+    def __init__(self, dynamodb: AsyncDynamoDB, sync_service: MaintenanceService = None,
+                 sensor_service: AsyncSensorService = None):
+        self.dynamodb = dynamodb
+        self.sync_service = sync_service or get_container().maintenance_service
+        self.table_name = self.sync_service.table_name
+        self.sensor_service = sensor_service or AsyncSensorService(dynamodb)
+
+    @tracked()
+    async def get_sensors_scheduled_or_in_maintenance(self, scheduled=False, assigned_to=None, from_date=None,
+                                                      to_date=None):
+        params = self.sync_service.maintenance_query_params(scheduled, assigned_to, from_date, to_date)
+        try:
+            items, _ = await self.dynamodb.query_all(params)
+            return [SensorDetails(item) for item in items]
+        except (BotoCoreError, ClientError, Exception) as error:
+            print(f"An error occurred: {error}")
+            return []
+
+    @tracked()
+    async def get_maintenance_operations_by_user(self, user_email, start_date=None, end_date=None):
+        params = self.sync_service.operations_by_user_query_params(user_email, start_date, end_date)
+        items, _ = await self.dynamodb.query_all(params)
+        return [MaintenanceOperation(item) for item in items]
+
+    @tracked()
+    async def get_latest_n_maintenance_operations_for_sensor(self, sensor_id, n):
+        try:
+            items, _ = await self.dynamodb.query_all(
+                self.sync_service.latest_operations_query_params(sensor_id, n), max_items=n)
+        except (BotoCoreError, ClientError) as error:
+            print(f"An error occurred: {error}")
+            return None
+        return [SensorMaintenance(item) for item in items]
+
+    @tracked()
+    async def put_sensor_into_maintenance(self, maintenance_details):
+        try:
+            sensor_details = await self.sensor_service.get_sensor_details_by_id(maintenance_details.sensor_id)
+            transact_items = [maintenance_details.generate_updated_metadata_record(self.table_name),
+                              maintenance_details.generate_new_maintenance_record(self.table_name, sensor_details)]
+            await self.dynamodb.transact_write_items(TransactItems=transact_items)
+            print(f"Added maintenance operation for {maintenance_details.SK} ")
+            return True
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"Error adding maintenance operation: {e}")
+            return False
+
+    @tracked()
+    async def conclude_maintenance_operation(self, sensor_id, sensor_type):
+        try:
+            latest_maintenance_operation = await self.get_latest_n_maintenance_operations_for_sensor(sensor_id, 1)
+            if not latest_maintenance_operation:
+                return False
+            operation = latest_maintenance_operation[0]
+            transact_items = [operation.generate_updated_metadata_record(self.table_name, sensor_type),
+                              operation.generate_updated_maintenance_record(self.table_name)]
+            await self.dynamodb.transact_write_items(TransactItems=transact_items)
+            print(f"Concluded maintenance operation for {sensor_id} ")
+            return True
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"Error concluding maintenance operation: {e}")
+            return False
+
+    @tracked()
+    async def schedule_sensor_maintenance(self, sensor_id, sensor_type, user_email):
+        try:
+            assigned_operation = SensorMaintenance.generate_scheduled_maintenance_record(self.table_name, sensor_id,
+                                                                                       sensor_type, user_email)
+            await self.dynamodb.transact_write_items(TransactItems=[assigned_operation])
+            print(f"Scheduled maintenance operation for {sensor_id}, assigned to {user_email} ")
+            return True
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"Error scheduling maintenance operation: {e}")
+            return False
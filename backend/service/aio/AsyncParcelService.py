@@ -0,0 +1,43 @@
+from botocore.exceptions import BotoCoreError, ClientError
+
+from backend.service.ParcelService import ParcelService
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB
+from utils.tracking import tracked
+
+
+class AsyncParcelService:
+    """asyncio counterpart of ParcelService's read path, decoding is shared with the synchronous service."""
+
+    def __init__(self, dynamodb: AsyncDynamoDB, sync_service: ParcelService = None):
+        self.dynamodb = dynamodb
+        self.sync_service = sync_service or get_container().parcel_service
+
+    @tracked()
+    async def get_all_active_parcels_in_field_optionally_by_plant_type(self, plant_type=None):
+        try:
+            items, _ = await self.dynamodb.query_all(self.sync_service.active_parcels_query_params(plant_type))
+            return self.sync_service.parse_area_response(items)
+        except (BotoCoreError, ClientError, Exception) as error:
+            print(f"An error occurred: {error}")
+        return []
+
+    async def get_all_active_parcels_in_field(self):
+        return await self.get_all_active_parcels_in_field_optionally_by_plant_type()
+
+    @tracked()
+    async def get_all_parcels_optionally_by_plant_type(self, plant_type=None):
+        try:
+            items, _ = await self.dynamodb.query_all(self.sync_service.all_parcels_query_params(plant_type))
+            return self.sync_service.parse_area_response(items)
+        except (BotoCoreError, ClientError) as error:
+            print(f"An error occurred: {error}")
+        return None
+
+    @tracked()
+    async def get_parcel_by_id(self, id):
+        response = await self.dynamodb.get_item(**self.sync_service.parcel_key_params(id))
+        item = response.get('Item', None)
+        if item:
+            return self.sync_service.parse_area_response([item])[0]
+        return None
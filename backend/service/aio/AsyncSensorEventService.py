@@ -0,0 +1,253 @@
+import asyncio
+from collections import defaultdict
+from typing import List, Tuple, Optional, Dict
+
+from botocore.exceptions import ClientError, BotoCoreError
+
+from backend.models.AggregateData import AggregateData
+from backend.models.SensorEvent import SensorEvent, DataType
+from backend.models.SensorEventColumns import SensorEventColumns
+from backend.service.SensorEventService import SensorEventService
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB, gather_bounded
+from backend.service.aio.AsyncSensorService import AsyncSensorService
+from playground import calculate_pks
+from utils.batch_write import chunk_items, backoff_delay, rejected_chunk_errors, unprocessed_errors, unique_items, \
+    item_errors, SPLIT_CHUNK
+from utils.sensor_events.sensor_events_generation import convert_to_unix_epoch, get_first_of_month_as_unix_timestamp
+from utils.sensor_events.sharding import event_partition_keys, merge_by_sort_key
+from utils.tracking import tracked
+
+
+class AsyncSensorEventService:
+    """
+    asyncio counterpart of SensorEventService. Query parameters and entity decoding are shared with
+    the synchronous service, only the I/O is awaited so many requests can be in flight on one loop.
+    """
+
+    def __init__(self, dynamodb: AsyncDynamoDB, sync_service: SensorEventService = None,
+                 sensor_service: AsyncSensorService = None, max_concurrency=64):
+        self.dynamodb = dynamodb
+        self.sync_service = sync_service or get_container().sensor_event_service
+        self.table_name = self.sync_service.table_name
+        self.sensor_service = sensor_service or AsyncSensorService(dynamodb)
+        self.max_concurrency = max_concurrency
+
+    @tracked()
+    async def query_aggregates(self, data_types: List[str] = None, date: str = None,
+                               month_year: Optional[Tuple[int, int]] = None):
+        try:
+            first_of_month, prefix, unix_date = self.sync_service.resolve_aggregate_period(data_types, date,
+                                                                                           month_year)
+            period = unix_date if prefix == 'Day' else first_of_month
+            # Shares the aggregate cache of the synchronous service
+            results, missing, generation = self.sync_service.cached_aggregates(data_types, prefix, period)
+            if not missing:
+                return results
+            closed = self.sync_service.is_aggregate_period_closed(date, month_year)
+            responses = await asyncio.gather(*(
+                self.dynamodb.query(**self.sync_service.aggregate_query_params(
+                    data_type, first_of_month, prefix, period))
+                for data_type in missing))
+            for data_type, response in zip(missing, responses):
+                items = response.get('Items', [])
+                incremental = not items and self.sync_service.incremental_aggregates is not None
+                if incremental:
+                    accumulators, _ = await self.dynamodb.query_all(
+                        self.sync_service.incremental_aggregate_query_params(data_type, first_of_month, prefix,
+                                                                             period))
+                    items = self.sync_service.incremental_aggregate_items(data_type, first_of_month, prefix,
+                                                                          period, accumulators)
+                items = [AggregateData(item) for item in items]
+                self.sync_service.cache_aggregates(data_type, prefix, period, items, closed and not incremental,
+                                                   generation)
+                if len(items) > 0:
+                    results[data_type] = items
+            return results
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"An error occurred: {e}")
+            return {}
+
+    @tracked()
+    async def query_sensor_events_by_parcelid_in_time_range(self, parcel_id, from_date, to_date,
+                                                            sensor_type_filters: List[str] = None, columnar=False):
+        try:
+            start_range_unix = convert_to_unix_epoch(from_date)
+            end_range_unix = convert_to_unix_epoch(to_date)
+            if sensor_type_filters and self.sync_service.parcel_type_index:
+                # One query per type on the parcel/type index, merged back into SK order
+                DataType.validate_data_types(sensor_type_filters)
+                pages = await gather_bounded(
+                    (self.dynamodb.query_all(self.sync_service.parcel_type_events_query_params(
+                        parcel_id, data_type, start_range_unix, end_range_unix))
+                     for data_type in dict.fromkeys(sensor_type_filters)),
+                    self.max_concurrency)
+                items = merge_by_sort_key(items for items, _ in pages)
+            else:
+                query_params = self.sync_service.parcel_events_query_params(parcel_id, start_range_unix,
+                                                                            end_range_unix, sensor_type_filters)
+                items, _ = await self.dynamodb.query_all(query_params)
+            if columnar:
+                return SensorEventColumns.from_entities(items)
+            grouped_items = defaultdict(list)
+            for item in items:
+                sensor_event = SensorEvent.from_entity(item)
+                grouped_items[sensor_event.data.dataType].append(sensor_event)
+            return grouped_items
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"An error occurred: {e}")
+            return SensorEventColumns.empty() if columnar else {}
+
+    @tracked()
+    async def query_sensor_events_for_field_in_time_range_by_type(self, start_range, end_range, data_type,
+                                                                  columnar=False):
+        try:
+            start_range_unix = convert_to_unix_epoch(start_range)
+            end_range_unix = convert_to_unix_epoch(end_range)
+            # Month partitions are disjoint, so querying them concurrently and concatenating keeps time order,
+            # the write shards of one month are merged back into SK order
+            months = [event_partition_keys(data_type, get_first_of_month_as_unix_timestamp(pk))
+                      for pk in calculate_pks(start_range, end_range)]
+            pages = await gather_bounded(
+                (self.dynamodb.query_all(self.sync_service.field_events_query_params(
+                    partition_key, start_range_unix, end_range_unix))
+                 for partition_keys in months for partition_key in partition_keys),
+                self.max_concurrency)
+            month_items = []
+            offset = 0
+            for partition_keys in months:
+                month_items.append(merge_by_sort_key(items for items, _ in pages[offset:offset + len(partition_keys)]))
+                offset += len(partition_keys)
+            if columnar:
+                return SensorEventColumns.concat([SensorEventColumns.from_entities(items) for items in month_items])
+            return [SensorEvent.from_entity(item) for items in month_items for item in items]
+        except (ClientError, BotoCoreError, ValueError, Exception) as e:
+            print("Boto3 client error:", e)
+            return SensorEventColumns.empty() if columnar else []
+
+    @tracked()
+    async def query_sensorevents_by_sensorid_in_time_range(self, sensor_id, start_range, end_range, columnar=False):
+        try:
+            query_params = self.sync_service.sensor_events_query_params(sensor_id,
+                                                                        convert_to_unix_epoch(start_range),
+                                                                        convert_to_unix_epoch(end_range))
+            items, _ = await self.dynamodb.query_all(query_params)
+            if columnar:
+                return SensorEventColumns.from_entities(items)
+            return [SensorEvent.from_entity(item) for item in items]
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"An error occurred while retrieving sensor events for sensor {sensor_id}:", e)
+            return SensorEventColumns.empty() if columnar else []
+
+    @tracked()
+    async def query_latest_n_sensorevents_by_sensorid(self, sensor_id, n):
+        try:
+            items, _ = await self.dynamodb.query_all(
+                self.sync_service.latest_events_query_params(sensor_id, n), max_items=n)
+            return [SensorEvent.from_entity(item) for item in items]
+        except (ClientError, BotoCoreError, Exception) as e:
+            print("Boto3 client error:", e)
+            return []
+
+    async def _query_events_of_sensors(self, active_sensors, from_date, to_date, errors: Dict[str, str] = None):
+        # Same contract as SensorEventService._query_events_of_sensors
+        start_range_unix = convert_to_unix_epoch(from_date)
+        end_range_unix = convert_to_unix_epoch(to_date)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def query_sensor(sensor):
+            async with semaphore:
+                try:
+                    items, _ = await self.dynamodb.query_all(self.sync_service.sensor_events_query_params(
+                        sensor.sensor_id, start_range_unix, end_range_unix))
+                    return sensor, items, None
+                except (ClientError, BotoCoreError, Exception) as e:
+                    return sensor, None, str(e)
+
+        grouped_items = defaultdict(list)
+        failed = {}
+        for next_done in asyncio.as_completed([query_sensor(sensor) for sensor in active_sensors]):
+            sensor, items, error = await next_done
+            if error is not None:
+                failed[sensor.sensor_id] = error
+                continue
+            grouped_items[sensor.sensor_type].extend(SensorEvent.from_entity(item) for item in items)
+        if failed:
+            print(f"Events of {len(failed)} of {len(active_sensors)} sensors could not be retrieved")
+        if errors is not None:
+            errors.update(failed)
+        return grouped_items
+
+    @tracked()
+    async def query_events_in_rectangle_for_timerange(self, polygon_coords: List[Tuple[float, float]],
+                                                      from_date: str, to_date: str, errors: Dict[str, str] = None):
+        try:
+            active_sensors = await self.sensor_service.get_active_sensors_in_rectangle_for_time_range(
+                polygon_coords, from_date, to_date)
+            return await self._query_events_of_sensors(active_sensors, from_date, to_date, errors)
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"An error occurred: {e}")
+            return {}
+
+    @tracked()
+    async def query_events_in_radius_for_timerange(self, center_point, radius_meters: float, from_date, to_date,
+                                                   errors: Dict[str, str] = None):
+        try:
+            active_sensors = await self.sensor_service.get_active_sensors_in_radius_for_time_range(
+                center_point, radius_meters, from_date, to_date)
+            return await self._query_events_of_sensors(active_sensors, from_date, to_date, errors)
+        except (ClientError, BotoCoreError, Exception) as e:
+            print(f"An error occurred: {e}")
+            return {}
+
+    @tracked()
+    async def add_sensor_event(self, sensor_event):
+        # Shares the recently-accepted key cache of the synchronous service, see SensorEventService.add_sensor_event
+        sensor_event_entry, put_params = self.sync_service.begin_sensor_event_write(sensor_event)
+        if put_params is None:
+            return sensor_event_entry['s_id']
+        try:
+            await self.dynamodb.put_item(**put_params)
+        except (ClientError, BotoCoreError, Exception) as e:
+            return self.sync_service.finish_sensor_event_write(sensor_event_entry, e)
+        return self.sync_service.finish_sensor_event_write(sensor_event_entry)
+
+    async def _write_chunk(self, chunk: List[Dict], max_retries=5, base_delay=0.05):
+        # Awaiting counterpart of utils.batch_write.write_chunk, errors are classified by rejected_chunk_errors
+        pending = [{'PutRequest': {'Item': item}} for item in chunk]
+        attempt = 0
+        while pending:
+            try:
+                response = await self.dynamodb.batch_write_item(RequestItems={self.table_name: pending})
+                pending = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except (ClientError, BotoCoreError) as e:
+                errors = rejected_chunk_errors(e, pending)
+                if errors is SPLIT_CHUNK:
+                    errors = {}
+                    for request in pending:
+                        errors.update(await self._write_chunk([request['PutRequest']['Item']], max_retries,
+                                                              base_delay))
+                    return errors
+                if errors is not None:
+                    return errors
+            if not pending:
+                break
+            if attempt >= max_retries:
+                return unprocessed_errors(pending)
+            await asyncio.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
+        return {}
+
+    @tracked()
+    async def write_entities(self, entities: List[Dict]):
+        # Same contract as SensorEventService.write_entities: one error message or None per entity
+        chunk_errors = await gather_bounded((self._write_chunk(chunk) for chunk in chunk_items(unique_items(entities))),
+                                            self.max_concurrency)
+        errors = {}
+        for chunk_error in chunk_errors:
+            errors.update(chunk_error)
+        return item_errors(entities, errors)
+
+    @tracked()
+    async def add_records(self, records: List[Dict]):
+        await self.dynamodb.transact_write_items(TransactItems=records)
@@ -0,0 +1,84 @@
+import asyncio
+from typing import List, Tuple
+
+from botocore.exceptions import ClientError, BotoCoreError
+
+from backend.models.SensorDetails import SensorDetails
+from backend.models.SensorLocationHistory import SensorLocationHistory
+from backend.service.SensorService import SensorService
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB, gather_bounded
+from utils.sensors.sensors_from_csv import parse_sensor_data
+from utils.tracking import tracked
+
+
+class AsyncSensorService:
+    """
+    asyncio counterpart of SensorService.
+    Geo queries go through dynamodbgeo, which only offers a blocking API, so they run on a worker thread.
+    Sensor writes validate against parcel polygons and are delegated to the synchronous service the same way.
+    """
+
+    def __init__(self, dynamodb: AsyncDynamoDB, sync_service: SensorService = None, max_concurrency=64):
+        self.dynamodb = dynamodb
+        self.sync_service = sync_service or get_container().sensor_service
+        self.table_name = self.sync_service.table_name
+        self.max_concurrency = max_concurrency
+
+    @tracked()
+    async def get_sensor_location_history(self, sensor_id, get_last_location=False):
+        params = self.sync_service.location_history_query_params(sensor_id, get_last_location)
+        try:
+            response = await self.dynamodb.query(**params)
+            return [SensorLocationHistory(item) for item in response.get('Items', [])]
+        except (ClientError, BotoCoreError, ValueError, Exception) as e:
+            print(f"Error retrieving sensor location history: {e}")
+            return []
+
+    @tracked()
+    async def batch_get_sensor_locations_histories(self, sensor_ids, get_last_location=False):
+        histories = await gather_bounded((self.get_sensor_location_history(sensor_id, get_last_location)
+                                          for sensor_id in sensor_ids), self.max_concurrency)
+        return dict(zip(sensor_ids, histories))
+
+    @tracked()
+    async def get_sensor_details_by_id(self, sensor_id):
+        try:
+            response = await self.dynamodb.query(**self.sync_service.sensor_details_query_params(sensor_id))
+            items = response.get('Items', [])
+            if items:
+                return SensorDetails(items[0])
+            print(f"No item found with Sensor ID: {sensor_id}")
+            return None
+        except (BotoCoreError, ClientError) as error:
+            print(f"An error occurred: {error}")
+            return None
+
+    @tracked()
+    async def get_all_active_sensors_in_field_or_with_optional_parcel_id(self, parcel_id=None, sensor_type=None):
+        params, operation = self.sync_service.active_sensors_params(parcel_id, sensor_type)
+        data, _ = await self.dynamodb.query_all(params, operation=operation)
+        return parse_sensor_data(data)
+
+    async def get_active_sensors_in_rectangle_for_time_range(self, polygon_coords: List[Tuple[float, float]],
+                                                             from_date: str, to_date: str):
+        return await asyncio.to_thread(self.sync_service.get_active_sensors_in_rectangle_for_time_range,
+                                       polygon_coords, from_date, to_date)
+
+    async def get_active_sensors_in_radius_for_time_range(self, center_point, radius_meters, from_date, to_date):
+        return await asyncio.to_thread(self.sync_service.get_active_sensors_in_radius_for_time_range,
+                                       center_point, radius_meters, from_date, to_date)
+
+    async def get_all_currently_active_sensors_in_radius_by_type(self, center_point, radius_meters: float,
+                                                                 sensor_type: str):
+        return await asyncio.to_thread(self.sync_service.get_all_currently_active_sensors_in_radius_by_type,
+                                       center_point, radius_meters, sensor_type)
+
+    async def add_sensor(self, lon, lat, sensor_details):
+        return await asyncio.to_thread(self.sync_service.add_sensor, lon, lat, sensor_details)
+
+    async def move_sensor(self, sensor_type, sensor_id, new_lon, new_lat):
+        return await asyncio.to_thread(self.sync_service.move_sensor, sensor_type, sensor_id, new_lon, new_lat)
+
+    async def retire_sensor(self, sensor_type, sensor_id):
+        return await asyncio.to_thread(self.sync_service.retire_sensor, sensor_type, sensor_id)
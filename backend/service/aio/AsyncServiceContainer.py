@@ -0,0 +1,64 @@
+import threading
+
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB, get_async_runtime
+
+
+class AsyncServiceContainer:
+    """
+    Async counterpart of ServiceContainer: every async service shares one AsyncDynamoDB (one loop, one pool)
+    and reuses the synchronous services of the process-wide container for parameter building and decoding.
+    """
+
+    def __init__(self, dynamodb: AsyncDynamoDB, services=None):
+        self.dynamodb = dynamodb
+        self.services = services or get_container()
+        self._lock = threading.RLock()
+        self._instances = {}
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    @property
+    def parcel_service(self):
+        from backend.service.aio.AsyncParcelService import AsyncParcelService
+        return self._get_or_create('parcel', lambda: AsyncParcelService(self.dynamodb, self.services.parcel_service))
+
+    @property
+    def sensor_service(self):
+        from backend.service.aio.AsyncSensorService import AsyncSensorService
+        return self._get_or_create('sensor', lambda: AsyncSensorService(self.dynamodb, self.services.sensor_service))
+
+    @property
+    def sensor_event_service(self):
+        from backend.service.aio.AsyncSensorEventService import AsyncSensorEventService
+        return self._get_or_create('sensor_event', lambda: AsyncSensorEventService(
+            self.dynamodb, self.services.sensor_event_service, self.sensor_service))
+
+    @property
+    def maintenance_service(self):
+        from backend.service.aio.AsyncMaintenanceService import AsyncMaintenanceService
+        return self._get_or_create('maintenance', lambda: AsyncMaintenanceService(
+            self.dynamodb, self.services.maintenance_service, self.sensor_service))
+
+    @property
+    def user_service(self):
+        from backend.service.aio.AsyncUserService import AsyncUserService
+        return self._get_or_create('user', lambda: AsyncUserService(self.dynamodb, self.services.user_service))
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_async_container():
+    # Container bound to the background loop of AsyncRuntime, run coroutines with AsyncRuntime.run / run_sync
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = AsyncServiceContainer(get_async_runtime().dynamodb)
+    return _container
@@ -0,0 +1,34 @@
+from botocore.exceptions import BotoCoreError, ClientError
+
+from backend.models.User import User
+from backend.service.UserService import UserService
+from backend.service.ServiceContainer import get_container
+from backend.service.aio.AsyncDynamoDB import AsyncDynamoDB
+from utils.tracking import tracked
+
+
+class AsyncUserService:
+    """asyncio counterpart of UserService."""
+
+    def __init__(self, dynamodb: AsyncDynamoDB, sync_service: UserService = None):
+        self.dynamodb = dynamodb
+        self.sync_service = sync_service or get_container().user_service
+
+    @tracked()
+    async def get_users_by_role(self, role):
+        try:
+            items, _ = await self.dynamodb.query_all(self.sync_service.users_by_role_query_params(role))
+            return [User(item) for item in items]
+        except (BotoCoreError, ClientError) as error:
+            print(f"An error occurred: {error}")
+            return None
+
+    @tracked()
+    async def get_user_details(self, user_email):
+        try:
+            response = await self.dynamodb.get_item(**self.sync_service.user_key_params(user_email))
+            user_item = response.get('Item')
+            return User(user_item) if user_item else None
+        except (BotoCoreError, ClientError) as error:
+            print(f"An error occurred: {error}")
+            return None
@@ -0,0 +1,55 @@
+import random
+import time
+import tracemalloc
+
+from backend.models.SensorEvent import SensorEvent
+from backend.models.SensorEventColumns import SensorEventColumns
+
+# Decode time and retained memory of a month-long field query result
+# "objects" is the SensorEvent-per-item path, "columnar" the SensorEventColumns path used by WorkerService
+
+ITEMS = 200_000
+SENSORS = 500
+PARCELS = 20
+MONTH_START = 1583017200
+
+
+def sample_items(n):
+    items = []
+    for i in range(n):
+        sensor = i % SENSORS
+        items.append({
+            'PK': {'S': f"Temperature#{MONTH_START}"},
+            'SK': {'S': f"Event#{MONTH_START + i * 13}#sensor-{sensor}"},
+            's_id': {'S': f"Event#sensor-{sensor}"},
+            'data_point': {'N': f"{random.uniform(-10, 40):.2f}"},
+            'geoJson': {'S': "46.629950494117644,28.13582094705882"},
+            'parcel_id': {'S': f"Grapevine#parcel-{sensor % PARCELS}"},
+            'battery_level': {'N': str(random.randint(0, 100))},
+            'data_type': {'S': "Temperature"}
+        })
+    return items
+
+
+def measure(name, decode, items):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = decode(items)
+    elapsed = time.perf_counter() - start
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {len(items)} items in {elapsed:.2f}s, {retained / 2 ** 20:.1f} MiB retained")
+    return elapsed, retained, result
+
+
+def main():
+    items = sample_items(ITEMS)
+    objects_elapsed, objects_memory, _ = measure('objects', lambda rows: [SensorEvent.from_entity(row)
+                                                                         for row in rows], items)
+    columnar_elapsed, columnar_memory, _ = measure('columnar', SensorEventColumns.from_entities, items)
+    print(f"Decode speed-up: {objects_elapsed / columnar_elapsed:.1f}x, "
+          f"memory reduction: {objects_memory / columnar_memory:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
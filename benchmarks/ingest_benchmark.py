@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.models.SensorEvent import SensorEvent
+from backend.service.ParcelService import ParcelService
+from backend.service.SensorEventService import SensorEventService
+from backend.service.SensorService import SensorService
+from backend.service.ServiceContainer import get_container
+from utils.polygon_def import create_dynamodb_client
+
+# Ingest throughput of the /data handler against the local DynamoDB from utils/polygon_def.py
+# "cold" reproduces the former per-request wiring: three fresh clients with empty connection pools
+# "pooled" resolves the service once from the process-wide container
+
+REQUESTS = 500
+CONCURRENCY = 8
+
+
+def sample_event(i):
+    return SensorEvent(
+        sensorId=f"benchmark-{i % 50}",
+        metadata={
+            "location": "(46.629950494117644,28.13582094705882)",
+            "battery_level": 33,
+            "parcel_id": "Chickpeas#af8ed50d-68c4-4cf9-b04e-bba5432d4b8e"
+        },
+        data={
+            "dataType": "SoilPH",
+            "dataPoint": 1,
+            "timestamp": f"2023-12-21T16:{(i // 60) % 60:02d}:{i % 60:02d}"
+        })
+
+
+def cold_request(i):
+    parcel_service = ParcelService(dynamodb=create_dynamodb_client())
+    sensor_service = SensorService(dynamodb=create_dynamodb_client(), parcel_service=parcel_service)
+    service = SensorEventService(dynamodb=create_dynamodb_client(), sensor_service=sensor_service)
+    service.add_sensor_event(sample_event(i))
+
+
+def pooled_request(i):
+    get_container().sensor_event_service.add_sensor_event(sample_event(i))
+
+
+def run(name, handler):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        list(executor.map(handler, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>7}: {REQUESTS} requests in {elapsed:.2f}s -> {REQUESTS / elapsed:.1f} req/s")
+    return REQUESTS / elapsed
+
+
+def main():
+    # Warm up imports and the shared pool so only steady state is measured
+    pooled_request(0)
+    cold = run('cold', cold_request)
+    pooled = run('pooled', pooled_request)
+    print(f"Speed-up: {pooled / cold:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
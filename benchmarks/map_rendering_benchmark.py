@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import time
+
+from shapely import Point
+
+# Runs as `python benchmarks/map_rendering_benchmark.py` or `python -m benchmarks.map_rendering_benchmark`
+# from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.service.MapRenderer import MapRenderer
+from backend.service.SensorGeoIndex import SensorGeoIndex
+from backend.service.SensorService import SensorService
+
+# Latency of the SensorService query methods that used to save a folium map on every call:
+# "inline" renders and saves the map before returning (the former behaviour), "off" is the new default
+# (render_map=False) and "background" hands the results to the renderer thread.
+# Queries are served by a loaded in-process sensor index and a simulated field scan, so the numbers are
+# the query work plus rendering, without network time.
+
+SENSORS = 200
+CALLS = 5
+CENTER = Point(28.1270, 46.6335)
+RECTANGLE = [(28.1250, 46.6320), (28.1290, 46.6320), (28.1290, 46.6350), (28.1250, 46.6350), (28.1250, 46.6320)]
+
+
+def sensor_items(i):
+    lat, lon = 46.6320 + (i % 50) * 0.00006, 28.1250 + (i // 50) * 0.0001
+    metadata = {
+        'PK': {'S': f'Sensor#s{i}'},
+        'SK': {'S': f'Metadata#SoilMoisture#s{i}'},
+        'sensor_type': {'S': 'SoilMoisture'},
+        'geoJson': {'S': f'{lat},{lon}'},
+        'hash_key': {'S': '1'},
+        'geohash': {'S': f'Metadata#SoilMoisture#{i}'},
+        'curr_parcelid': {'S': 'Grapevine#parcel-1'}
+    }
+    location = {
+        'PK': {'S': f'Sensor#s{i}'},
+        'SK': {'S': 'Location#1577836800'},
+        'sensortype': {'S': 'SoilMoisture'},
+        'geoJson': {'S': f'{lat},{lon}'},
+        'hash_key': {'S': '1'},
+        'geohash': {'S': f'Location#{i}'},
+        'id_parcel': {'S': 'Grapevine#parcel-1'},
+        'placed_at': {'N': '1577836800'}
+    }
+    return metadata, location
+
+
+class SimulatedDynamoDB:
+    def __init__(self, items):
+        self.items = items
+
+    def scan(self, **params):
+        return {'Items': self.items, 'ConsumedCapacity': {'CapacityUnits': 0.5}}
+
+
+def main():
+    items = [item for i in range(SENSORS) for item in sensor_items(i)]
+    service = SensorService(dynamodb=SimulatedDynamoDB([item for item in items if 'curr_parcelid' in item]))
+    service.sensor_index = SensorGeoIndex(lambda: items, max_age_s=3600)
+    service.sensor_index.load()
+    methods = {
+        'rectangle_for_time_range': lambda render_map: service.get_active_sensors_in_rectangle_for_time_range(
+            RECTANGLE, '2020-01-12T00:00:00', '2024-10-12T16:00:00', render_map=render_map),
+        'active_in_radius_by_type': lambda render_map: service.get_all_currently_active_sensors_in_radius_by_type(
+            CENTER, 500, 'SoilMoisture', render_map=render_map),
+        'radius_for_time_range': lambda render_map: service.get_active_sensors_in_radius_for_time_range(
+            CENTER, 500, '2020-01-12T00:00:00', '2024-10-12T16:00:00', render_map=render_map),
+        'field_or_parcel': lambda render_map: service.get_all_active_sensors_in_field_or_with_optional_parcel_id(
+            render_map=render_map),
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, call in methods.items():
+            timings = {}
+            for mode, render_map, background in (('inline', True, False), ('off', False, True),
+                                                 ('background', True, True)):
+                service.map_renderer = MapRenderer(output_dir, background=background, max_pending=CALLS)
+                start = time.perf_counter()
+                for _ in range(CALLS):
+                    call(render_map)
+                timings[mode] = (time.perf_counter() - start) / CALLS * 1000
+                service.map_renderer.flush()
+            print(f"{name:<26} inline {timings['inline']:7.1f} ms, off {timings['off']:6.1f} ms, "
+                  f"background {timings['background']:6.1f} ms -> saves {timings['inline'] - timings['off']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
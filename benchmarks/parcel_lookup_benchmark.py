@@ -0,0 +1,56 @@
+import time
+
+from shapely import Point
+
+from backend.service.ParcelService import ParcelService
+from utils.sensors.sensor_placing_generation import is_point_in_parcel
+
+# Point-in-parcel lookup of add_sensor / move_sensor with a simulated DynamoDB round trip
+# "query + scan" reproduces the former path (load and parse all active parcels, then a linear contains() scan),
+# "index" is the cached STRtree of ParcelService.find_active_parcel_for_point
+
+LATENCY_S = 0.005
+PARCEL_COUNTS = (50, 500, 2000)
+LOOKUPS = 200
+
+
+def parcel_item(i):
+    polygon = [(i * 0.001, 0.0), (i * 0.001 + 0.001, 0.0), (i * 0.001 + 0.001, 0.001), (i * 0.001, 0.001)]
+    return {
+        'PK': {'S': 'Parcel'},
+        'SK': {'S': f'Grapevine#parcel-{i}'},
+        'polygon_coord': {'S': str(polygon)},
+        'plant_type': {'S': 'Grapevine'},
+        'active': {'N': '1'}
+    }
+
+
+class SimulatedDynamoDB:
+    def __init__(self, parcel_count):
+        self.items = [parcel_item(i) for i in range(parcel_count)]
+
+    def query(self, **params):
+        time.sleep(LATENCY_S)
+        return {'Items': self.items, 'ConsumedCapacity': {'CapacityUnits': 0.5}}
+
+
+def main():
+    for parcel_count in PARCEL_COUNTS:
+        service = ParcelService(dynamodb=SimulatedDynamoDB(parcel_count), sensor_service=object())
+        points = [Point((i % parcel_count) * 0.001 + 0.0005, 0.0005) for i in range(LOOKUPS)]
+
+        start = time.perf_counter()
+        for point in points:
+            is_point_in_parcel(point, service.get_all_active_parcels_in_field())
+        scan_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for point in points:
+            service.find_active_parcel_for_point(point)
+        index_s = time.perf_counter() - start
+        print(f"{parcel_count:>5} parcels, {LOOKUPS} lookups: query + scan {scan_s:.2f}s, index {index_s:.3f}s "
+              f"-> {scan_s / index_s:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
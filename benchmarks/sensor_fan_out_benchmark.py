@@ -0,0 +1,66 @@
+import time
+from types import SimpleNamespace
+
+from backend.service.SensorEventService import SensorEventService
+
+# Per-sensor event queries of query_events_in_radius_for_timerange with a simulated DynamoDB round trip
+# "sequential" reproduces the former for-loop over sensors, "fan-out" is the bounded shared-pool version
+
+LATENCY_S = 0.02
+EVENTS_PER_SENSOR = 20
+SENSOR_COUNTS = (50, 200, 1000)
+SENSOR_TYPES = ('Temperature', 'Humidity', 'SoilMoisture', 'Light')
+
+
+class SimulatedDynamoDB:
+    def query(self, **params):
+        time.sleep(LATENCY_S)
+        sensor_id = params['ExpressionAttributeValues'][':pval']['S'].split('#', 1)[1]
+        return {
+            'Items': [{
+                'PK': {'S': 'Temperature#1583017200'},
+                'SK': {'S': f"Event#{1583017200 + i}#{sensor_id}"},
+                's_id': {'S': f"Event#{sensor_id}"},
+                'data_point': {'N': '21.5'},
+                'geoJson': {'S': '46.6299,28.1358'},
+                'parcel_id': {'S': 'Grapevine#parcel-1'},
+                'battery_level': {'N': '80'},
+                'data_type': {'S': 'Temperature'}
+            } for i in range(EVENTS_PER_SENSOR)],
+            'ConsumedCapacity': {'CapacityUnits': 0.5}
+        }
+
+
+class SimulatedSensorService:
+    def __init__(self, sensor_count):
+        self.sensors = [SimpleNamespace(sensor_id=f"sensor-{i}", sensor_type=SENSOR_TYPES[i % len(SENSOR_TYPES)])
+                        for i in range(sensor_count)]
+
+    def get_active_sensors_in_radius_for_time_range(self, center_point, radius_meters, from_date, to_date):
+        return self.sensors
+
+
+def sequential(service, sensors, from_date, to_date):
+    for sensor in sensors:
+        service.query_sensorevents_by_sensorid_in_time_range(sensor.sensor_id, from_date, to_date)
+
+
+def main():
+    from_date, to_date = '2020-03-01T00:00:00', '2020-03-31T23:59:59'
+    for sensor_count in SENSOR_COUNTS:
+        sensor_service = SimulatedSensorService(sensor_count)
+        service = SensorEventService(dynamodb=SimulatedDynamoDB(), sensor_service=sensor_service)
+
+        start = time.perf_counter()
+        sequential(service, sensor_service.sensors, from_date, to_date)
+        sequential_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        service.query_events_in_radius_for_timerange(None, 500, from_date, to_date)
+        fan_out_s = time.perf_counter() - start
+        print(f"{sensor_count:>5} sensors: sequential {sequential_s:.2f}s, fan-out {fan_out_s:.2f}s "
+              f"(concurrency {service.max_concurrency}) -> {sequential_s / fan_out_s:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
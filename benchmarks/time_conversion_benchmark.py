@@ -0,0 +1,67 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from dateutil import parser
+
+from utils.sensor_events import time_utils
+
+# Per-event timestamp cost of building a SensorEvent entity and decoding it again
+# "legacy" reproduces the former path: dateutil parse, strptime + mktime for the SK,
+# a second parse for the month partition and localtime + reparse when reading back
+# "cached" is the time_utils path used by SensorEvent now
+
+EVENTS = 20_000
+
+
+def sample_timestamps(n):
+    start = datetime(2023, 1, 1)
+    return [(start + timedelta(seconds=random.randint(0, 365 * 24 * 3600))).strftime(time_utils.ISO_FORMAT)
+            for _ in range(n)]
+
+
+def legacy_event(timestamp):
+    normalized = parser.parse(timestamp).strftime("%Y-%m-%dT%H:%M:%S")
+    epoch = int(time.mktime(datetime.strptime(normalized, "%Y-%m-%dT%H:%M:%S").timetuple()))
+    first_of_month = parser.parse(normalized).replace(day=1, hour=0, minute=0, second=0)
+    month_start = int(time.mktime(first_of_month.timetuple()))
+    decoded = parser.parse(datetime.fromtimestamp(epoch).astimezone().isoformat()).strftime("%Y-%m-%dT%H:%M:%S")
+    return epoch, month_start, decoded
+
+
+def cached_event(timestamp):
+    epoch, _ = time_utils.normalize_timestamp(timestamp)
+    month_start = time_utils.month_start_of_epoch(epoch)
+    decoded = time_utils.epoch_to_iso(epoch)
+    return epoch, month_start, decoded
+
+
+def run(name, handler, timestamps):
+    start = time.perf_counter()
+    results = [handler(timestamp) for timestamp in timestamps]
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {len(timestamps)} events in {elapsed:.2f}s -> {elapsed / len(timestamps) * 1e6:.2f} us/event")
+    return elapsed, results
+
+
+def main():
+    timestamps = sample_timestamps(EVENTS)
+    legacy_elapsed, legacy_results = run('legacy', legacy_event, timestamps)
+    cached_elapsed, cached_results = run('cached', cached_event, timestamps)
+    mismatches = sum(1 for a, b in zip(legacy_results, cached_results) if a != b)
+    print(f"Speed-up: {legacy_elapsed / cached_elapsed:.1f}x, mismatches: {mismatches}")
+
+    start = time.perf_counter()
+    epochs = time_utils.to_epoch_array(timestamps)
+    month_starts = time_utils.month_start_epoch_array(epochs)
+    time_utils.epoch_array_to_iso(epochs)
+    elapsed = time.perf_counter() - start
+    print(f"{'vectorized':>10}: {len(timestamps)} events in {elapsed:.2f}s -> {elapsed / len(timestamps) * 1e6:.2f} us/event")
+    vector_mismatches = sum(1 for (epoch, month_start, _), e, m in zip(cached_results, epochs.tolist(),
+                                                                      month_starts.tolist())
+                            if (epoch, month_start) != (e, m))
+    print(f"Vectorized mismatches: {vector_mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Puts the repository root on sys.path, the tests import backend and utils like the app does
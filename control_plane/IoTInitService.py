@@ -6,10 +6,12 @@ from botocore.exceptions import ClientError
 from backend.models.MaintenanceEnum import MaintenanceType
 from dynamodbgeo import GeoDataManagerConfiguration, GeoDataManager, GeoTableUtil, GeoPoint, S2Manager
 from utils.handle_error import handle_error
+from utils.pagination import QueryPaginator
 from utils.parcels.parcels_from_csv import read_and_process_parcels_from_json
 from utils.polygon_def import create_dynamodb_client, hashKeyLength
 from utils.sensor_events.sensor_events_generation import process_events_for_db, convert_to_unix_epoch, \
     random_date_string
+from utils.sensor_events.sharding import parcel_type_key
 from utils.sensors.sensors_from_csv import json_to_array, csv_to_json
 from utils.users_and_roles.user_and_roles_generation import read_users_from_json
 
@@ -193,6 +195,44 @@ class IoTInitService:
         self.batch_write(items=json_array)
         print(f"Inserted Number of Events in base table: {len(json_array)}")
 
+    def backfill_parcel_type(self):
+        # Adds parcel_type to events written before GSI_Events_By_Parcel_Type existed, so the index covers them
+        params = {
+            'TableName': self.table_name,
+            'FilterExpression': 'begins_with(SK, :event) AND attribute_not_exists(parcel_type)',
+            'ProjectionExpression': 'PK, SK, parcel_id, data_type',
+            'ExpressionAttributeValues': {':event': {'S': 'Event#'}}
+        }
+        updated = 0
+        for item in QueryPaginator(self.dynamodb, params, operation='scan'):
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'PK': item['PK'], 'SK': item['SK']},
+                UpdateExpression='SET parcel_type = :parcel_type',
+                ExpressionAttributeValues={
+                    ':parcel_type': {'S': parcel_type_key(item['parcel_id']['S'], item['data_type']['S'])}
+                })
+            updated += 1
+        print(f"Backfilled parcel_type on {updated} events")
+
+    def backfill_moved_at_numbers(self):
+        # Parcel retirements stored moved_at as a string, the location time range filters compare numbers
+        params = {
+            'TableName': self.table_name,
+            'FilterExpression': 'begins_with(SK, :location) AND attribute_type(moved_at, :string)',
+            'ProjectionExpression': 'PK, SK, moved_at',
+            'ExpressionAttributeValues': {':location': {'S': 'Location#'}, ':string': {'S': 'S'}}
+        }
+        updated = 0
+        for item in QueryPaginator(self.dynamodb, params, operation='scan'):
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'PK': item['PK'], 'SK': item['SK']},
+                UpdateExpression='SET moved_at = :moved_at',
+                ExpressionAttributeValues={':moved_at': {'N': item['moved_at']['S']}})
+            updated += 1
+        print(f"Converted moved_at to a number on {updated} location records")
+
     def insert_parcels(self):
         json_array = read_and_process_parcels_from_json()
         self.batch_write(items=json_array)
@@ -240,6 +280,12 @@ if __name__ == "__main__":
         gsi_name=gsi_name,
         gsi_pk='parcel_id',
         gsi_pk_type='S', gsi_sk='SK', gsi_sk_type='S')
+    initService.custom_gsi_waiter(gsi_name)
+    gsi_name = 'GSI_Events_By_Parcel_Type'
+    initService.create_gsi(
+        gsi_name=gsi_name,
+        gsi_pk='parcel_type',
+        gsi_pk_type='S', gsi_sk='SK', gsi_sk_type='S')
     response = initService.custom_gsi_waiter(gsi_name)
     #print(response)
     # Table summaries
@@ -0,0 +1,75 @@
+import asyncio
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from backend.models.SensorEvent import SensorEvent
+from backend.service.SensorEventService import SensorEventService
+from backend.service.aio.AsyncSensorEventService import AsyncSensorEventService
+from test_batch_write import FakeBatchClient, items
+from test_sensor_event import SAMPLE_EVENT
+
+
+class FakeAsyncDynamoDB:
+    """Awaitable wrapper of a synchronous fake client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def batch_write_item(self, **kwargs):
+        return self.client.batch_write_item(**kwargs)
+
+    async def put_item(self, **kwargs):
+        return self.client.put_item(**kwargs)
+
+
+class FakePutClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.written = []
+
+    def put_item(self, TableName, Item, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.written.append(Item)
+
+
+class UnreachableClient:
+    def batch_write_item(self, RequestItems):
+        raise EndpointConnectionError(endpoint_url='http://localhost:8000')
+
+
+def async_service(client):
+    sync_service = SensorEventService(dynamodb=client, sensor_service=object())
+    return AsyncSensorEventService(FakeAsyncDynamoDB(client), sync_service=sync_service, sensor_service=object())
+
+
+def test_invalid_item_fails_alone():
+    client = FakeBatchClient()
+    errors = asyncio.run(async_service(client).write_entities(items(30, invalid={3, 27})))
+    assert [index for index, error in enumerate(errors) if error] == [3, 27]
+    assert errors[3] == '[ValidationException] Invalid attribute value'
+    assert len(client.written) == 28
+
+
+def test_connection_error_fails_the_chunk_like_the_sync_service():
+    service = async_service(UnreachableClient())
+    errors = asyncio.run(service.write_entities(items(3)))
+    assert errors == service.sync_service.write_entities(items(3))
+    assert all(error.startswith('Could not connect') for error in errors)
+
+
+def test_add_sensor_event_shares_dedup_with_the_sync_service():
+    client = FakePutClient()
+    service = async_service(client)
+    event = SensorEvent(**SAMPLE_EVENT)
+    assert asyncio.run(service.add_sensor_event(event)) == {'S': f"Event#{SAMPLE_EVENT['sensorId']}"}
+    assert service.sync_service.add_sensor_event(event) is not None
+    assert len(client.written) == 1
+
+
+def test_conditional_duplicate_is_acknowledged():
+    error = ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'exists'}}, 'PutItem')
+    service = async_service(FakePutClient(error))
+    service.sync_service.conditional_writes = True
+    assert asyncio.run(service.add_sensor_event(SensorEvent(**SAMPLE_EVENT))) is not None
+    assert service.sync_service.idempotency_stats()['conditional_duplicates'] == 1
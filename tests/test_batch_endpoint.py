@@ -0,0 +1,91 @@
+import copy
+
+import pytest
+from botocore.exceptions import ClientError
+
+from backend import app as app_module
+from backend.service import ServiceContainer as container_module
+from backend.service.SensorEventService import SensorEventService
+
+SAMPLE_EVENT = {
+    'sensorId': '32c3ecce-6589-445f-8f64-4d7422d4f1bf',
+    'metadata': {'location': '(46.629950494117644,28.13582094705882)', 'battery_level': 33,
+                 'parcel_id': 'Chickpeas#af8ed50d-68c4-4cf9-b04e-bba5432d4b8e'},
+    'data': {'dataType': 'SoilPH', 'dataPoint': 1, 'timestamp': '2023-12-21T16:00:00'}
+}
+
+
+class FakeDynamoDB:
+    """BatchWriteItem that rejects a whole request containing an event of a sensor in `failing_sensors`."""
+
+    def __init__(self, failing_sensors=()):
+        self.failing_sensors = set(failing_sensors)
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        (table, requests), = RequestItems.items()
+        items = [request['PutRequest']['Item'] for request in requests]
+        if any(item['SK']['S'].split('#')[-1] in self.failing_sensors for item in items):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'Invalid attribute value'}},
+                              'BatchWriteItem')
+        self.written += items
+        return {}
+
+
+def event(sensor_id=SAMPLE_EVENT['sensorId'], timestamp='2023-12-21T16:00:00'):
+    data = copy.deepcopy(SAMPLE_EVENT)
+    data['sensorId'] = sensor_id
+    data['data']['timestamp'] = timestamp
+    return data
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    dynamodb = FakeDynamoDB(failing_sensors={'broken-sensor'})
+    container = container_module.ServiceContainer(dynamodb=dynamodb)
+    container._services['sensor_event'] = SensorEventService(dynamodb=dynamodb, sensor_service=object())
+    monkeypatch.setattr(container_module, '_container', container)
+    return dynamodb
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_all_written_returns_200(dynamodb, client):
+    response = client.post('/data/batch', json=[event(timestamp='2023-12-21T16:00:00'),
+                                                 event(timestamp='2023-12-21T17:00:00')])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['summary']['written'] == 2
+    assert [result['status'] for result in body['results']] == ['written', 'written']
+    assert len(dynamodb.written) == 2
+
+
+def test_partial_failure_reports_every_item_and_returns_207(dynamodb, client):
+    malformed = event()
+    malformed['data']['dataPoint'] = 'abc'
+    response = client.post('/data/batch', json=[event(), malformed, event(sensor_id='broken-sensor'), event()])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert [result['index'] for result in body['results']] == [0, 1, 2, 3]
+    assert [result['status'] for result in body['results']] == ['written', 'rejected', 'failed', 'duplicate']
+    assert body['results'][2]['error'] == '[ValidationException] Invalid attribute value'
+    assert body['results'][3]['error'] == 'Duplicate of event at index 0'
+    assert body['summary'] == {'written': 1, 'rejected': 1, 'duplicate': 1, 'in_flight': 0, 'failed': 1}
+    assert [item['SK']['S'] for item in dynamodb.written] == [f"Event#1703174400#{SAMPLE_EVENT['sensorId']}"]
+
+
+def test_redelivered_batch_is_reported_as_duplicates(dynamodb, client):
+    batch = [event(timestamp='2023-12-21T16:00:00'), event(timestamp='2023-12-21T17:00:00')]
+    assert client.post('/data/batch', json=batch).status_code == 200
+    response = client.post('/data/batch', json=batch)
+    assert response.status_code == 207
+    assert [result['status'] for result in response.get_json()['results']] == ['duplicate', 'duplicate']
+    assert len(dynamodb.written) == 2
+
+
+def test_request_must_be_a_non_empty_array(dynamodb, client):
+    assert client.post('/data/batch', json=[]).status_code == 400
+    assert client.post('/data/batch', json=event()).status_code == 400
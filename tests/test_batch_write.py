@@ -0,0 +1,45 @@
+from botocore.exceptions import ClientError
+
+from utils.batch_write import batch_write_items
+
+
+class FakeBatchClient:
+    """BatchWriteItem that rejects a whole request containing an item marked invalid, like DynamoDB does."""
+
+    def __init__(self, unprocessed_once=0):
+        self.written = []
+        self.requests = 0
+        self.unprocessed_once = unprocessed_once
+
+    def batch_write_item(self, RequestItems):
+        self.requests += 1
+        (table, requests), = RequestItems.items()
+        items = [request['PutRequest']['Item'] for request in requests]
+        if any('invalid' in item for item in items):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'Invalid attribute value'}},
+                              'BatchWriteItem')
+        unprocessed, self.unprocessed_once = requests[:self.unprocessed_once], 0
+        self.written += items[len(unprocessed):]
+        return {'UnprocessedItems': {table: unprocessed}} if unprocessed else {}
+
+
+def items(count, invalid=()):
+    return [dict({'PK': {'S': 'SoilPH#1'}, 'SK': {'S': f'Event#{i}#s'}}, **({'invalid': {'BOOL': True}}
+                                                                               if i in invalid else {}))
+            for i in range(count)]
+
+
+def test_invalid_item_fails_alone():
+    client = FakeBatchClient()
+    errors = batch_write_items(client, 'IoT', items(30, invalid={3, 27}))
+    assert [index for index, error in enumerate(errors) if error] == [3, 27]
+    assert errors[3] == '[ValidationException] Invalid attribute value'
+    assert len(client.written) == 28
+
+
+def test_unprocessed_items_are_retried():
+    client = FakeBatchClient(unprocessed_once=5)
+    errors = batch_write_items(client, 'IoT', items(10))
+    assert errors == [None] * 10
+    assert sorted(item['SK']['S'] for item in client.written) == sorted(item['SK']['S'] for item in items(10))
+    assert client.requests == 2
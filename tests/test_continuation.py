@@ -0,0 +1,44 @@
+import pytest
+
+from utils.continuation import decode_token, encode_token, is_start_key
+
+START_KEY = {'PK': {'S': 'SoilPH#1704067200'}, 'SK': {'S': 'Event#1704067300#s1'}, 's_id': {'S': 'Event#s1'}}
+
+
+def test_round_trip():
+    token = encode_token(START_KEY, '/sensors/s1/events')
+    assert decode_token(token, '/sensors/s1/events') == START_KEY
+
+
+def test_nothing_left_to_read_has_no_token():
+    assert encode_token(None, '/events/SoilPH') is None
+    assert decode_token(None, '/events/SoilPH') is None
+    assert decode_token('', '/events/SoilPH') is None
+
+
+def test_token_of_another_scope_is_rejected():
+    token = encode_token(START_KEY, '/sensors/s1/events')
+    with pytest.raises(ValueError, match="does not belong"):
+        decode_token(token, '/sensors/s2/events')
+
+
+@pytest.mark.parametrize('token', ['not-base64!', 'bm90IGpzb24', encode_token({'k': 1}, 'x')[:-3]])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(ValueError):
+        decode_token(token, 'x')
+
+
+def test_resume_state_of_the_wrong_shape_is_rejected():
+    token = encode_token({'start_after': 'Event#1#s1'}, '/sensors/s1/events')
+    with pytest.raises(ValueError, match="does not match"):
+        decode_token(token, '/sensors/s1/events',
+                     lambda state: is_start_key(state, ('PK', 'SK', 's_id')))
+
+
+def test_is_start_key():
+    assert is_start_key(START_KEY, ('PK', 'SK', 's_id'))
+    assert is_start_key({'PK': {'S': 'a'}, 'SK': {'N': '1'}}, ('PK', 'SK'))
+    assert not is_start_key(START_KEY, ('PK', 'SK'))
+    assert not is_start_key({'PK': {'S': 'a'}, 'SK': 'b'}, ('PK', 'SK'))
+    assert not is_start_key({'PK': {'S': 'a'}, 'SK': {'S': 1}}, ('PK', 'SK'))
+    assert not is_start_key({'PK': {'S': 'a', 'N': '1'}, 'SK': {'S': 'b'}}, ('PK', 'SK'))
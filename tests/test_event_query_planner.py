@@ -0,0 +1,55 @@
+from backend.service.EventQueryPlanner import EventQueryPlanner, FIELD, PARCEL, PARCEL_TYPE
+from backend.service.SensorEventService import SensorEventService
+from utils import tracking
+
+# 2023-01-10T00:00:00Z to 2023-03-20T00:00:00Z, three month partitions per type
+START = 1673308800
+END = 1679270400
+
+
+class FakeCountClient:
+    """Answers COUNT queries with a fixed count of events per sample window for each index (None: base table)."""
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.queries = []
+
+    def query(self, **params):
+        self.queries.append(params)
+        return {'Count': self.counts[params.get('IndexName')], 'ConsumedCapacity': {'CapacityUnits': 0.5}}
+
+
+def planner(counts, parcel_type_index=False, **kwargs):
+    client = FakeCountClient(counts)
+    service = SensorEventService(dynamodb=client, sensor_service=object())
+    service.parcel_type_index = parcel_type_index
+    return EventQueryPlanner(service, **kwargs), client
+
+
+def test_dominated_field_partitions_are_not_sampled():
+    event_planner, client = planner({'GSI_AllSensorEvents_Parcel': 50, 'GSI_Events_By_Parcel_Type': 0},
+                                    parcel_type_index=True)
+    plan = event_planner.plan_parcel_events('Chickpeas#p1', START, END, ['SoilPH', 'Humidity'])
+    assert plan.path == PARCEL_TYPE
+    assert plan.candidates[FIELD] is None
+    assert all('IndexName' in params for params in client.queries)
+
+
+def test_sampling_stays_within_the_plan_budget():
+    event_planner, client = planner({'GSI_AllSensorEvents_Parcel': 1000, None: 1}, max_sample_queries=4)
+    plan = event_planner.plan_parcel_events('Chickpeas#p1', START, END, ['SoilPH', 'Humidity'])
+    assert len(client.queries) <= 4
+    assert plan.path == PARCEL
+    assert plan.candidates[FIELD] is None
+
+
+def test_sampling_cost_is_charged_to_the_plan_and_the_unit_of_work():
+    event_planner, client = planner({'GSI_AllSensorEvents_Parcel': 10, None: 10})
+    with tracking.track('request', log=False) as usage:
+        plan = event_planner.plan_parcel_events('Chickpeas#p1', START, END, ['SoilPH'])
+    assert plan.sampling_queries == len(client.queries) > 0
+    assert plan.sampling_rcu == 0.5 * len(client.queries)
+    assert usage.summary()['nested'] == {'EventQueryPlanner.plan_parcel_events': 1}
+    assert event_planner.stats()['last_plan']['sampling_rcu'] == plan.sampling_rcu
+    cached = event_planner.plan_parcel_events('Chickpeas#p1', START, END, ['SoilPH'])
+    assert (cached.sampling_queries, cached.sampling_rcu) == (0, 0.0)
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from utils.fan_out import PageStream, bounded_map, stream_pages
+
+
+def numbered_pages(name, count, fetched):
+    for i in range(count):
+        fetched.append((name, i))
+        yield [f'{name}{i}']
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_streams_keep_input_order():
+    fetched = []
+    streams = stream_pages(numbered_pages, [(name, 4, fetched) for name in 'abc'], max_concurrency=2)
+    assert [page[0] for stream in streams for page in stream] == [f'{name}{i}' for name in 'abc' for i in range(4)]
+
+
+def test_producer_stays_at_most_max_pages_ahead():
+    fetched = []
+    stream, = stream_pages(numbered_pages, [('a', 100, fetched)], max_pages=2)
+    # Two pages wait in the stream, the third blocks its producer
+    assert wait_for(lambda: len(fetched) == 3)
+    time.sleep(0.1)
+    assert len(fetched) == 3
+    iterator = iter(stream)
+    next(iterator)
+    assert wait_for(lambda: len(fetched) == 4)
+    stream.close()
+
+
+def test_closed_stream_issues_no_further_query():
+    fetched = []
+    streams = stream_pages(numbered_pages, [('a', 100, fetched), ('b', 100, fetched)], max_concurrency=1)
+    assert wait_for(lambda: len(fetched) == 3)
+    for stream in streams:
+        stream.close()
+    time.sleep(0.3)
+    # The producer blocked on a full stream gives up and the pending one never starts
+    assert fetched == [('a', 0), ('a', 1), ('a', 2)]
+
+
+def test_producer_error_is_raised_to_the_consumer():
+    def failing_pages():
+        yield [1]
+        raise RuntimeError('query failed')
+
+    stream, = stream_pages(failing_pages, [()])
+    iterator = iter(stream)
+    assert next(iterator) == [1]
+    with pytest.raises(RuntimeError, match='query failed'):
+        next(iterator)
+
+
+def test_inline_stream_fetches_while_it_is_read():
+    fetched = []
+    stream = PageStream.inline(numbered_pages('a', 3, fetched))
+    assert fetched == []
+    assert list(stream) == [['a0'], ['a1'], ['a2']]
+
+
+def test_bounded_map_returns_results_in_input_order():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def task(i):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01 * (10 - i))
+        with lock:
+            running[0] -= 1
+        return i * i
+
+    assert bounded_map(task, [(i,) for i in range(10)], max_concurrency=3) == [i * i for i in range(10)]
+    assert peak[0] <= 3
+
+
+def test_bounded_map_return_exceptions():
+    def task(i):
+        if i == 1:
+            raise ValueError('bad')
+        return i
+
+    results = bounded_map(task, [(i,) for i in range(3)], return_exceptions=True)
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], ValueError)
+    with pytest.raises(ValueError):
+        bounded_map(task, [(i,) for i in range(3)])
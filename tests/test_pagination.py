@@ -0,0 +1,78 @@
+from utils.pagination import QueryPaginator
+
+
+class FakeTable:
+    """Query over one partition of items sorted by SK, honouring Limit and ExclusiveStartKey."""
+
+    def __init__(self, count, page_cap=None):
+        self.items = [{'PK': {'S': 'p'}, 'SK': {'S': f'Event#{i:04d}'}} for i in range(count)]
+        self.page_cap = page_cap
+        self.calls = []
+
+    def query(self, **params):
+        self.calls.append(params)
+        start = 0
+        if 'ExclusiveStartKey' in params:
+            start_sk = params['ExclusiveStartKey']['SK']['S']
+            start = next(i for i, item in enumerate(self.items) if item['SK']['S'] > start_sk)
+        limit = min(filter(None, (params.get('Limit'), self.page_cap)), default=len(self.items))
+        items = self.items[start:start + limit]
+        response = {'Items': items, 'ConsumedCapacity': {'CapacityUnits': 0.5}}
+        if start + limit < len(self.items):
+            response['LastEvaluatedKey'] = {'PK': items[-1]['PK'], 'SK': items[-1]['SK']}
+        return response
+
+
+def sort_keys(items):
+    return [item['SK']['S'] for item in items]
+
+
+def test_reads_all_pages():
+    table = FakeTable(25, page_cap=10)
+    paginator = QueryPaginator(table, {'TableName': 'IoT'})
+    assert sort_keys(paginator.all()) == sort_keys(table.items)
+    assert paginator.page_count == 3
+    assert paginator.consumed_capacity == 1.5
+    assert paginator.last_evaluated_key is None
+
+
+def test_max_items_trims_the_last_page_and_resumes_after_it():
+    table = FakeTable(25, page_cap=10)
+    first = QueryPaginator(table, {'TableName': 'IoT'}, max_items=7, page_size=5, initial_page_size=5)
+    assert sort_keys(first.all()) == sort_keys(table.items[:7])
+    assert first.last_evaluated_key == {'PK': {'S': 'p'}, 'SK': {'S': 'Event#0006'}}
+
+    rest = QueryPaginator(table, {'TableName': 'IoT'}, start_key=first.last_evaluated_key)
+    assert sort_keys(rest.all()) == sort_keys(table.items[7:])
+
+
+def test_resume_key_after_partial_iteration():
+    table = FakeTable(12, page_cap=10)
+    paginator = QueryPaginator(table, {'TableName': 'IoT'})
+    iterator = iter(paginator)
+    handed_out = [next(iterator) for _ in range(4)]
+    assert paginator.last_evaluated_key == {'PK': {'S': 'p'}, 'SK': handed_out[-1]['SK']}
+
+    rest = QueryPaginator(table, {'TableName': 'IoT'}, start_key=paginator.last_evaluated_key)
+    assert sort_keys(handed_out + rest.all()) == sort_keys(table.items)
+
+
+def test_pages_resume_after_a_complete_page():
+    table = FakeTable(12, page_cap=5)
+    paginator = QueryPaginator(table, {'TableName': 'IoT'})
+    first_page = next(paginator.pages())
+    assert len(first_page) == 5
+    assert paginator.last_evaluated_key == {'PK': {'S': 'p'}, 'SK': {'S': 'Event#0004'}}
+
+
+def test_page_limit_grows_up_to_page_size():
+    table = FakeTable(100)
+    QueryPaginator(table, {'TableName': 'IoT'}, page_size=40, initial_page_size=10).all()
+    assert [call['Limit'] for call in table.calls] == [10, 20, 40, 40]
+
+
+def test_decode_skips_items_decoded_to_none():
+    table = FakeTable(6)
+    paginator = QueryPaginator(table, {'TableName': 'IoT'},
+                               decode=lambda item: None if item['SK']['S'].endswith(('1', '3')) else item['SK']['S'])
+    assert paginator.all() == ['Event#0000', 'Event#0002', 'Event#0004', 'Event#0005']
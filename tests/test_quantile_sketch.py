@@ -0,0 +1,49 @@
+import random
+import statistics
+
+import pytest
+
+from utils.quantile_sketch import QuantileSketch
+
+
+def sketch_of(values, relative_accuracy=0.01):
+    sketch = QuantileSketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_median_within_relative_accuracy():
+    generator = random.Random(1)
+    values = [generator.lognormvariate(2, 1) for _ in range(5001)]
+    median = statistics.median(values)
+    assert abs(sketch_of(values).quantile(0.5) - median) <= 0.01 * median
+
+
+def test_merge_equals_sketch_of_all_values():
+    generator = random.Random(3)
+    left = [generator.uniform(-20, 40) for _ in range(1000)]
+    right = [generator.uniform(-20, 40) for _ in range(1000)] + [0.0]
+    merged = sketch_of(left)
+    merged.merge(sketch_of(right))
+    combined = sketch_of(left + right)
+    assert merged.counts == combined.counts
+    assert merged.count == 2001
+    for q in (0, 0.1, 0.5, 0.9, 1):
+        assert merged.quantile(q) == combined.quantile(q)
+
+
+def test_negative_and_zero_values_keep_their_order():
+    sketch = sketch_of([-5.0, -1.0, 0.0, 1.0, 5.0])
+    assert sketch.quantile(0) == pytest.approx(-5.0, rel=0.01)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1) == pytest.approx(5.0, rel=0.01)
+
+
+def test_empty_sketch_has_no_quantile():
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_sketches_of_different_accuracy_do_not_merge():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
@@ -0,0 +1,78 @@
+import copy
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+from backend import app as app_module
+from backend.models.SensorEvent import SensorEvent
+from backend.service import ServiceContainer as container_module
+from backend.service.SensorEventService import SensorEventService
+from test_sensor_event import SAMPLE_EVENT
+
+SENSOR_ID = SAMPLE_EVENT['sensorId']
+PATH = f'/sensors/{SENSOR_ID}/events'
+RANGE = {'from': '2023-12-21T00:00:00', 'to': '2023-12-22T00:00:00'}
+
+
+def event_entity(hour):
+    data = copy.deepcopy(SAMPLE_EVENT)
+    data['data']['timestamp'] = f'2023-12-21T{hour:02d}:00:00'
+    return SensorEvent(**data).to_entity()
+
+
+class FakeSensorIndex:
+    """Pages through the events of GSI_Events_By_Sensor like a Limit-ed DynamoDB query, or fails every call."""
+
+    def __init__(self, items, error=None):
+        self.items = items
+        self.error = error
+
+    def query(self, **params):
+        if self.error is not None:
+            raise self.error
+        start = 0
+        if 'ExclusiveStartKey' in params:
+            start = next(i for i, item in enumerate(self.items)
+                         if item['SK'] == params['ExclusiveStartKey']['SK']) + 1
+        page = self.items[start:start + params.get('Limit', len(self.items))]
+        response = {'Items': page, 'Count': len(page), 'ScannedCount': len(page)}
+        if start + len(page) < len(self.items):
+            last = page[-1]
+            response['LastEvaluatedKey'] = {'s_id': last['s_id'], 'SK': last['SK'], 'PK': last['PK']}
+        return response
+
+
+def install(monkeypatch, dynamodb):
+    container = container_module.ServiceContainer(dynamodb=dynamodb)
+    container._services['sensor_event'] = SensorEventService(dynamodb=dynamodb, sensor_service=object())
+    monkeypatch.setattr(container_module, '_container', container)
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_pages_resume_from_the_token(monkeypatch, client):
+    install(monkeypatch, FakeSensorIndex([event_entity(hour) for hour in range(3)]))
+    first = client.get(PATH, query_string={**RANGE, 'limit': 2}).get_json()
+    assert len(first['items']) == 2 and first['next_token']
+    second = client.get(PATH, query_string={**RANGE, 'limit': 2, 'token': first['next_token']}).get_json()
+    assert len(second['items']) == 1 and second['next_token'] is None
+
+
+@pytest.mark.parametrize('changed', [{'from': '2023-12-21T01:00:00'}, {'to': '2023-12-23T00:00:00'},
+                                     {'fields': 'data_point'}])
+def test_token_is_bound_to_the_query(monkeypatch, client, changed):
+    install(monkeypatch, FakeSensorIndex([event_entity(hour) for hour in range(3)]))
+    token = client.get(PATH, query_string={**RANGE, 'limit': 2}).get_json()['next_token']
+    response = client.get(PATH, query_string={**RANGE, 'limit': 2, 'token': token, **changed})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "Continuation token does not belong to this query"
+
+
+def test_failing_first_page_returns_an_error_status(monkeypatch, client):
+    install(monkeypatch, FakeSensorIndex([], EndpointConnectionError(endpoint_url='http://localhost:8000')))
+    response = client.get(PATH, query_string=RANGE)
+    assert response.status_code == 500
+    assert response.get_json()['error'] == 'Internal server error'
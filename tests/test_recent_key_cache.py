@@ -0,0 +1,46 @@
+from backend.service.RecentKeyCache import CLAIMED, COMMITTED, IN_FLIGHT, RecentKeyCache
+
+
+def test_duplicate_of_an_in_flight_key_is_a_conflict():
+    cache = RecentKeyCache()
+    assert cache.claim('a') == CLAIMED
+    assert cache.claim('a') == IN_FLIGHT
+    assert cache.stats()['in_flight_conflicts'] == 1
+
+
+def test_committed_key_suppresses_duplicates():
+    cache = RecentKeyCache()
+    cache.claim('a')
+    cache.commit('a')
+    assert cache.claim('a') == COMMITTED
+    assert cache.stats()['suppressed'] == 1
+
+
+def test_released_key_can_be_claimed_again():
+    cache = RecentKeyCache()
+    cache.claim('a')
+    cache.release('a')
+    assert 'a' not in cache
+    assert cache.claim('a') == CLAIMED
+    assert cache.stats()['released'] == 1
+
+
+def test_expired_key_is_claimed_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('backend.service.RecentKeyCache.time.monotonic', lambda: now[0])
+    cache = RecentKeyCache(ttl_s=10)
+    cache.claim('a')
+    cache.commit('a')
+    now[0] += 11
+    assert cache.claim('a') == CLAIMED
+    assert cache.stats()['expired'] == 1
+
+
+def test_least_recently_used_keys_are_evicted():
+    cache = RecentKeyCache(max_size=2)
+    for key in ('a', 'b', 'c'):
+        cache.claim(key)
+    assert len(cache) == 2
+    assert 'a' not in cache
+    assert cache.claim('a') == CLAIMED
+    assert cache.stats()['evicted'] == 2
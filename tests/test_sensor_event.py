@@ -0,0 +1,35 @@
+import copy
+
+import pytest
+
+from backend.models.SensorEvent import SensorEvent
+
+SAMPLE_EVENT = {
+    'sensorId': '32c3ecce-6589-445f-8f64-4d7422d4f1bf',
+    'metadata': {'location': '(46.629950494117644,28.13582094705882)', 'battery_level': 33,
+                 'parcel_id': 'Chickpeas#af8ed50d-68c4-4cf9-b04e-bba5432d4b8e'},
+    'data': {'dataType': 'SoilPH', 'dataPoint': 1, 'timestamp': '2023-12-21T16:00:00'}
+}
+
+
+@pytest.mark.parametrize('section, field, value', [
+    ('data', 'dataPoint', 'abc'),
+    ('data', 'dataPoint', float('nan')),
+    ('data', 'dataType', 'Pressure'),
+    ('metadata', 'battery_level', None),
+    ('metadata', 'battery_level', True),
+    ('metadata', 'parcel_id', None),
+    ('metadata', 'parcel_id', ''),
+])
+def test_malformed_event_is_rejected_at_parse_time(section, field, value):
+    event = copy.deepcopy(SAMPLE_EVENT)
+    event[section][field] = value
+    with pytest.raises(ValueError):
+        SensorEvent(**event)
+
+
+def test_valid_event_converts_to_an_entity():
+    entity = SensorEvent(**SAMPLE_EVENT).to_entity()
+    assert entity['data_point'] == {'N': '1'}
+    assert entity['battery_level'] == {'N': '33'}
+    assert entity['SK'] == {'S': 'Event#1703174400#32c3ecce-6589-445f-8f64-4d7422d4f1bf'}
@@ -0,0 +1,72 @@
+import json
+import os
+
+from backend.service.WriteBehindBuffer import WriteBehindBuffer
+
+
+def item(i):
+    return {'PK': {'S': 'SoilPH#1'}, 'SK': {'S': f'Event#{i}#s'}}
+
+
+class FlakyWriter:
+    """write_batch that fails the items whose SK is in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.written = []
+
+    def __call__(self, batch):
+        self.written += [entry for entry in batch if entry['SK']['S'] not in self.failing]
+        return ['Unprocessed after retries' if entry['SK']['S'] in self.failing else None for entry in batch]
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_retry_keeps_the_file_until_written_and_appends_letters_that_fail_again(tmp_path):
+    dead_letter_file = str(tmp_path / 'dead_letters.ndjson')
+    writer = FlakyWriter(failing={'Event#1#s', 'Event#2#s'})
+    buffer = WriteBehindBuffer(writer, dead_letter_file=dead_letter_file, workers=0)
+    buffer._flush([item(0), item(1), item(2)])
+    assert [entry['item'] for entry in read_lines(dead_letter_file)] == [item(1), item(2)]
+
+    writer.failing = {'Event#2#s'}
+    seen_during_retry = []
+    original_flush = buffer._flush
+
+    def flush(batch):
+        seen_during_retry.append(os.path.exists(buffer._retry_file))
+        return original_flush(batch)
+
+    buffer._flush = flush
+    assert buffer.retry_dead_letters() == {'retried': 2, 'written': 1, 'failed': 1}
+    assert seen_during_retry == [True]
+    assert not os.path.exists(buffer._retry_file)
+    assert [entry['item'] for entry in read_lines(dead_letter_file)] == [item(2)]
+    assert [entry['item'] for entry in buffer.dead_letters] == [item(2)]
+
+
+def test_letters_whose_append_failed_are_drained_with_the_file(tmp_path):
+    dead_letter_file = str(tmp_path / 'dead_letters.ndjson')
+    buffer = WriteBehindBuffer(FlakyWriter(failing={'Event#0#s', 'Event#1#s'}), dead_letter_file=dead_letter_file,
+                               workers=0)
+    buffer._flush([item(0)])
+    # Appending to a directory fails like a full or read-only disk would
+    buffer.dead_letter_file = str(tmp_path)
+    buffer._flush([item(1)])
+    assert buffer.stats()['dead_letter_write_errors'] == 1
+    buffer.dead_letter_file = dead_letter_file
+    assert [entry['item'] for entry in buffer.drain_dead_letters()] == [item(0), item(1)]
+
+
+def test_unfinished_retry_is_reloaded(tmp_path):
+    dead_letter_file = str(tmp_path / 'dead_letters.ndjson')
+    buffer = WriteBehindBuffer(FlakyWriter(failing={'Event#0#s'}), dead_letter_file=dead_letter_file, workers=0)
+    buffer._flush([item(0)])
+    buffer.drain_dead_letters()
+    reloaded = WriteBehindBuffer(FlakyWriter(), dead_letter_file=dead_letter_file, workers=0)
+    assert [entry['item'] for entry in reloaded.dead_letters] == [item(0)]
+    assert reloaded.retry_dead_letters() == {'retried': 1, 'written': 1, 'failed': 0}
+    assert not os.path.exists(reloaded._retry_file)
@@ -0,0 +1,126 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+from botocore.exceptions import ClientError, BotoCoreError, ParamValidationError
+
+# BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_WRITE_MAX_ITEMS = 25
+RETRYABLE_ERROR_CODES = {'ProvisionedThroughputExceededException', 'ThrottlingException',
+                         'RequestLimitExceeded', 'InternalServerError', 'ServiceUnavailable'}
+
+
+def chunk_items(items: List, size: int = BATCH_WRITE_MAX_ITEMS):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def item_key(item: Dict):
+    return item['PK']['S'], item['SK']['S']
+
+
+def backoff_delay(attempt, base_delay=0.05, max_delay=2.0):
+    # Exponential back-off with full jitter
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+# Outcome of rejected_chunk_errors: the pending items are written one by one to isolate the invalid ones
+SPLIT_CHUNK = object()
+
+
+def rejected_chunk_errors(error, pending: List[Dict]):
+    """
+    Decides what a BatchWriteItem request that raised `error` leads to: None if it should be retried,
+    SPLIT_CHUNK if one invalid item may have rejected the whole request, otherwise the error message per item key.
+    Shared by write_chunk and AsyncSensorEventService, only the I/O differs.
+    """
+    if isinstance(error, ClientError):
+        error_code = error.response['Error']['Code']
+        if error_code in RETRYABLE_ERROR_CODES:
+            return None
+        message = f"[{error_code}] {error.response['Error']['Message']}"
+    elif isinstance(error, ParamValidationError):
+        message = str(error)
+    else:
+        # Connection and other client-side errors are not caused by an item
+        return {item_key(request['PutRequest']['Item']): str(error) for request in pending}
+    if len(pending) > 1:
+        return SPLIT_CHUNK
+    return {item_key(request['PutRequest']['Item']): message for request in pending}
+
+
+def unprocessed_errors(pending: List[Dict]):
+    return {item_key(request['PutRequest']['Item']): 'Unprocessed after retries' for request in pending}
+
+
+def write_chunk(dynamodb, table_name, chunk: List[Dict], max_retries=5, base_delay=0.05):
+    """
+    Writes up to 25 items with BatchWriteItem and retries UnprocessedItems with back-off.
+    DynamoDB rejects the whole request for one invalid item, so after a non-retryable error the pending
+    items are written one by one and only the invalid ones fail.
+    Returns a dict mapping (PK, SK) of every item that could not be written to the error message.
+    """
+    pending = [{'PutRequest': {'Item': item}} for item in chunk]
+    attempt = 0
+    while pending:
+        try:
+            response = dynamodb.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get('UnprocessedItems', {}).get(table_name, [])
+        except (ClientError, BotoCoreError) as e:
+            errors = rejected_chunk_errors(e, pending)
+            if errors is SPLIT_CHUNK:
+                return write_items_one_by_one(dynamodb, table_name, pending, max_retries, base_delay)
+            if errors is not None:
+                return errors
+        if not pending:
+            break
+        if attempt >= max_retries:
+            return unprocessed_errors(pending)
+        time.sleep(backoff_delay(attempt, base_delay))
+        attempt += 1
+    return {}
+
+
+def write_items_one_by_one(dynamodb, table_name, requests: List[Dict], max_retries, base_delay):
+    # Fallback of write_chunk: isolates the items a rejected BatchWriteItem request failed on
+    errors = {}
+    for request in requests:
+        errors.update(write_chunk(dynamodb, table_name, [request['PutRequest']['Item']], max_retries, base_delay))
+    return errors
+
+
+def batch_write_items(dynamodb, table_name, items: List[Dict], max_workers=8, max_retries=5,
+                      executor: Optional[ThreadPoolExecutor] = None) -> List[Optional[str]]:
+    """
+    Writes items in 25-item BatchWriteItem chunks issued in parallel.
+    Returns a list aligned with `items`: None for written items, an error message otherwise.
+    Items must have unique (PK, SK) pairs, DynamoDB rejects a whole chunk containing duplicates.
+    """
+    if not items:
+        return []
+    chunks = chunk_items(items)
+
+    def write(chunk):
+        return write_chunk(dynamodb, table_name, chunk, max_retries)
+
+    if len(chunks) == 1:
+        chunk_errors = [write(chunks[0])]
+    elif executor is not None:
+        chunk_errors = list(executor.map(write, chunks))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            chunk_errors = list(pool.map(write, chunks))
+    errors = {}
+    for chunk_error in chunk_errors:
+        errors.update(chunk_error)
+    return item_errors(items, errors)
+
+
+def unique_items(items: List[Dict]) -> List[Dict]:
+    # Keeps the last item per (PK, SK), in the order the keys first appear
+    return list({item_key(item): item for item in items}.values())
+
+
+def item_errors(items: List[Dict], errors: Dict) -> List[Optional[str]]:
+    # Aligns errors keyed by (PK, SK) with `items`: None for written items
+    return [errors.get(item_key(item)) for item in items]
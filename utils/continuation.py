@@ -0,0 +1,37 @@
+import base64
+import binascii
+from typing import Callable, Dict, Iterable, Optional
+
+from utils import json_codec
+
+
+def encode_token(resume_state: Optional[Dict], scope: str) -> Optional[str]:
+    """
+    Opaque continuation token for a read endpoint: URL-safe base64 of the resume state (a LastEvaluatedKey or
+    the last sort key handed out) and the scope it belongs to, None when there is nothing left to read.
+    """
+    if not resume_state:
+        return None
+    return base64.urlsafe_b64encode(json_codec.dumps({'s': scope, 'k': resume_state})).decode('ascii').rstrip('=')
+
+
+def decode_token(token: Optional[str], scope: str, is_valid: Callable[[Dict], bool] = None) -> Optional[Dict]:
+    # Raises ValueError for malformed tokens, tokens issued for another scope and resume states is_valid rejects
+    if not token:
+        return None
+    try:
+        payload = json_codec.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid continuation token")
+    if not isinstance(payload, dict) or payload.get('s') != scope or not isinstance(payload.get('k'), dict):
+        raise ValueError("Continuation token does not belong to this query")
+    if is_valid is not None and not is_valid(payload['k']):
+        raise ValueError("Continuation token does not match this query")
+    return payload['k']
+
+
+def is_start_key(resume_state: Dict, attributes: Iterable[str]) -> bool:
+    # An ExclusiveStartKey of exactly these key attributes, each a string or number attribute value
+    return set(resume_state) == set(attributes) and all(
+        isinstance(value, dict) and len(value) == 1 and isinstance(value.get('S', value.get('N')), str)
+        for value in resume_state.values())
@@ -0,0 +1,209 @@
+import contextvars
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple, Any
+
+from utils.polygon_def import max_pool_connections, query_max_concurrency
+
+# Shared worker pool for fanning out DynamoDB calls (month partitions, write shards, per-sensor queries).
+# Sized like the shared client's connection pool, each fan-out additionally bounds its own in-flight tasks.
+# Tasks run in a copy of the caller's contextvars context, so per-request tracking follows them.
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def get_query_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix='dynamodb-query',
+                                               initializer=_mark_worker)
+    return _executor
+
+
+def _mark_worker():
+    _worker.active = True
+
+
+def in_query_worker() -> bool:
+    # Fan-outs started from a pool thread run inline, waiting on the same pool could exhaust it
+    return getattr(_worker, 'active', False)
+
+
+class _BoundedDispatcher:
+    """Submits tasks to the executor keeping at most `limit` of them in flight, in submission order."""
+
+    def __init__(self, executor: ThreadPoolExecutor, limit: int):
+        self.executor = executor
+        self.limit = max(1, limit)
+        self._pending = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = Future()
+        context = contextvars.copy_context()
+        with self._lock:
+            self._pending.append((future, context, fn, args))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._in_flight >= self.limit or not self._pending:
+                    return
+                task = self._pending.popleft()
+                self._in_flight += 1
+            self.executor.submit(self._run, *task)
+
+    def _run(self, future, context, fn, args):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(context.run(fn, *args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._dispatch()
+
+
+def bounded_map(fn: Callable, args_list: Sequence[Tuple], max_concurrency: int = None,
+                return_exceptions=False) -> List[Any]:
+    """
+    Calls fn(*args) for every tuple in args_list on the shared pool with bounded concurrency.
+    Returns results in input order; with return_exceptions=True failures are returned in place of results.
+    """
+    results = []
+    for _, future in iter_completed(fn, args_list, max_concurrency, ordered=True):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def iter_completed(fn: Callable, args_list: Sequence[Tuple], max_concurrency: int = None,
+                   ordered=False) -> Iterator[Tuple[int, Future]]:
+    """Yields (index, finished future) as tasks complete, or in input order with ordered=True."""
+    max_concurrency = max_concurrency or query_max_concurrency
+    if in_query_worker() or len(args_list) <= 1:
+        for index, args in enumerate(args_list):
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            yield index, future
+        return
+    dispatcher = _BoundedDispatcher(get_query_executor(), max_concurrency)
+    done = queue.Queue()
+    futures = []
+    for index, args in enumerate(args_list):
+        future = dispatcher.submit(fn, *args)
+        future.add_done_callback(lambda _, index=index: done.put(index))
+        futures.append(future)
+    if ordered:
+        for index, future in enumerate(futures):
+            future.exception()
+            yield index, future
+        return
+    for _ in futures:
+        index = done.get()
+        yield index, futures[index]
+
+
+_END = object()
+
+
+class PageStream:
+    """
+    Iterator over the pages of one partition, filled by a producer task on the shared pool.
+    Pages become available to the consumer as soon as they arrive. At most `max_pages` wait in the stream,
+    a producer ahead of its consumer blocks instead of buffering the partition. Closing the stream stops the
+    producer before its next query.
+    """
+
+    def __init__(self, max_pages=2):
+        self._pages = queue.Queue(maxsize=max(1, max_pages))
+        self._source = None
+        self.cancelled = threading.Event()
+
+    @classmethod
+    def inline(cls, pages: Iterable) -> 'PageStream':
+        # Stream that fetches its pages on the consumer's thread as they are read
+        stream = cls()
+        stream._source = pages
+        return stream
+
+    def _put(self, item) -> bool:
+        # Blocks while the stream is full, gives up once it is closed
+        while not self.cancelled.is_set():
+            try:
+                self._pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self, pages: Iterable):
+        iterator = iter(pages)
+        try:
+            # Every next() may query DynamoDB, a closed stream issues no further query
+            while not self.cancelled.is_set():
+                try:
+                    page = next(iterator)
+                except StopIteration:
+                    break
+                if not self._put(page):
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            self._put(_END)
+
+    def __iter__(self):
+        if self._source is not None:
+            for page in self._source:
+                if self.cancelled.is_set():
+                    return
+                yield page
+            return
+        while True:
+            page = self._pages.get()
+            if page is _END:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    def close(self):
+        self.cancelled.set()
+
+
+def stream_pages(fetch_pages: Callable[..., Iterable], args_list: Sequence[Tuple],
+                 max_concurrency: int = None, max_pages=2) -> List[PageStream]:
+    """
+    Starts fetch_pages(*args) (a generator of pages) for every tuple in args_list with bounded concurrency.
+    Returns one PageStream per tuple in input order; producers are started in that order as well,
+    so consuming the streams front to back never waits on a producer that cannot be scheduled.
+    Each stream buffers at most `max_pages` pages ahead of its consumer.
+    """
+    if in_query_worker():
+        return [PageStream.inline(fetch_pages(*args)) for args in args_list]
+    streams = [PageStream(max_pages) for _ in args_list]
+    dispatcher = _BoundedDispatcher(get_query_executor(), max_concurrency or query_max_concurrency)
+    for stream, args in zip(streams, args_list):
+        dispatcher.submit(lambda stream=stream, args=args: stream.produce(fetch_pages(*args)))
+    return streams
@@ -0,0 +1,21 @@
+import json
+from typing import Any
+
+# orjson is optional: it serializes event pages several times faster, the standard library is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    # Compact UTF-8 JSON, tuples are written as arrays
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
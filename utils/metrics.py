@@ -0,0 +1,344 @@
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Tuple
+
+from utils import tracking
+
+# In-process metrics rendered in the Prometheus text exposition format.
+# Every thread updates its own shard without locking, the lock is only taken when a thread
+# registers its shard, when a finished thread's shard is folded into the totals and on collection.
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    def __init__(self):
+        self.values = {}
+
+
+class _ShardOwner:
+    # Lives in the thread-local storage, its finalizer runs once the thread is gone
+    def __init__(self, shard):
+        self.shard = shard
+
+
+def _labels_key(labels: Dict) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _merge(totals, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = totals.get(key)
+            totals[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # Reentrant: a shard finalizer may run through garbage collection while the lock is held
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._shards = set()
+        self._retired = {}
+        self._metrics = {}
+        self._collectors: List[Callable] = []
+
+    def _shard(self) -> _Shard:
+        owner = getattr(self._local, 'owner', None)
+        if owner is None:
+            shard = _Shard()
+            owner = _ShardOwner(shard)
+            with self._lock:
+                self._shards.add(shard)
+            weakref.finalize(owner, self._retire, shard)
+            self._local.owner = owner
+        return owner.shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards.discard(shard)
+            _merge(self._retired, shard.values)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(self, name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help_text, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def register_collector(self, collector: Callable):
+        """
+        collector() is called on every scrape and returns a list of
+        (name, 'gauge' | 'counter', help, [(labels dict, value), ...]) for values owned by other components.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            totals = {}
+            _merge(totals, self._retired)
+            for shard in list(self._shards):
+                _merge(totals, shard.values.copy())
+            metrics = dict(self._metrics)
+            collectors = list(self._collectors)
+        return {'values': totals, 'metrics': metrics, 'collectors': collectors}
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        by_metric = {}
+        for (name, labels), value in snapshot['values'].items():
+            by_metric.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, metric in sorted(snapshot['metrics'].items()):
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(by_metric.get(name, [])):
+                lines.extend(metric.render_sample(labels, value))
+        for collector in snapshot['collectors']:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_labels_key(labels))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry: MetricsRegistry, name, help_text):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+
+    def inc(self, value=1, **labels):
+        values = self.registry._shard().values
+        key = (self.name, _labels_key(labels))
+        values[key] = values.get(key, 0) + value
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, registry: MetricsRegistry, name, help_text, buckets):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # Stored as [count per bucket..., count above the last bucket, sum]
+        values = self.registry._shard().values
+        key = (self.name, _labels_key(labels))
+        counts = values.get(key)
+        if counts is None:
+            counts = values[key] = [0] * (len(self.buckets) + 2)
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        counts[index] += 1
+        counts[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render_sample(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(labels, (('le', repr(float(bound))),))} {cumulative}")
+        cumulative += counts[len(self.buckets)]
+        lines.append(f"{self.name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(counts[-1]))}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+registry = MetricsRegistry()
+
+dynamodb_request_duration = registry.histogram(
+    'dynamodb_request_duration_seconds', 'DynamoDB API call latency including SDK retries, per operation')
+dynamodb_requests = registry.counter(
+    'dynamodb_requests_total', 'DynamoDB API calls per operation, table and index')
+dynamodb_errors = registry.counter(
+    'dynamodb_errors_total', 'DynamoDB API calls that failed after retries, per operation and error code')
+dynamodb_consumed_capacity = registry.counter(
+    'dynamodb_consumed_capacity_units_total', 'Consumed read/write capacity units per table and index')
+dynamodb_throttles = registry.counter(
+    'dynamodb_throttled_requests_total', 'Throttled DynamoDB attempts (each one is retried or fails)')
+dynamodb_retries = registry.counter(
+    'dynamodb_retries_total', 'SDK retry attempts per operation')
+dynamodb_pages = registry.counter(
+    'dynamodb_pages_total', 'Query/Scan pages per table and index, continuation=true for follow-up pages')
+dynamodb_items_returned = registry.counter(
+    'dynamodb_items_returned_total', 'Items returned by Query/Scan (Count)')
+dynamodb_items_scanned = registry.counter(
+    'dynamodb_items_scanned_total', 'Items evaluated by Query/Scan before filtering (ScannedCount)')
+dynamodb_unprocessed_items = registry.counter(
+    'dynamodb_unprocessed_items_total', 'Items handed back as UnprocessedItems by BatchWriteItem')
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency per endpoint, method and status')
+
+
+READ_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+CAPACITY_OPERATIONS = READ_OPERATIONS | {'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem',
+                                         'TransactWriteItems'}
+THROTTLING_ERROR_CODES = {'ProvisionedThroughputExceededException', 'ThrottlingException',
+                          'RequestLimitExceeded'}
+
+
+def _operation(event_name: str) -> str:
+    return event_name.rsplit('.', 1)[-1]
+
+
+def _request_capacity_by_index(params, context, event_name, **kwargs):
+    # Upgrades TOTAL (or no) capacity reporting to INDEXES so capacity can be attributed per table and GSI
+    operation = _operation(event_name)
+    if operation in CAPACITY_OPERATIONS and params.get('ReturnConsumedCapacity') in (None, 'TOTAL'):
+        params['ReturnConsumedCapacity'] = 'INDEXES'
+    context['metrics_table'] = params.get('TableName', '')
+    context['metrics_index'] = params.get('IndexName', '')
+    context['metrics_continuation'] = 'ExclusiveStartKey' in params
+
+
+def _start_timer(context, **kwargs):
+    context['metrics_start'] = time.perf_counter()
+
+
+def _record_consumed_capacity(operation, consumed) -> float:
+    # Returns the total units of the call
+    kind = 'read' if operation in READ_OPERATIONS else 'write'
+    total = 0.0
+    for entry in consumed if isinstance(consumed, list) else [consumed]:
+        table = entry.get('TableName', '')
+        if 'Table' in entry or 'GlobalSecondaryIndexes' in entry or 'LocalSecondaryIndexes' in entry:
+            table_units = entry.get('Table', {}).get('CapacityUnits', 0)
+            if table_units:
+                dynamodb_consumed_capacity.inc(table_units, table=table, index='', kind=kind)
+            for index_group in ('GlobalSecondaryIndexes', 'LocalSecondaryIndexes'):
+                for index_name, capacity in entry.get(index_group, {}).items():
+                    dynamodb_consumed_capacity.inc(capacity.get('CapacityUnits', 0), table=table,
+                                                   index=index_name, kind=kind)
+        elif entry.get('CapacityUnits'):
+            dynamodb_consumed_capacity.inc(entry['CapacityUnits'], table=table, index='', kind=kind)
+        total += entry.get('CapacityUnits', 0)
+    return total
+
+
+def _elapsed(context, operation) -> float:
+    start = context.get('metrics_start')
+    if start is None:
+        return 0.0
+    elapsed = time.perf_counter() - start
+    dynamodb_request_duration.observe(elapsed, operation=operation)
+    return elapsed
+
+
+def _record_response(parsed, context, event_name, **kwargs):
+    operation = _operation(event_name)
+    elapsed = _elapsed(context, operation)
+    table = context.get('metrics_table', '')
+    index = context.get('metrics_index', '')
+    dynamodb_requests.inc(operation=operation, table=table, index=index)
+    if 'Error' in parsed:
+        # Error responses go through after-call as well, the client raises right after
+        dynamodb_errors.inc(operation=operation, code=parsed['Error'].get('Code', 'Unknown'))
+        tracking.record_call(operation, table, index, elapsed, error=True)
+        return
+    retry_attempts = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retry_attempts:
+        dynamodb_retries.inc(retry_attempts, operation=operation)
+    units = 0.0
+    if 'ConsumedCapacity' in parsed:
+        units = _record_consumed_capacity(operation, parsed['ConsumedCapacity'])
+    is_read, page = operation in READ_OPERATIONS, operation in ('Query', 'Scan')
+    tracking.record_call(operation, table, index, elapsed, read_units=units if is_read else 0.0,
+                         write_units=0.0 if is_read else units, page=page,
+                         items=parsed.get('Count', 0) if page else 0,
+                         scanned=parsed.get('ScannedCount', 0) if page else 0)
+    if operation in ('Query', 'Scan'):
+        dynamodb_pages.inc(operation=operation, table=table, index=index,
+                           continuation=str(context.get('metrics_continuation', False)).lower())
+        dynamodb_items_returned.inc(parsed.get('Count', 0), operation=operation, table=table, index=index)
+        dynamodb_items_scanned.inc(parsed.get('ScannedCount', 0), operation=operation, table=table, index=index)
+    elif operation == 'BatchWriteItem':
+        unprocessed = sum(len(requests) for requests in parsed.get('UnprocessedItems', {}).values())
+        if unprocessed:
+            dynamodb_unprocessed_items.inc(unprocessed)
+
+
+def _record_error(exception, context, event_name, **kwargs):
+    operation = _operation(event_name)
+    elapsed = _elapsed(context, operation)
+    code = getattr(exception, 'response', {}).get('Error', {}).get('Code', type(exception).__name__)
+    dynamodb_errors.inc(operation=operation, code=code)
+    tracking.record_call(operation, context.get('metrics_table', ''), context.get('metrics_index', ''), elapsed,
+                         error=True)
+
+
+def _count_throttle(response, event_name, **kwargs):
+    # Runs for every attempt before the retry handler decides; must return None to leave retrying untouched
+    if response is not None:
+        code = response[1].get('Error', {}).get('Code')
+        if code in THROTTLING_ERROR_CODES:
+            dynamodb_throttles.inc(operation=_operation(event_name))
+    return None
+
+
+def instrument_client(dynamodb_client):
+    """Attaches the metric hooks to a botocore/aiobotocore DynamoDB client (or its resource)."""
+    meta = getattr(dynamodb_client, 'meta', None)
+    events = getattr(getattr(meta, 'client', None), 'meta', meta).events
+    events.register('provide-client-params.dynamodb', _request_capacity_by_index,
+                    unique_id='metrics-provide-client-params')
+    events.register('before-call.dynamodb', _start_timer, unique_id='metrics-before-call')
+    events.register('after-call.dynamodb', _record_response, unique_id='metrics-after-call')
+    events.register('after-call-error.dynamodb', _record_error, unique_id='metrics-after-call-error')
+    events.register_first('needs-retry.dynamodb', _count_throttle, unique_id='metrics-needs-retry')
+    return dynamodb_client
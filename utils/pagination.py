@@ -0,0 +1,116 @@
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Key attributes of the table and its GSIs, needed to build an ExclusiveStartKey from an item
+TABLE_KEY_ATTRIBUTES = ('PK', 'SK')
+INDEX_KEY_ATTRIBUTES = {
+    'GSI_Events_By_Sensor': ('s_id', 'SK'),
+    'GSI_AllSensorEvents_Parcel': ('parcel_id', 'SK'),
+    'GSI_Events_By_Parcel_Type': ('parcel_type', 'SK'),
+    'GSI_Sensor_By_Parcel': ('curr_parcelid', 'SK'),
+    'GSI_Active_Parcels': ('active', 'SK'),
+    'GSI_Users_Roles_Maintenance': ('GSI_PK', 'GSI_SK'),
+    'GSI_Geohash6_FullGeohash': ('hash_key', 'geohash'),
+}
+
+DEFAULT_INITIAL_PAGE_SIZE = 100
+
+
+def key_attributes(index_name: Optional[str] = None):
+    return TABLE_KEY_ATTRIBUTES + INDEX_KEY_ATTRIBUTES.get(index_name, ())
+
+
+class QueryPaginator:
+    """
+    Lazily pages a Query or Scan. Iterating yields decoded items, pages() yields decoded lists per page.
+    `decode` turns a wire item into a model, items it decodes to None are skipped.
+
+    max_items   stop after this many items (the last page's Limit is trimmed accordingly)
+    page_size   upper bound for the page Limit; pages start at initial_page_size and double up to it,
+                so the first results arrive quickly while long scans still use large pages.
+                None leaves Limit unset and lets DynamoDB fill 1 MB pages.
+    start_key   resume from a previously returned last_evaluated_key
+
+    After (partial) iteration, last_evaluated_key is the resume point right after the last item handed out,
+    or None once the result set is exhausted.
+    """
+
+    def __init__(self, dynamodb, params: Dict, operation='query', decode: Callable = None, max_items=None,
+                 page_size=None, initial_page_size=DEFAULT_INITIAL_PAGE_SIZE, start_key=None):
+        self.dynamodb = dynamodb
+        self.params = dict(params)
+        self.call = dynamodb.query if operation == 'query' else dynamodb.scan
+        self.decode = decode
+        self.max_items = max_items
+        self.page_size = page_size
+        self.initial_page_size = min(initial_page_size, page_size) if page_size else None
+        self.start_key = start_key
+        self.key_attributes = key_attributes(params.get('IndexName'))
+        self.consumed_capacity = 0
+        self.page_count = 0
+        self.item_count = 0
+        self._page_key = start_key
+        self._last_item = None
+        self._trimmed = False
+        self._exhausted = False
+
+    @property
+    def last_evaluated_key(self):
+        if self._last_item is not None:
+            return {name: self._last_item[name] for name in self.key_attributes if name in self._last_item}
+        return None if self._exhausted else self._page_key
+
+    def _next_limit(self):
+        limit = None
+        if self.page_size:
+            limit = min(self.page_size, self.initial_page_size * (2 ** self.page_count))
+        if self.max_items is not None:
+            remaining = self.max_items - self.item_count
+            limit = remaining if limit is None else min(limit, remaining)
+        return limit
+
+    def raw_pages(self) -> Iterator[List[Dict]]:
+        # Yields the undecoded item lists, trimmed to max_items
+        while not self._exhausted and (self.max_items is None or self.item_count < self.max_items):
+            params = dict(self.params)
+            limit = self._next_limit()
+            if limit is not None:
+                params['Limit'] = limit
+            if self._page_key:
+                params['ExclusiveStartKey'] = self._page_key
+            response = self.call(**params)
+            self.page_count += 1
+            self.consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+            items = response.get('Items', [])
+            self._trimmed = self.max_items is not None and len(items) > self.max_items - self.item_count
+            if self._trimmed:
+                items = items[:self.max_items - self.item_count]
+            self._page_key = response.get('LastEvaluatedKey')
+            self._exhausted = not self._page_key
+            self._last_item = None
+            if items:
+                self.item_count += len(items)
+                yield items
+
+    def pages(self) -> Iterator[List]:
+        for items in self.raw_pages():
+            # A page cut short by max_items resumes after its last handed-out item, otherwise after the page
+            self._last_item = items[-1] if self._trimmed else None
+            if self.decode:
+                items = [decoded for decoded in map(self.decode, items) if decoded is not None]
+            yield items
+
+    def __iter__(self) -> Iterator:
+        for items in self.raw_pages():
+            for item in items:
+                self._last_item = item
+                if not self.decode:
+                    yield item
+                    continue
+                decoded = self.decode(item)
+                if decoded is not None:
+                    yield decoded
+            if not self._trimmed:
+                self._last_item = None
+
+    def all(self) -> List:
+        return list(self)
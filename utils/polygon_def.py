@@ -1,9 +1,13 @@
 import os
+import threading
 
 import boto3
+from botocore.config import Config
 from shapely import Polygon, Point
 from geopy.distance import geodesic
 
+from utils.metrics import instrument_client
+
 coordinates = [
     (28.1250063, 46.6334964),
     (28.1334177, 46.6175812),
@@ -40,13 +44,103 @@ aws_access_key_id="fakeMyKeyId"
 aws_secret_access_key="fakeSecretAccessKey`"
 #print(f"Center: {center_point_field}, Radius: {radius} meters")
 hashKeyLength=6
-def create_dynamodb_client(resource=False):
+
+# Connection pool settings of the shared client, overridable through the environment
+max_pool_connections = int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', 50))
+connect_timeout = float(os.environ.get('DYNAMODB_CONNECT_TIMEOUT', 2))
+read_timeout = float(os.environ.get('DYNAMODB_READ_TIMEOUT', 10))
+tcp_keepalive = os.environ.get('DYNAMODB_TCP_KEEPALIVE', '1') == '1'
+max_retry_attempts = int(os.environ.get('DYNAMODB_MAX_RETRY_ATTEMPTS', 5))
+# The asyncio data layer multiplexes many more in-flight requests over one pool
+async_max_pool_connections = int(os.environ.get('DYNAMODB_ASYNC_MAX_POOL_CONNECTIONS', 500))
+keepalive_timeout = float(os.environ.get('DYNAMODB_KEEPALIVE_TIMEOUT', 30))
+# In-flight queries per fan-out (month partitions, shards, sensors) on the shared query pool
+query_max_concurrency = int(os.environ.get('DYNAMODB_QUERY_MAX_CONCURRENCY', 16))
+
+# Write shards per {dataType}#{first_of_month} event partition, 1 keeps the unsharded layout.
+# Readers query shards 0..N-1 plus the unsharded partition, so the count may be raised but never lowered.
+event_write_shards = int(os.environ.get('SENSOR_EVENT_WRITE_SHARDS', 1))
+# Idempotent ingest: event keys accepted within the TTL are dropped as retries, a cache size of 0 disables it
+event_dedup_cache_size = int(os.environ.get('SENSOR_EVENT_DEDUP_CACHE_SIZE', 100000))
+event_dedup_ttl_s = float(os.environ.get('SENSOR_EVENT_DEDUP_TTL_S', 900))
+# Backstop for keys the cache does not know (evicted, other processes): put_item only if the event is new
+event_conditional_writes = os.environ.get('SENSOR_EVENT_CONDITIONAL_WRITES', '0') == '1'
+# Type-filtered parcel event queries read GSI_Events_By_Parcel_Type instead of filtering GSI_AllSensorEvents_Parcel
+event_parcel_type_index = os.environ.get('SENSOR_EVENT_PARCEL_TYPE_INDEX', '1') == '1'
+# Latest events per sensor kept in memory for latest-N reads, 0 sensors disables the cache
+latest_events_capacity = int(os.environ.get('SENSOR_LATEST_EVENTS_CAPACITY', 32))
+latest_events_max_sensors = int(os.environ.get('SENSOR_LATEST_EVENTS_MAX_SENSORS', 10000))
+latest_events_max_age_s = float(os.environ.get('SENSOR_LATEST_EVENTS_MAX_AGE_S', 60))
+# Aggregate query results: closed days/months are cached until evicted, the current period for the TTL.
+# 0 entries disables the cache
+aggregate_cache_max_entries = int(os.environ.get('AGGREGATE_CACHE_MAX_ENTRIES', 10000))
+aggregate_cache_ttl_s = float(os.environ.get('AGGREGATE_CACHE_TTL_S', 60))
+# Incremental aggregation: written events are folded into per-day accumulators (count, sum, min, max and a
+# quantile sketch with the given relative accuracy for the median), flushed every flush_s seconds with
+# UpdateItem ADD; aggregate queries fall back to them for periods the worker has not aggregated yet
+incremental_aggregates = os.environ.get('INCREMENTAL_AGGREGATES', '0') == '1'
+incremental_aggregates_flush_s = float(os.environ.get('INCREMENTAL_AGGREGATES_FLUSH_S', 2))
+incremental_aggregates_accuracy = float(os.environ.get('INCREMENTAL_AGGREGATES_ACCURACY', 0.01))
+# Cost-based choice of the access path for parcel event queries, event counts are sampled in windows of
+# sample_s seconds spread over the requested range
+event_query_planner = os.environ.get('SENSOR_EVENT_QUERY_PLANNER', '1') == '1'
+event_planner_sample_s = int(os.environ.get('SENSOR_EVENT_PLANNER_SAMPLE_S', 3600))
+event_planner_stats_ttl_s = float(os.environ.get('SENSOR_EVENT_PLANNER_STATS_TTL_S', 3600))
+# Hard cap on the uncached COUNT queries one plan may issue, candidates that cannot be sampled within it are skipped
+event_planner_max_sample_queries = int(os.environ.get('SENSOR_EVENT_PLANNER_MAX_SAMPLE_QUERIES', 24))
+# Maps of sensor query results are only rendered when a call passes render_map=True,
+# then on a background thread unless SENSOR_MAP_RENDER_BACKGROUND=0
+sensor_map_render_background = os.environ.get('SENSOR_MAP_RENDER_BACKGROUND', '1') == '1'
+# Active parcel spatial index: reloaded after this many seconds, or right away when a parcel is added or retired
+parcel_index_ttl_s = float(os.environ.get('PARCEL_INDEX_TTL_S', 300))
+# In-process index of sensor locations for radius/rectangle/polygon queries, DynamoDB is used while it is stale
+sensor_geo_index_enabled = os.environ.get('SENSOR_GEO_INDEX', '0') == '1'
+sensor_geo_index_max_age_s = float(os.environ.get('SENSOR_GEO_INDEX_MAX_AGE_S', 300))
+# One summary line (calls, pages, RCU/WCU, latency) per outermost tracked operation, see utils/tracking.py
+operation_summary_log = os.environ.get('DYNAMODB_OPERATION_SUMMARY_LOG', '1') == '1'
+
+
+def create_client_config(pool_size=None, connect_timeout_s=None, read_timeout_s=None, keepalive=None):
+    return Config(max_pool_connections=pool_size or max_pool_connections,
+                  connect_timeout=connect_timeout_s or connect_timeout,
+                  read_timeout=read_timeout_s or read_timeout,
+                  tcp_keepalive=tcp_keepalive if keepalive is None else keepalive,
+                  retries={'max_attempts': max_retry_attempts, 'mode': 'standard'})
+
+
+def create_dynamodb_client(resource=False, config=None):
     if not resource:
         return boto3.client(client, region_name=region_name, endpoint_url=endpoint_url,
-                                     aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
+                                     aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key,
+                                     config=config)
     else:
         return boto3.resource(client, region_name=region_name, endpoint_url=endpoint_url,
-                                     aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
+                                     aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key,
+                                     config=config)
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_dynamodb_client(resource=False):
+    """
+    Returns the process-wide DynamoDB client (or resource) backed by one pooled keep-alive connection pool.
+    boto3 clients are thread-safe once created, creation itself is guarded since the default session is not.
+    """
+    shared_client = _shared_clients.get(resource)
+    if shared_client is None:
+        with _shared_clients_lock:
+            shared_client = _shared_clients.get(resource)
+            if shared_client is None:
+                session = boto3.session.Session()
+                factory = session.resource if resource else session.client
+                shared_client = factory(client, region_name=region_name, endpoint_url=endpoint_url,
+                                        aws_access_key_id=aws_access_key_id,
+                                        aws_secret_access_key=aws_secret_access_key,
+                                        config=create_client_config())
+                _shared_clients[resource] = instrument_client(shared_client)
+    return shared_client
 
 def get_project_path():
     current_script_path = os.path.abspath(__file__)
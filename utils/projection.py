@@ -0,0 +1,20 @@
+from typing import Dict, Iterable, Optional
+
+from utils.pagination import key_attributes
+
+
+def with_projection(params: Dict, fields: Optional[Iterable[str]]) -> Dict:
+    """
+    Returns a copy of the request params reading only `fields` plus the table (and index) key attributes,
+    which pagination and shard merging rely on. Attribute names go through #placeholders so reserved
+    words are safe. fields=None leaves the params untouched, i.e. all attributes are returned.
+    """
+    if fields is None:
+        return params
+    attributes = dict.fromkeys((*key_attributes(params.get('IndexName')), *fields))
+    names = dict(params.get('ExpressionAttributeNames', {}))
+    placeholders = []
+    for i, attribute in enumerate(attributes):
+        names[f"#p{i}"] = attribute
+        placeholders.append(f"#p{i}")
+    return dict(params, ProjectionExpression=", ".join(placeholders), ExpressionAttributeNames=names)
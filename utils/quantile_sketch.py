@@ -0,0 +1,68 @@
+import math
+from typing import Dict
+
+# Mergeable quantile sketch with a relative error guarantee (DDSketch-style logarithmic buckets).
+# A value x > 0 is counted in bucket ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a), every value in a bucket
+# is within relative error `a` of the bucket's representative. Negative values use mirrored buckets, values
+# smaller than `min_value` in magnitude are counted as zero.
+# Sketches with the same accuracy merge by adding bucket counts, so DynamoDB ADD can maintain one.
+
+ZERO_BUCKET = 'z'
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        # Bucket key ('p<index>', 'n<index>' or 'z') -> count
+        self.counts: Dict[str, int] = {}
+
+    def bucket(self, value: float) -> str:
+        if abs(value) < self.min_value:
+            return ZERO_BUCKET
+        index = math.ceil(math.log(abs(value)) / self._log_gamma)
+        return f"{'p' if value > 0 else 'n'}{index}"
+
+    def value_of(self, bucket: str) -> float:
+        # Representative of the bucket, within the relative error of every value counted in it
+        if bucket == ZERO_BUCKET:
+            return 0.0
+        magnitude = 2 * self.gamma ** int(bucket[1:]) / (self.gamma + 1)
+        return magnitude if bucket[0] == 'p' else -magnitude
+
+    def add(self, value: float, count=1):
+        bucket = self.bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def _sort_key(self, bucket):
+        if bucket == ZERO_BUCKET:
+            return 0, 0
+        index = int(bucket[1:])
+        return (1, index) if bucket[0] == 'p' else (-1, -index)
+
+    def quantile(self, q: float):
+        # Value at rank q * (count - 1) in ascending order, None for an empty sketch
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for bucket in sorted(self.counts, key=self._sort_key):
+            seen += self.counts[bucket]
+            if seen > rank:
+                return self.value_of(bucket)
+        return self.value_of(max(self.counts, key=self._sort_key))
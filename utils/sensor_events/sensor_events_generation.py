@@ -1,6 +1,5 @@
 import random
-import time
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timedelta
 from decimal import Decimal, getcontext, ROUND_HALF_UP
 
 import pandas as pd
@@ -8,6 +7,8 @@ import simplejson as json
 
 from dynamodbgeo import S2Manager, GeoPoint
 from utils.polygon_def import hashKeyLength, get_project_path
+from utils.sensor_events import time_utils
+from utils.sensor_events.sharding import event_partition_key, parcel_type_key
 from utils.sensors.sensors_from_csv import json_to_array
 
 # Script for generation of the mock data and timestamps
@@ -146,9 +147,7 @@ def get_start_of_month(timestamp_str):
     start_of_month = timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     return start_of_month.strftime("%Y-%m-%dT%H:%M:%S")
 def convert_to_unix_epoch(timestamp_str):
-    dt = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S")
-    unix_epoch = int(time.mktime(dt.timetuple()))
-    return unix_epoch
+    return time_utils.to_epoch(timestamp_str)
 
 def random_date_string():
     start_date = datetime(2020, 1, 1)
@@ -159,14 +158,11 @@ def random_date_string():
     return random_date_with_sec.strftime('%Y-%m-%dT%H:%M:%S')
 
 def get_first_of_month_as_unix_timestamp(timestamp_str):
-    return convert_to_unix_epoch(get_start_of_month(timestamp_str))
+    return time_utils.month_start_of_iso(timestamp_str)
 
 def unix_to_iso(unix_timestamp):
-    offset = time.timezone if (time.localtime().tm_isdst == 0) else time.altzone
-    local_tz = timezone(timedelta(seconds=-offset))
-    timestamp_datetime = datetime.fromtimestamp(unix_timestamp, tz=local_tz)
-    iso_timestamp = timestamp_datetime.isoformat()
-    return iso_timestamp
+    # Local time with the UTC offset in effect at that instant (not the current one)
+    return time_utils.epoch_to_iso(unix_timestamp, with_offset=True)
 
 def process_events_for_db():
     # Read generated json and process for batch writes
@@ -187,13 +183,14 @@ def process_events_for_db():
             event['sensorId']
         )
         sensor_event = {
-            'PK': f"{event['data']['dataType']}#{start_of_month}",#f"Event#{event['sensorId']}",
+            'PK': event_partition_key(event['data']['dataType'], start_of_month, event['sensorId']),#f"Event#{event['sensorId']}",
             'SK': sk_formated,
             #'type_month': f"{event['data']['dataType']}#{start_of_month}",
             's_id': f"Event#{event['sensorId']}",
             'data_point': event['data']['dataPoint'],
             'geoJson': geoJson,
             'parcel_id': event['metadata']['parcel_id'],
+            'parcel_type': parcel_type_key(event['metadata']['parcel_id'], event['data']['dataType']),
             'battery_level': event['metadata']['batteryLevel'],
             #'status': event['metadata']['status'],
             'data_type': event['data']['dataType']
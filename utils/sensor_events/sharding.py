@@ -0,0 +1,49 @@
+import heapq
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+from utils.polygon_def import event_write_shards
+
+# Event partitions are written as {dataType}#{first_of_month}#{shard} once sharding is enabled.
+# The shard is derived from the sensor id, so the events of one sensor stay in one partition per month.
+
+
+def shard_of(sensor_id: str, shards: int = None) -> int:
+    shards = shards or event_write_shards
+    return zlib.crc32(sensor_id.encode('utf-8')) % shards
+
+
+def event_partition_key(data_type: str, first_of_month, sensor_id: str, shards: int = None) -> str:
+    shards = shards or event_write_shards
+    base_key = f"{data_type}#{first_of_month}"
+    if shards <= 1:
+        return base_key
+    return f"{base_key}#{shard_of(sensor_id, shards)}"
+
+
+def event_partition_keys(data_type: str, first_of_month, shards: int = None) -> List[str]:
+    # Every partition a reader has to query for one data type and month
+    shards = shards or event_write_shards
+    base_key = f"{data_type}#{first_of_month}"
+    if shards <= 1:
+        return [base_key]
+    return [base_key] + [f"{base_key}#{shard}" for shard in range(shards)]
+
+
+def parcel_type_key(parcel_id: str, data_type: str) -> str:
+    # Partition key of GSI_Events_By_Parcel_Type: the events of one data type within one parcel
+    return f"{parcel_id}#{data_type}"
+
+
+def base_partition_key(partition_key: str) -> str:
+    # Temperature#1583017200#3 -> Temperature#1583017200, aggregates are stored on the unsharded key
+    return '#'.join(partition_key.split('#', 2)[:2])
+
+
+def iter_merge_by_sort_key(shard_items: Iterable[Iterable[Dict]]) -> Iterator[Dict]:
+    # Each shard is returned in SK order, a k-way merge restores the order of a single partition
+    return heapq.merge(*shard_items, key=lambda item: item['SK']['S'])
+
+
+def merge_by_sort_key(shard_items: Iterable[Iterable[Dict]]) -> List[Dict]:
+    return list(iter_merge_by_sort_key(shard_items))
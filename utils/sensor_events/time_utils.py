@@ -0,0 +1,201 @@
+import calendar
+import time
+from datetime import datetime, tzinfo
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# Timestamps are stored as Unix epochs in DynamoDB. Naive ISO strings are wall-clock time of `tz`,
+# which defaults to the process' local timezone (the convention used since the first data generation).
+# Pass a tzinfo (e.g. zoneinfo.ZoneInfo('UTC')) to interpret or render wall-clock time in another zone.
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _parse_offset(offset_str: str) -> int:
+    # '+HH:MM', '+HHMM', '+HH' or 'Z' -> seconds east of UTC
+    if offset_str == 'Z':
+        return 0
+    sign = -1 if offset_str[0] == '-' else 1
+    digits = offset_str[1:].replace(':', '')
+    hours = int(digits[:2])
+    minutes = int(digits[2:4]) if len(digits) >= 4 else 0
+    return sign * (hours * 3600 + minutes * 60)
+
+
+def parse_iso(timestamp: str) -> Tuple[int, int, int, int, int, int, Optional[int]]:
+    """
+    Fast parser for strict ISO-8601 timestamps 'YYYY-MM-DDTHH:MM:SS[.ffffff][Z|±HH:MM]'.
+    Returns (year, month, day, hour, minute, second, utc_offset_seconds or None for naive input).
+    Fractional seconds are truncated. Raises ValueError for anything else.
+    """
+    if len(timestamp) < 19 or timestamp[4] != '-' or timestamp[7] != '-' or timestamp[10] not in 'T ' \
+            or timestamp[13] != ':' or timestamp[16] != ':':
+        raise ValueError(f"Not a strict ISO-8601 timestamp: {timestamp!r}")
+    try:
+        fields = (int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                  int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+    except ValueError:
+        raise ValueError(f"Not a strict ISO-8601 timestamp: {timestamp!r}")
+    rest = timestamp[19:]
+    if rest.startswith('.'):
+        end = 1
+        while end < len(rest) and rest[end].isdigit():
+            end += 1
+        rest = rest[end:]
+    offset = None
+    if rest:
+        if rest[0] not in 'Z+-':
+            raise ValueError(f"Not a strict ISO-8601 timestamp: {timestamp!r}")
+        offset = _parse_offset(rest)
+    year, month, day, hour, minute, second = fields
+    if not (1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]
+            and hour < 24 and minute < 60 and second < 60):
+        raise ValueError(f"Timestamp out of range: {timestamp!r}")
+    return year, month, day, hour, minute, second, offset
+
+
+@lru_cache(maxsize=65536)
+def _local_offset(year, month, day, hour) -> int:
+    # UTC offset of local wall-clock time; DST changes on hour boundaries, so one mktime call per hour suffices
+    wall = (year, month, day, hour, 0, 0, 0, 0, -1)
+    return calendar.timegm(wall) - int(time.mktime(wall))
+
+
+def utc_offset(year, month, day, hour, tz: Optional[tzinfo] = None) -> int:
+    if tz is None:
+        return _local_offset(year, month, day, hour)
+    return int(datetime(year, month, day, hour, tzinfo=tz).utcoffset().total_seconds())
+
+
+def wall_to_epoch(year, month, day, hour=0, minute=0, second=0, tz: Optional[tzinfo] = None) -> int:
+    naive = calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+    return naive - utc_offset(year, month, day, hour, tz)
+
+
+def to_epoch(timestamp, tz: Optional[tzinfo] = None) -> int:
+    """ISO string or datetime -> Unix epoch. Explicit offsets in the input take precedence over `tz`."""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is not None:
+            return int(timestamp.timestamp())
+        return wall_to_epoch(timestamp.year, timestamp.month, timestamp.day,
+                             timestamp.hour, timestamp.minute, timestamp.second, tz)
+    year, month, day, hour, minute, second, offset = parse_iso(timestamp)
+    if offset is not None:
+        return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)) - offset
+    return wall_to_epoch(year, month, day, hour, minute, second, tz)
+
+
+def epoch_to_wall(epoch: int, tz: Optional[tzinfo] = None) -> Tuple[int, int, int, int, int, int, int]:
+    # Returns (year, month, day, hour, minute, second, utc_offset_seconds)
+    if tz is None:
+        t = time.localtime(epoch)
+        return t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_gmtoff
+    dt = datetime.fromtimestamp(epoch, tz)
+    return dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, int(dt.utcoffset().total_seconds())
+
+
+def _format_offset(offset: int) -> str:
+    sign = '-' if offset < 0 else '+'
+    offset = abs(offset)
+    return f"{sign}{offset // 3600:02d}:{(offset % 3600) // 60:02d}"
+
+
+def epoch_to_iso(epoch: int, tz: Optional[tzinfo] = None, with_offset=False) -> str:
+    year, month, day, hour, minute, second, offset = epoch_to_wall(epoch, tz)
+    iso = f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}"
+    return iso + _format_offset(offset) if with_offset else iso
+
+
+@lru_cache(maxsize=4096)
+def _month_start_epoch(year, month, tz) -> int:
+    return wall_to_epoch(year, month, 1, tz=tz)
+
+
+def month_start_epoch(year, month, tz: Optional[tzinfo] = None) -> int:
+    """Epoch of midnight on the first day of the month, memoized per (year, month, tz)."""
+    return _month_start_epoch(year, month, tz)
+
+
+def month_start_of_epoch(epoch: int, tz: Optional[tzinfo] = None) -> int:
+    year, month = epoch_to_wall(epoch, tz)[:2]
+    return _month_start_epoch(year, month, tz)
+
+
+def month_start_of_iso(timestamp: str, tz: Optional[tzinfo] = None) -> int:
+    year, month, day, hour, minute, second, offset = parse_iso(timestamp)
+    if offset is not None:
+        return month_start_of_epoch(to_epoch(timestamp), tz)
+    return _month_start_epoch(year, month, tz)
+
+
+# Vectorized conversions for lists of timestamps
+
+def _offsets_for_naive_hours(naive_hours: np.ndarray, tz: Optional[tzinfo]) -> np.ndarray:
+    unique_hours, inverse = np.unique(naive_hours, return_inverse=True)
+    offsets = np.empty(len(unique_hours), dtype=np.int64)
+    for i, hour in enumerate(unique_hours.tolist()):
+        t = time.gmtime(hour * 3600)
+        offsets[i] = utc_offset(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, tz)
+    return offsets[inverse]
+
+
+def _offsets_for_epochs(epochs: np.ndarray, tz: Optional[tzinfo]) -> np.ndarray:
+    unique_hours, inverse = np.unique(epochs // 3600, return_inverse=True)
+    offsets = np.fromiter((epoch_to_wall(hour * 3600, tz)[6] for hour in unique_hours.tolist()),
+                          dtype=np.int64, count=len(unique_hours))
+    return offsets[inverse]
+
+
+def to_epoch_array(timestamps: Sequence[str], tz: Optional[tzinfo] = None) -> np.ndarray:
+    """Naive ISO strings -> int64 epochs. UTC offsets are resolved once per distinct hour."""
+    naive = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+    if len(naive) == 0:
+        return naive
+    return naive - _offsets_for_naive_hours(naive // 3600, tz)
+
+
+def epoch_array_to_wall(epochs: np.ndarray, tz: Optional[tzinfo] = None) -> np.ndarray:
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if len(epochs) == 0:
+        return epochs.astype('datetime64[s]')
+    return (epochs + _offsets_for_epochs(epochs, tz)).astype('datetime64[s]')
+
+
+def epoch_array_to_iso(epochs: np.ndarray, tz: Optional[tzinfo] = None) -> np.ndarray:
+    """int64 epochs -> naive wall-clock ISO strings ('YYYY-MM-DDTHH:MM:SS')."""
+    return np.datetime_as_string(epoch_array_to_wall(epochs, tz), unit='s')
+
+
+def month_start_epoch_array(epochs: np.ndarray, tz: Optional[tzinfo] = None) -> np.ndarray:
+    months = epoch_array_to_wall(epochs, tz).astype('datetime64[M]')
+    unique_months, inverse = np.unique(months, return_inverse=True)
+    starts = np.fromiter((month_start_epoch(int(str(m)[:4]), int(str(m)[5:7]), tz) for m in unique_months),
+                         dtype=np.int64, count=len(unique_months))
+    return starts[inverse]
+
+
+def normalize_timestamp(timestamp, tz: Optional[tzinfo] = None) -> Tuple[int, str]:
+    """
+    Parses an incoming event timestamp once. Returns (epoch, naive wall-clock ISO string in `tz`).
+    Strict ISO strings take the fast path; anything else falls back to dateutil's lenient parser.
+    """
+    if isinstance(timestamp, str):
+        try:
+            year, month, day, hour, minute, second, offset = parse_iso(timestamp)
+        except ValueError:
+            from dateutil import parser
+            timestamp = parser.parse(timestamp)
+        else:
+            if offset is None:
+                return (wall_to_epoch(year, month, day, hour, minute, second, tz),
+                        f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}")
+            epoch = calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)) - offset
+            return epoch, epoch_to_iso(epoch, tz)
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            return to_epoch(timestamp, tz), timestamp.strftime(ISO_FORMAT)
+        epoch = int(timestamp.timestamp())
+        return epoch, epoch_to_iso(epoch, tz)
+    raise ValueError(f"Unsupported timestamp: {timestamp!r}")
@@ -71,32 +71,38 @@ def parse_sensor_data(sensor_data):
     parsed_data = []
 
     for item in sensor_data:
-        #print(item)
-        sensor_id = item.get('PK', {}).get('S', None)
-        sensor_sk = item.get('SK', {}).get('S', None)
-        sensor_type = item.get('sensor_type', {}).get('S') or item.get('sensortype', {}).get('S')
-        geoJson_str = item.get('geoJson', {}).get('S', None)
-        parcel_id = item.get('curr_parcelid') or item.get('id_parcel')
-
-        if sensor_id and geoJson_str and sensor_type:
-            # split the string by comma to get the coordinates
-            coords = geoJson_str.split(",")
-            if len(coords) == 2:
-                try:
-                    # strings to float
-                    latitude, longitude = float(coords[0]), float(coords[1])
-
-                    parsed_data.append({
-                        'sensor_id': sensor_id,
-                        'sensor_type': sensor_type,  # Including sensor type
-                        'point_coordinates': [longitude,latitude],
-                        'parcel_id': parcel_id
-                    })
-                except ValueError:
-                    print("Invalid coordinates:", coords)
+        parsed_item = parse_sensor_item(item)
+        if parsed_item is not None:
+            parsed_data.append(parsed_item)
 
     return parsed_data
 
+# Parses one sensor payload, None if it lacks id, type or a valid location
+def parse_sensor_item(item):
+    #print(item)
+    sensor_id = item.get('PK', {}).get('S', None)
+    sensor_type = item.get('sensor_type', {}).get('S') or item.get('sensortype', {}).get('S')
+    geoJson_str = item.get('geoJson', {}).get('S', None)
+    parcel_id = item.get('curr_parcelid') or item.get('id_parcel')
+
+    if sensor_id and geoJson_str and sensor_type:
+        # split the string by comma to get the coordinates
+        coords = geoJson_str.split(",")
+        if len(coords) == 2:
+            try:
+                # strings to float
+                latitude, longitude = float(coords[0]), float(coords[1])
+
+                return {
+                    'sensor_id': sensor_id,
+                    'sensor_type': sensor_type,  # Including sensor type
+                    'point_coordinates': [longitude,latitude],
+                    'parcel_id': parcel_id
+                }
+            except ValueError:
+                print("Invalid coordinates:", coords)
+    return None
+
 def visualize_results_in_rectangle(subpolygon, sensors, color='green',fill_color='red',fill_opacity=0.2):
     map_object = add_sensor_markers_to_map(sensors)
     exterior_coords = subpolygon.exterior.coords
@@ -0,0 +1,147 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from utils import polygon_def
+
+# Request-scoped DynamoDB accounting. `track(name)` opens a unit of work; every DynamoDB call made while it
+# is open (the metric hooks in utils.metrics report them) is added to it: calls, pages, items, consumed
+# capacity, latency and errors, per operation and table/index. Units of work nest, a finished one is folded
+# into the enclosing one. The tracker lives in a contextvar, so fan_out tasks and asyncio tasks started
+# inside the unit of work report to it as well.
+
+_current: contextvars.ContextVar = contextvars.ContextVar('dynamodb_operation', default=None)
+
+
+def _new_totals():
+    return {'calls': 0, 'pages': 0, 'items': 0, 'scanned': 0, 'read_units': 0.0, 'write_units': 0.0,
+            'errors': 0, 'seconds': 0.0}
+
+
+def _add_totals(totals, values):
+    for key, value in values.items():
+        totals[key] += value
+
+
+class OperationTracker:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._totals = _new_totals()
+        # (operation, table, index) -> totals
+        self._calls: Dict[tuple, Dict] = {}
+        self._children: Dict[str, int] = {}
+
+    def record(self, operation, table, index, seconds, read_units=0.0, write_units=0.0, page=False, items=0,
+               scanned=0, error=False):
+        values = {'calls': 1, 'pages': int(page), 'items': items, 'scanned': scanned, 'read_units': read_units,
+                  'write_units': write_units, 'errors': int(error), 'seconds': seconds}
+        with self._lock:
+            _add_totals(self._totals, values)
+            _add_totals(self._calls.setdefault((operation, table, index), _new_totals()), values)
+
+    def merge(self, child: 'OperationTracker'):
+        with child._lock:
+            totals, calls = dict(child._totals), {key: dict(values) for key, values in child._calls.items()}
+        with self._lock:
+            _add_totals(self._totals, totals)
+            for key, values in calls.items():
+                _add_totals(self._calls.setdefault(key, _new_totals()), values)
+            self._children[child.name] = self._children.get(child.name, 0) + 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> Dict:
+        # JSON-serializable totals of the unit of work so far
+        with self._lock:
+            totals = dict(self._totals)
+            calls = sorted(self._calls.items())
+            children = dict(self._children)
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            'operation': self.name,
+            'duration_ms': round((end - self.started) * 1000, 3),
+            **{key: value for key, value in totals.items() if key != 'seconds'},
+            'dynamodb_ms': round(totals['seconds'] * 1000, 3),
+            'by_call': [{'operation': operation, 'table': table, 'index': index or None,
+                         **{key: value for key, value in values.items() if key != 'seconds'},
+                         'dynamodb_ms': round(values['seconds'] * 1000, 3)}
+                        for (operation, table, index), values in calls],
+            'nested': children
+        }
+
+    def log_line(self) -> str:
+        summary = self.summary()
+        return (f"{summary['operation']}: {summary['calls']} DynamoDB calls, {summary['pages']} pages, "
+                f"{summary['items']} items, {summary['read_units']:g} RCU, {summary['write_units']:g} WCU, "
+                f"{summary['errors']} errors, {summary['dynamodb_ms']:.1f} ms in DynamoDB of "
+                f"{summary['duration_ms']:.1f} ms")
+
+
+def current() -> Optional[OperationTracker]:
+    return _current.get()
+
+
+def start(name):
+    # For callers that cannot use a with block (request hooks): returns (tracker, token) for finish()
+    tracker = OperationTracker(name)
+    return tracker, _current.set(tracker)
+
+
+def finish(tracker: OperationTracker, token):
+    tracker.finish()
+    _current.reset(token)
+    parent = _current.get()
+    if parent is not None:
+        parent.merge(tracker)
+
+
+@contextmanager
+def track(name, log=None):
+    """
+    Accounts the DynamoDB calls made inside the block to a new unit of work and yields its tracker.
+    The summary line is printed when an outermost unit of work that called DynamoDB ends (log=None),
+    or as given by `log`.
+    """
+    outermost = _current.get() is None
+    tracker, token = start(name)
+    try:
+        yield tracker
+    finally:
+        finish(tracker, token)
+        # Units of work answered without DynamoDB (cache hits) are not logged
+        if tracker.summary()['calls'] and ((outermost and polygon_def.operation_summary_log) if log is None else log):
+            print(tracker.log_line())
+
+
+def tracked(name=None):
+    # Decorator form of track(), for functions and coroutine functions
+    def decorate(fn):
+        operation = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with track(operation):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with track(operation):
+                return fn(*args, **kwargs)
+        return run
+    return decorate
+
+
+def record_call(operation, table, index, seconds, read_units=0.0, write_units=0.0, page=False, items=0,
+                scanned=0, error=False):
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(operation, table, index, seconds, read_units, write_units, page, items, scanned, error)